@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -14,6 +13,14 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# python-jose pulls in the cryptography package, so it is imported on first
+# use rather than with this module; main.warm_up loads it before the worker
+# reports ready.
+def warm_up_crypto():
+    """Import and exercise the JWT stack once."""
+    from jose import jwt
+    jwt.decode(create_access_token({"sub": "warm-up"}), SECRET_KEY, algorithms=[ALGORITHM])
+
 def verify_password(plain_password, hashed_password):
     """
     Verify a plaintext password against a bcrypt hash.
@@ -45,6 +52,7 @@ def get_password_hash(password):
     return hashed.decode('utf-8')
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -55,6 +63,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    from jose import JWTError, jwt
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
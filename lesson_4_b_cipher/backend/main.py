@@ -1,25 +1,55 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, configure_mappers
 from typing import List
 from datetime import timedelta
+import os
 
 import models
 import schemas
-from database import engine, get_db
+from database import engine, SessionLocal, get_db
 from auth import (
     get_password_hash,
     verify_password,
     create_access_token,
     get_current_user,
+    warm_up_crypto,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Set to 0 where the schema is managed outside the app
+CREATE_SCHEMA = os.getenv("TASKER_CREATE_SCHEMA", "1") == "1"
 
-app = FastAPI(title="Tasker Marketplace API")
+def warm_up():
+    """
+    Pay one-off costs before the worker reports ready instead of on its
+    first request: mapper configuration, compiling the hottest queries into
+    SQLAlchemy's statement cache, and the deferred crypto imports.
+    """
+    configure_mappers()
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.username == "").first()
+        db.query(models.Task).filter(models.Task.status == models.TaskStatus.OPEN).limit(1).all()
+        db.query(models.Task).filter(models.Task.id == 0).first()
+    finally:
+        db.close()
+    warm_up_crypto()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema creation runs here rather than at import time, so importing the
+    # app (tests, tooling, worker boot) never touches the database
+    if CREATE_SCHEMA:
+        models.Base.metadata.create_all(bind=engine)
+    warm_up()
+    app.state.ready = True
+    yield
+
+app = FastAPI(title="Tasker Marketplace API", lifespan=lifespan)
+app.state.ready = False
 
 # CORS middleware
 app.add_middleware(
@@ -333,6 +363,13 @@ def mark_message_read(
     db.commit()
     return {"message": "Message marked as read"}
 
+@app.get("/health/ready")
+def readiness():
+    """503 until startup and warm-up have finished."""
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Starting")
+    return {"status": "ready"}
+
 @app.get("/")
 def root():
     return {"message": "Tasker Marketplace API"}
\ No newline at end of file
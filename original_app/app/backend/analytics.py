@@ -0,0 +1,364 @@
+"""
+Marketplace analytics from incrementally maintained daily rollups.
+
+Ops dashboards chart tasks posted per day, bid-to-budget ratios, acceptance
+rates, time to first bid and completed GMV. Aggregating the live tasks,
+bids and agreements tables for each chart would hold SQLite's lock for
+seconds, so the numbers are kept up to date as the rows are written:
+
+    analytics_daily           one row per UTC day with tasks posted, bids
+                              placed, agreements created, agreements
+                              completed and completed GMV
+    analytics_samples         one row per value of a distribution metric:
+                              bid_to_budget (bid amount / task budget, per
+                              bid) and hours_to_first_bid (per task, on its
+                              first bid)
+    analytics_sample_blocks   the samples of one metric and day packed into
+                              a sorted float64 array
+
+The first two are written by SQLite triggers on tasks, bids and agreements,
+in the transaction that writes the row, so every writer (request handlers,
+the group-commit batcher, jobs, scripts) is counted without having to call
+anything. pack_samples moves samples into their day's block in the
+background; readers combine blocks with any samples not packed yet.
+
+A GET /analytics request reads at most one daily row and one block per
+metric per day in its range, whatever the history length, and computes
+percentiles with NumPy directly over the packed arrays.
+
+When the triggers are first created, e.g. on an existing database, the
+rollups are rebuilt from the hot and archived tables in the same
+transaction. rebuild() can also be run by hand:
+
+    python analytics.py --rebuild
+
+Configuration:
+    TASKER_ANALYTICS_EMAILS=                      comma-separated users allowed to read
+                                                  analytics (empty = nobody)
+    TASKER_ANALYTICS_MAX_DAYS=366                 longest range one request may cover
+    TASKER_ANALYTICS_PACK_BATCH_SIZE=10000        samples packed per transaction
+    TASKER_ANALYTICS_PACK_INTERVAL_SECONDS=60     background packing interval (0 = off)
+"""
+
+import argparse
+import array
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import Base, AnalyticsDay, AnalyticsSample, AnalyticsSampleBlock, User, SessionLocal, engine
+
+ANALYTICS_EMAILS = {email.strip().lower() for email in os.getenv("TASKER_ANALYTICS_EMAILS", "").split(",") if email.strip()}
+ANALYTICS_MAX_DAYS = int(os.getenv("TASKER_ANALYTICS_MAX_DAYS", "366"))
+ANALYTICS_PACK_BATCH_SIZE = int(os.getenv("TASKER_ANALYTICS_PACK_BATCH_SIZE", "10000"))
+ANALYTICS_PACK_INTERVAL_SECONDS = float(os.getenv("TASKER_ANALYTICS_PACK_INTERVAL_SECONDS", "60"))
+
+DEFAULT_RANGE_DAYS = 30
+
+BID_TO_BUDGET = "bid_to_budget"
+HOURS_TO_FIRST_BID = "hours_to_first_bid"
+METRICS = (BID_TO_BUDGET, HOURS_TO_FIRST_BID)
+
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+logger = logging.getLogger(__name__)
+
+
+def _day(timestamp: str) -> str:
+    return f"date(coalesce({timestamp}, CURRENT_TIMESTAMP))"
+
+
+def _bump(timestamp: str, **increments) -> str:
+    """Upsert adding ``increments`` (SQL expressions) to the day of ``timestamp``."""
+    columns = ", ".join(increments)
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in increments)
+    return (
+        f"INSERT INTO analytics_daily (day, {columns}) SELECT {_day(timestamp)}, {', '.join(increments.values())} "
+        f"WHERE true ON CONFLICT (day) DO UPDATE SET {updates};"
+    )
+
+
+# Trigger name -> (when it fires, statements it runs)
+TRIGGERS = {
+    "analytics_tasks_insert": ("AFTER INSERT ON tasks", [
+        _bump("NEW.created_at", tasks_posted="1"),
+    ]),
+    "analytics_bids_insert": ("AFTER INSERT ON bids", [
+        _bump("NEW.created_at", bids_placed="1"),
+        f"INSERT INTO analytics_samples (metric, day, value) "
+        f"SELECT '{BID_TO_BUDGET}', {_day('NEW.created_at')}, NEW.amount / budget "
+        f"FROM tasks WHERE id = NEW.task_id AND budget > 0;",
+        f"INSERT INTO analytics_samples (metric, day, value) "
+        f"SELECT '{HOURS_TO_FIRST_BID}', {_day('NEW.created_at')}, "
+        f"(julianday(coalesce(NEW.created_at, CURRENT_TIMESTAMP)) - julianday(created_at)) * 24 "
+        f"FROM tasks WHERE id = NEW.task_id AND created_at IS NOT NULL "
+        f"AND NOT EXISTS (SELECT 1 FROM bids WHERE task_id = NEW.task_id AND id < NEW.id);",
+    ]),
+    "analytics_agreements_insert": ("AFTER INSERT ON agreements", [
+        _bump("NEW.created_at", agreements_created="1"),
+    ]),
+    # Enum columns store member names
+    "analytics_agreements_complete": (
+        "AFTER UPDATE OF status ON agreements "
+        "WHEN NEW.status = 'COMPLETED' AND OLD.status IS NOT 'COMPLETED'",
+        [_bump("NEW.completed_at", agreements_completed="1", completed_gmv="NEW.amount")]
+    ),
+}
+
+
+def _hot_and_archived(table: str, columns: str) -> str:
+    return f"(SELECT {columns} FROM {table} UNION ALL SELECT {columns} FROM archived_{table})"
+
+
+REBUILD = [
+    "DELETE FROM analytics_daily",
+    "DELETE FROM analytics_samples",
+    "DELETE FROM analytics_sample_blocks",
+    f"INSERT INTO analytics_daily (day, tasks_posted) "
+    f"SELECT date(created_at), count(*) FROM {_hot_and_archived('tasks', 'created_at')} "
+    f"WHERE created_at IS NOT NULL GROUP BY 1",
+    f"INSERT INTO analytics_daily (day, bids_placed) "
+    f"SELECT date(created_at), count(*) FROM {_hot_and_archived('bids', 'created_at')} "
+    f"WHERE created_at IS NOT NULL GROUP BY 1 "
+    f"ON CONFLICT (day) DO UPDATE SET bids_placed = excluded.bids_placed",
+    f"INSERT INTO analytics_daily (day, agreements_created) "
+    f"SELECT date(created_at), count(*) FROM {_hot_and_archived('agreements', 'created_at')} "
+    f"WHERE created_at IS NOT NULL GROUP BY 1 "
+    f"ON CONFLICT (day) DO UPDATE SET agreements_created = excluded.agreements_created",
+    f"INSERT INTO analytics_daily (day, agreements_completed, completed_gmv) "
+    f"SELECT date(completed_at), count(*), sum(amount) "
+    f"FROM {_hot_and_archived('agreements', 'status, amount, completed_at')} "
+    f"WHERE status = 'COMPLETED' AND completed_at IS NOT NULL GROUP BY 1 "
+    f"ON CONFLICT (day) DO UPDATE SET agreements_completed = excluded.agreements_completed, "
+    f"completed_gmv = excluded.completed_gmv",
+    f"INSERT INTO analytics_samples (metric, day, value) "
+    f"SELECT '{BID_TO_BUDGET}', date(b.created_at), b.amount / t.budget "
+    f"FROM {_hot_and_archived('bids', 'id, task_id, amount, created_at')} AS b "
+    f"JOIN {_hot_and_archived('tasks', 'id, budget')} AS t ON t.id = b.task_id "
+    f"WHERE b.created_at IS NOT NULL AND t.budget > 0",
+    # SQLite takes the bare columns from the row holding min(id), i.e. each task's first bid
+    f"INSERT INTO analytics_samples (metric, day, value) "
+    f"SELECT '{HOURS_TO_FIRST_BID}', date(b.created_at), (julianday(b.created_at) - julianday(t.created_at)) * 24 "
+    f"FROM (SELECT task_id, min(id), created_at FROM {_hot_and_archived('bids', 'id, task_id, created_at')} "
+    f"GROUP BY task_id) AS b "
+    f"JOIN {_hot_and_archived('tasks', 'id, created_at')} AS t ON t.id = b.task_id "
+    f"WHERE b.created_at IS NOT NULL AND t.created_at IS NOT NULL",
+]
+
+
+def rebuild(connection):
+    """Recompute all rollups from the hot and archived tables; the caller commits."""
+    for statement in REBUILD:
+        connection.exec_driver_sql(statement)
+
+
+def create_analytics_triggers(connection):
+    """
+    Create the rollup triggers if any are missing, rebuilding the rollups in
+    the same transaction so that no write is counted twice or missed.
+    SQLite only; safe to run repeatedly.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for table in ("analytics_daily", "tasks", "bids", "agreements", "archived_tasks", "archived_bids",
+                  "archived_agreements"):
+        if not connection.dialect.has_table(connection, table):
+            return
+    existing = {
+        name for (name,) in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'analytics_%'"
+        )
+    }
+    if existing >= set(TRIGGERS):
+        return
+    for name in existing:
+        connection.exec_driver_sql(f"DROP TRIGGER {name}")
+    for name, (when, statements) in TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER {name} {when} BEGIN {' '.join(statements)} END")
+    rebuild(connection)
+    logger.info("Created analytics triggers and rebuilt the rollups")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_analytics_triggers(target, connection, **kw):
+    create_analytics_triggers(connection)
+
+
+# Sample blocks: sorted little-endian float64 arrays
+
+def _pack(values) -> bytes:
+    packed = array.array("d", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(payload: bytes) -> array.array:
+    values = array.array("d")
+    values.frombytes(payload)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def pack_samples(db: Session, batch_size: int = ANALYTICS_PACK_BATCH_SIZE) -> int:
+    """
+    Move the oldest ``batch_size`` samples into their day's block, in one transaction.
+
+    Returns:
+        Number of samples packed
+    """
+    rows = db.query(AnalyticsSample.id, AnalyticsSample.metric, AnalyticsSample.day, AnalyticsSample.value).order_by(
+        AnalyticsSample.id
+    ).limit(batch_size).all()
+    if not rows:
+        return 0
+
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[(row.metric, row.day)].append(row.value)
+    try:
+        for (metric, day), values in grouped.items():
+            block = db.get(AnalyticsSampleBlock, (metric, day))
+            if block is None:
+                block = AnalyticsSampleBlock(metric=metric, day=day)
+                db.add(block)
+            else:
+                values.extend(_unpack(block.payload))
+            values.sort()
+            block.value_count = len(values)
+            block.payload = _pack(values)
+        db.query(AnalyticsSample).filter(AnalyticsSample.id <= rows[-1].id).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
+
+
+def pack_all_samples(db: Session, batch_size: int = ANALYTICS_PACK_BATCH_SIZE) -> int:
+    """Pack samples batch by batch until none are left; returns the number packed."""
+    total = 0
+    while True:
+        packed = pack_samples(db, batch_size)
+        total += packed
+        if packed < batch_size:
+            return total
+
+
+def start_analytics_packer(
+    session_factory: Callable[[], Session],
+    interval: float = ANALYTICS_PACK_INTERVAL_SECONDS
+) -> Optional[threading.Thread]:
+    """Start a daemon thread that packs analytics samples every ``interval`` seconds."""
+    if interval <= 0:
+        return None
+
+    def sweep():
+        while True:
+            db = session_factory()
+            try:
+                pack_all_samples(db)
+            except Exception:
+                logger.exception("Analytics sample packing failed")
+            finally:
+                db.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="analytics-packer", daemon=True)
+    thread.start()
+    return thread
+
+
+# Reading
+
+def can_view(user: User) -> bool:
+    """Marketplace-wide numbers are for the listed operators only; an empty list denies everyone."""
+    return user.email.lower() in ANALYTICS_EMAILS
+
+
+def resolve_range(date_from: Optional[date], date_to: Optional[date]) -> Tuple[date, date]:
+    """
+    Fill in a default range (the last 30 days) and check its length.
+
+    Raises:
+        HTTPException(422) if the range is reversed or longer than ANALYTICS_MAX_DAYS
+    """
+    date_to = date_to or (date_from + timedelta(days=DEFAULT_RANGE_DAYS - 1) if date_from else datetime.utcnow().date())
+    date_from = date_from or date_to - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=422, detail="date_from is after date_to")
+    if (date_to - date_from).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=422, detail=f"Ranges are limited to {ANALYTICS_MAX_DAYS} days")
+    return date_from, date_to
+
+
+def daily(db: Session, date_from: date, date_to: date) -> List[AnalyticsDay]:
+    """Rollup rows in the range; days without activity have no row."""
+    return db.query(AnalyticsDay).filter(
+        AnalyticsDay.day.between(date_from, date_to)
+    ).order_by(AnalyticsDay.day).all()
+
+
+def distribution(db: Session, metric: str, date_from: date, date_to: date) -> dict:
+    """Count, mean and percentiles of a sample metric over the range."""
+    # Blocks are read in place; only samples not packed yet are copied
+    arrays = [
+        np.frombuffer(payload, dtype="<f8") for (payload,) in db.query(AnalyticsSampleBlock.payload).filter(
+            AnalyticsSampleBlock.metric == metric,
+            AnalyticsSampleBlock.day.between(date_from, date_to)
+        )
+    ]
+    arrays.append(np.fromiter((value for (value,) in db.query(AnalyticsSample.value).filter(
+        AnalyticsSample.metric == metric,
+        AnalyticsSample.day.between(date_from, date_to)
+    )), dtype=np.float64))
+    values = np.concatenate(arrays)
+    if not values.size:
+        return {"count": 0, "mean": None, **{name: None for name in PERCENTILES}}
+    # Selection rather than a full sort: linear in the number of samples
+    quantiles = np.percentile(values, [q * 100 for q in PERCENTILES.values()])
+    summary = {"count": int(values.size), "mean": float(values.mean())}
+    summary.update({name: float(value) for name, value in zip(PERCENTILES, quantiles)})
+    return summary
+
+
+def summary(db: Session, date_from: date, date_to: date) -> dict:
+    """Totals, acceptance rate and sample distributions over the range."""
+    days = daily(db, date_from, date_to)
+    totals = {
+        name: sum(getattr(day, name) for day in days)
+        for name in ("tasks_posted", "bids_placed", "agreements_created", "agreements_completed", "completed_gmv")
+    }
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        **totals,
+        # Share of tasks posted that found a tasker
+        "acceptance_rate": totals["agreements_created"] / totals["tasks_posted"] if totals["tasks_posted"] else None,
+        **{metric: distribution(db, metric, date_from, date_to) for metric in METRICS},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from the hot and archived tables")
+    args = parser.parse_args()
+    if args.rebuild:
+        with engine.begin() as connection:
+            rebuild(connection)
+    db = SessionLocal()
+    try:
+        print(f"Packed {pack_all_samples(db)} samples")
+    finally:
+        db.close()
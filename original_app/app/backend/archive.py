@@ -0,0 +1,170 @@
+"""
+Hot/cold archival of closed tasks.
+
+Completed and archived tasks stop changing, but their bids, offers and
+agreements keep inflating the indexes every hot endpoint uses. This module
+moves tasks that have been closed for a while, together with those child
+rows, into the ``archived_*`` tables defined in database.py.
+
+Messages stay in the hot table, where the inbox, unread counts and
+mark-as-read find them; their old read history is compacted instead (see
+retention.py). archived_messages only holds rows archived before that.
+
+Work happens in small batches, each in its own short transaction, so the
+SQLite write lock is only ever held for a handful of rows. Read endpoints
+fall back to the archive through find_archived/get_archived when a row is
+no longer in the hot tables.
+
+Configuration:
+    TASKER_ARCHIVE_AFTER_DAYS=90          closed for this long before moving
+    TASKER_ARCHIVE_BATCH_SIZE=100         tasks moved per transaction
+    TASKER_ARCHIVE_INTERVAL_SECONDS=0     background sweep interval (0 = off)
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import Task, Bid, Offer, Agreement, TaskBidStats, FeedEntry, TaskStatus, archive_tables
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("TASKER_ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("TASKER_ARCHIVE_BATCH_SIZE", "100"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("TASKER_ARCHIVE_INTERVAL_SECONDS", "0"))
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.ARCHIVED)
+
+# Child rows are moved before their task
+ARCHIVED_MODELS = (Bid, Offer, Agreement, Task)
+
+
+def _task_key(table):
+    return table.c.id if table.name == Task.__tablename__ else table.c.task_id
+
+
+def archive_batch(db: Session, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move one batch of closed tasks and their child rows to the archive.
+
+    Args:
+        db: Database session
+        cutoff: Tasks closed (last updated) before this time are moved
+        batch_size: Maximum number of tasks moved in this transaction
+
+    Returns:
+        Number of tasks archived; 0 when nothing is left to move
+    """
+    task_ids = [
+        row.id for row in db.query(Task.id).filter(
+            Task.status.in_(CLOSED_STATUSES),
+            Task.updated_at < cutoff
+        ).order_by(Task.id).limit(batch_size)
+    ]
+    if not task_ids:
+        return 0
+
+    try:
+        # Bid summaries and feed entries are derived data and are not kept
+        # for archived tasks
+        db.execute(TaskBidStats.__table__.delete().where(TaskBidStats.task_id.in_(task_ids)))
+        db.execute(FeedEntry.__table__.delete().where(FeedEntry.task_id.in_(task_ids)))
+        for model in ARCHIVED_MODELS:
+            table = model.__table__
+            key = _task_key(table)
+            db.execute(
+                archive_tables[table.name].insert().from_select(
+                    [column.name for column in table.columns],
+                    select(*table.columns).where(key.in_(task_ids))
+                )
+            )
+            db.execute(table.delete().where(key.in_(task_ids)))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(task_ids)
+
+
+def archive_closed_tasks(
+    db: Session,
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pause: float = 0.0
+) -> int:
+    """
+    Archive every task closed for more than ``older_than_days``.
+
+    Runs archive_batch until nothing is left, sleeping ``pause`` seconds
+    between batches so request handlers can take the write lock.
+
+    Returns:
+        Total number of tasks archived
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        moved = archive_batch(db, cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def find_archived(db: Session, model, **filters) -> List:
+    """Archived rows of ``model`` matching column equality filters, oldest first."""
+    table = archive_tables[model.__tablename__]
+    query = select(table).where(*[table.c[name] == value for name, value in filters.items()])
+    order = table.c.created_at if "created_at" in table.c else table.c.id
+    return db.execute(query.order_by(order, table.c.id)).all()
+
+
+def find_archived_for_customer(db: Session, model, customer_id: int) -> List:
+    """Archived rows of ``model`` on tasks the customer posted, oldest first."""
+    table = archive_tables[model.__tablename__]
+    tasks = archive_tables[Task.__tablename__]
+    query = select(table).join(tasks, tasks.c.id == table.c.task_id).where(tasks.c.customer_id == customer_id)
+    return db.execute(query.order_by(table.c.created_at, table.c.id)).all()
+
+
+def find_archived_by_ids(db: Session, model, ids: List[int], *criteria) -> List:
+    """Archived rows of ``model`` whose primary key is in ``ids`` and that match ``criteria``."""
+    table = archive_tables[model.__tablename__]
+    return db.execute(select(table).where(table.c.id.in_(ids), *criteria)).all()
+
+
+def get_archived(db: Session, model, **filters) -> Optional[object]:
+    """First archived row of ``model`` matching the filters, or None."""
+    rows = find_archived(db, model, **filters)
+    return rows[0] if rows else None
+
+
+def start_archiver(
+    session_factory: Callable[[], Session],
+    interval: float = ARCHIVE_INTERVAL_SECONDS
+) -> Optional[threading.Thread]:
+    """Start a daemon thread that sweeps closed tasks every ``interval`` seconds."""
+    if interval <= 0:
+        return None
+
+    def sweep():
+        while True:
+            db = session_factory()
+            try:
+                archive_closed_tasks(db, pause=0.05)
+            except Exception:
+                logger.exception("Task archival sweep failed")
+            finally:
+                db.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="task-archiver", daemon=True)
+    thread.start()
+    return thread
@@ -1,32 +1,56 @@
+import hashlib
+import logging
+import os
+import secrets
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import delete, or_, select, update
 from sqlalchemy.orm import Session
-from database import get_db, User
+from database import get_db, User, RefreshToken
 
 SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 30
+# A token rotated this recently may be presented once more, e.g. by a second
+# tab that refreshed at the same moment, without counting as reuse
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = 30
+REFRESH_TOKEN_PURGE_INTERVAL_SECONDS = float(os.getenv("TASKER_REFRESH_TOKEN_PURGE_INTERVAL_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__truncate_error=False)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Scope key under which POST /batch passes its authenticated user to sub-requests
+SHARED_PRINCIPAL_KEY = "tasker.shared_principal"
+
+# python-jose (with its cryptography backend) and passlib are imported on
+# first use rather than with this module, which keeps them out of worker
+# import time; warmup.warm_up loads them before the worker reports ready.
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__truncate_error=False)
+
 def verify_password(plain_password, hashed_password):
     # Remove null bytes which bcrypt doesn't allow
     if isinstance(plain_password, str) and '\x00' in plain_password:
         plain_password = plain_password.replace('\x00', '')
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     # Remove null bytes which bcrypt doesn't allow
     if isinstance(password, str) and '\x00' in password:
         password = password.replace('\x00', '')
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -36,7 +60,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    principal = request.scope.get(SHARED_PRINCIPAL_KEY)
+    if principal is not None:
+        return principal
+    from jose import JWTError, jwt
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -52,4 +80,141 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+@lru_cache(maxsize=4096)
+def _verified_claims(token: str) -> Optional[Tuple[str, int]]:
+    from jose import JWTError, jwt
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+    except JWTError:
+        return None
+    if payload.get("sub") is None or payload.get("exp") is None:
+        return None
+    return payload["sub"], payload["exp"]
+
+def token_subject(authorization: Optional[str]) -> Optional[str]:
+    """
+    The subject of a valid, unexpired "Bearer <token>" header value, else None.
+
+    Identifies the caller without a database lookup, and stays the same when
+    a session renews its access token. Signatures are checked once per token.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    claims = _verified_claims(authorization[7:])
+    if claims is None or claims[1] <= time.time():
+        return None
+    return claims[0]
+
+# Refresh tokens are 256 random bits, so unlike passwords there is nothing to
+# brute-force and a single SHA-256 is enough to make the stored form useless.
+# Renewing a session therefore costs a hash and an indexed lookup, not bcrypt.
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """Store a new refresh token for the user and return it; the caller commits."""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+def revoke_refresh_family(db: Session, family_id: str):
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+def _family_active(db: Session, family_id: str, now: datetime) -> bool:
+    return db.query(RefreshToken.id).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None),
+        RefreshToken.expires_at > now
+    ).first() is not None
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[User, str]:
+    """
+    Exchange a refresh token for its user and a successor token; the caller
+    commits. Each token works once: presenting one that was already rotated
+    means two parties hold it, so the whole family is revoked.
+
+    The exception is a token rotated within REFRESH_TOKEN_REUSE_GRACE_SECONDS
+    whose family is still live, which is what two tabs refreshing together
+    look like. It gets a successor of its own in the same family instead.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    now = datetime.utcnow()
+    stored = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(token)).first()
+    if stored is None or stored.expires_at <= now:
+        raise invalid
+    # Conditional so that of two concurrent rotations only one succeeds
+    rotated = db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == stored.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now, rotated_at=now)
+    ).rowcount
+    if not rotated:
+        rotated_at = db.query(RefreshToken.rotated_at).filter(RefreshToken.id == stored.id).scalar()
+        in_grace = rotated_at is not None and now - rotated_at <= timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE_SECONDS)
+        if not (in_grace and _family_active(db, stored.family_id, now)):
+            revoke_refresh_family(db, stored.family_id)
+            db.commit()
+            raise invalid
+    user = db.query(User).filter(User.id == stored.user_id).first()
+    if user is None:
+        raise invalid
+    return user, create_refresh_token(db, user.id, stored.family_id)
+
+def purge_refresh_tokens(db: Session) -> int:
+    """
+    Delete expired refresh tokens and every token of a family with no live
+    token left (logged out, or revoked on reuse); returns rows removed.
+
+    Rotated tokens of live families are kept until they expire, since they
+    are what reuse detection recognises.
+    """
+    now = datetime.utcnow()
+    live_families = select(RefreshToken.family_id).where(
+        RefreshToken.revoked_at.is_(None), RefreshToken.expires_at > now
+    )
+    removed = db.execute(
+        delete(RefreshToken).where(or_(
+            RefreshToken.expires_at <= now,
+            RefreshToken.family_id.not_in(live_families)
+        ))
+    ).rowcount
+    db.commit()
+    return removed
+
+def start_refresh_token_purger(
+    session_factory: Callable[[], Session],
+    interval: float = REFRESH_TOKEN_PURGE_INTERVAL_SECONDS
+) -> Optional[threading.Thread]:
+    """Start a daemon thread that purges dead refresh tokens every ``interval`` seconds."""
+    if interval <= 0:
+        return None
+
+    def sweep():
+        while True:
+            time.sleep(interval)
+            db = session_factory()
+            try:
+                purge_refresh_tokens(db)
+            except Exception:
+                logger.exception("Refresh token purge failed")
+            finally:
+                db.close()
+
+    thread = threading.Thread(target=sweep, name="refresh-token-purger", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,134 @@
+"""
+Request multiplexing for POST /batch.
+
+A screen that needs several resources sends them as one batch instead of
+several HTTP requests. Sub-requests run in order, in-process, through the
+full application (routing, error handling and per-request rate limits
+included), and the batch answers with one result per sub-request:
+
+    {"status": 200, "headers": {...}, "body": ..., "duration_ms": 1.7}
+
+The batch authenticates once: sub-requests reuse its user instead of
+decoding the token and loading the user again. Reads (GET handlers using
+get_read_db) share the batch's session; writes get their own, and the
+shared session's transaction is ended after each write so later reads in
+the same batch see it.
+
+Sub-requests carry only the batch's Authorization header, so they never
+stream (NDJSON needs an Accept header) and never replay idempotency keys.
+
+Configuration:
+    TASKER_BATCH_MAX_REQUESTS=20    sub-requests per batch
+    TASKER_BATCH_MAX_BYTES=65536    size of the batch request body
+"""
+
+import json
+import logging
+import os
+import time
+from typing import List
+
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Scope
+
+import schemas
+from auth import SHARED_PRINCIPAL_KEY
+from database import SHARED_READ_SESSION_KEY, User
+
+BATCH_MAX_REQUESTS = int(os.getenv("TASKER_BATCH_MAX_REQUESTS", "20"))
+BATCH_MAX_BYTES = int(os.getenv("TASKER_BATCH_MAX_BYTES", "65536"))
+
+# Never answered inside a batch: nested batches, and streams that would
+# hold the whole batch open
+EXCLUDED_PATHS = ("/batch", "/notifications/stream")
+
+# Response headers that describe the sub-response's own encoding
+DROPPED_HEADERS = {"content-length", "content-type"}
+
+logger = logging.getLogger(__name__)
+
+
+def sub_scope(parent: Scope, request: schemas.BatchSubRequest, body: bytes) -> Scope:
+    """An HTTP scope for one sub-request, inheriting the batch's connection details."""
+    path, _, query = request.path.partition("?")
+    headers = [(b"accept", b"application/json")]
+    headers += [(name, value) for name, value in parent["headers"] if name == b"authorization"]
+    if body:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    return {
+        "type": "http",
+        "asgi": parent.get("asgi", {"version": "3.0"}),
+        "http_version": parent.get("http_version", "1.1"),
+        "method": request.method,
+        "scheme": parent.get("scheme", "http"),
+        "server": parent.get("server"),
+        "client": parent.get("client"),
+        "root_path": parent.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+    }
+
+
+async def call(app: ASGIApp, scope: Scope, body: bytes) -> schemas.BatchResult:
+    """Run one sub-request through ``app`` and collect its response."""
+    started = time.perf_counter()
+    status, headers, chunks = 500, {}, []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status, headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # The app has already answered 500; the error stays in this result
+        logger.exception("Batched %s %s failed", scope["method"], scope["path"])
+    content = b"".join(chunks)
+    if not content:
+        payload = None
+    elif headers.get("content-type", "").startswith("application/json"):
+        payload = json.loads(content)
+    else:
+        payload = content.decode("utf-8", "replace")
+    return schemas.BatchResult(
+        status=status,
+        headers={name: value for name, value in headers.items() if name not in DROPPED_HEADERS},
+        body=payload,
+        duration_ms=(time.perf_counter() - started) * 1000
+    )
+
+
+async def run_batch(
+    app: ASGIApp,
+    parent: Scope,
+    requests: List[schemas.BatchSubRequest],
+    user: User,
+    db: Session
+) -> List[schemas.BatchResult]:
+    """Run ``requests`` in order as ``user``, reads sharing ``db``."""
+    results = []
+    for request in requests:
+        if request.path.partition("?")[0] in EXCLUDED_PATHS:
+            results.append(schemas.BatchResult(
+                status=400, headers={}, body={"detail": "Not allowed in a batch"}, duration_ms=0.0
+            ))
+            continue
+        body = json.dumps(request.body).encode() if request.body is not None else b""
+        scope = sub_scope(parent, request, body)
+        scope[SHARED_PRINCIPAL_KEY] = user
+        if request.method == "GET":
+            scope[SHARED_READ_SESSION_KEY] = db
+        results.append(await call(app, scope, body))
+        if request.method != "GET":
+            # Later reads must see this write
+            db.commit()
+    return results
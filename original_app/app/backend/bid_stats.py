@@ -0,0 +1,45 @@
+"""
+Precomputed bid statistics per task.
+
+Customers comparing taskers want the spread of bids on a task, and the task
+list wants to show it without a /bids call per task. refresh_bid_stats
+recomputes a task's TaskBidStats row from its active (non-withdrawn) bids
+inside the transaction that changed them, so the summary is always in step
+with the bids table. A task rarely has more than a few dozen bids, so the
+recompute is a single indexed range scan.
+
+The count and lowest bid are also copied onto the task row (Task.bid_count,
+Task.lowest_bid) so task lists can filter and sort on them without a join.
+"""
+
+import statistics
+
+from sqlalchemy.orm import Session
+
+from counters import set_task_counters
+from database import Bid, TaskBidStats
+
+
+def refresh_bid_stats(db: Session, task_id: int) -> TaskBidStats:
+    """
+    Recompute the bid summary for a task; the caller commits.
+
+    Returns:
+        The (possibly new) TaskBidStats row, added to the session
+    """
+    bids = db.query(Bid.amount, Bid.created_at).filter(
+        Bid.task_id == task_id,
+        Bid.withdrawn == False
+    ).order_by(Bid.amount).all()
+    amounts = [bid.amount for bid in bids]
+
+    stats = db.get(TaskBidStats, task_id) or TaskBidStats(task_id=task_id)
+    stats.bid_count = len(amounts)
+    stats.min_amount = amounts[0] if amounts else None
+    stats.max_amount = amounts[-1] if amounts else None
+    stats.mean_amount = statistics.fmean(amounts) if amounts else None
+    stats.median_amount = statistics.median(amounts) if amounts else None
+    stats.last_bid_at = max((bid.created_at for bid in bids), default=None)
+    db.add(stats)
+    set_task_counters(db, task_id, bid_count=stats.bid_count, lowest_bid=stats.min_amount)
+    return stats
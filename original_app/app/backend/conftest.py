@@ -0,0 +1,59 @@
+"""
+Shared test setup: an in-memory database and a client that uses it.
+
+The legacy *_integration test modules install their own get_db override
+when they are imported, so everything here puts back whatever override was
+in place before a test instead of removing it.
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from main import app
+from database import Base, get_db
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    """Override database dependency for testing."""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextmanager
+def get_db_overridden(override):
+    """Route get_db to override, restoring the previous override (if any) on exit."""
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override
+    try:
+        yield
+    finally:
+        if previous is None:
+            app.dependency_overrides.pop(get_db, None)
+        else:
+            app.dependency_overrides[get_db] = previous
+
+
+@pytest.fixture
+def client():
+    """Create test client against a fresh in-memory database."""
+    Base.metadata.create_all(bind=engine)
+    try:
+        with get_db_overridden(override_get_db):
+            yield TestClient(app)
+    finally:
+        Base.metadata.drop_all(bind=engine)
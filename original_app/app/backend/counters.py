@@ -0,0 +1,169 @@
+"""
+Denormalized task counters.
+
+Task rows carry bid_count, lowest_bid, offer_count and message_count so the
+task list can show, filter and sort on them ("open tasks with no bids yet")
+without aggregating child tables for every row. Each counter changes in the
+transaction that changes its child rows:
+
+    bid_count, lowest_bid     recomputed by bid_stats.refresh_bid_stats when
+                              a bid is placed or withdrawn
+    offer_count               incremented when an Offer row is inserted
+    message_count             incremented when a Message row is inserted,
+                              including inserts committed by the group-commit
+                              batcher in its own session
+
+Counter writes leave Task.updated_at alone: it still means "last edited" and
+drives archival. They do stamp the task's change_seq, like any other write,
+so incremental exports pick up new counter values (see export.py).
+
+Counters can still drift, e.g. after rows are edited by hand or when an
+existing database gains the columns (they start at zero). check_counters
+walks the tasks table in primary key batches, recomputes every counter from
+the child tables (compacted messages included) and rewrites only the rows
+that disagree, one short transaction per batch.
+
+Configuration:
+    TASKER_COUNTER_CHECK_BATCH_SIZE=500        tasks checked per transaction
+    TASKER_COUNTER_CHECK_INTERVAL_SECONDS=0    background check interval (0 = off)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+from database import Task, Bid, Offer, Message, MessageBlock
+
+COUNTER_CHECK_BATCH_SIZE = int(os.getenv("TASKER_COUNTER_CHECK_BATCH_SIZE", "500"))
+COUNTER_CHECK_INTERVAL_SECONDS = float(os.getenv("TASKER_COUNTER_CHECK_INTERVAL_SECONDS", "0"))
+
+COUNTERS = ("bid_count", "lowest_bid", "offer_count", "message_count")
+
+logger = logging.getLogger(__name__)
+
+tasks = Task.__table__
+
+
+def _update_task(task_id: int, values: dict):
+    # Setting updated_at to itself keeps its onupdate default from firing
+    return update(tasks).where(tasks.c.id == task_id).values(updated_at=tasks.c.updated_at, **values)
+
+
+def set_task_counters(db: Session, task_id: int, **values):
+    """Overwrite counter columns of one task; the caller commits."""
+    db.execute(_update_task(task_id, values))
+
+
+def _increment_on_insert(counter: str):
+    def after_insert(mapper, connection, target):
+        if target.task_id is not None:
+            connection.execute(_update_task(target.task_id, {counter: tasks.c[counter] + 1}))
+    return after_insert
+
+
+# Runs inside the flush that inserts the row, so the count commits with it
+event.listen(Offer, "after_insert", _increment_on_insert("offer_count"))
+event.listen(Message, "after_insert", _increment_on_insert("message_count"))
+
+
+def _expected_counters():
+    """Counter values recomputed from the child tables, correlated to tasks.id."""
+    active_bids = (Bid.task_id == tasks.c.id, Bid.withdrawn == False)
+    messages = select(func.count(Message.id)).where(Message.task_id == tasks.c.id).scalar_subquery()
+    compacted = select(func.coalesce(func.sum(MessageBlock.message_count), 0)).where(
+        MessageBlock.task_id == tasks.c.id
+    ).scalar_subquery()
+    return (
+        select(func.count(Bid.id)).where(*active_bids).scalar_subquery().label("bid_count"),
+        select(func.min(Bid.amount)).where(*active_bids).scalar_subquery().label("lowest_bid"),
+        select(func.count(Offer.id)).where(Offer.task_id == tasks.c.id).scalar_subquery().label("offer_count"),
+        (messages + compacted).label("message_count"),
+    )
+
+
+def check_batch(db: Session, after_id: int, batch_size: int = COUNTER_CHECK_BATCH_SIZE) -> Tuple[Optional[int], int]:
+    """
+    Check and repair the counters of the next batch of tasks.
+
+    Args:
+        db: Database session
+        after_id: Check tasks with an id greater than this
+        batch_size: Maximum number of tasks checked in this transaction
+
+    Returns:
+        (last task id checked or None when no tasks are left, tasks repaired)
+    """
+    rows = db.execute(
+        select(tasks.c.id, *[tasks.c[name] for name in COUNTERS], *_expected_counters())
+        .where(tasks.c.id > after_id)
+        .order_by(tasks.c.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None, 0
+
+    repaired = 0
+    try:
+        for row in rows:
+            stored, expected = row[1:1 + len(COUNTERS)], row[1 + len(COUNTERS):]
+            if tuple(stored) != tuple(expected):
+                set_task_counters(db, row.id, **dict(zip(COUNTERS, expected)))
+                repaired += 1
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, repaired
+
+
+def check_counters(db: Session, batch_size: int = COUNTER_CHECK_BATCH_SIZE, pause: float = 0.0) -> int:
+    """
+    Check every task's counters, repairing drift batch by batch.
+
+    Sleeps ``pause`` seconds between batches so request handlers can take
+    the write lock.
+
+    Returns:
+        Number of tasks whose counters were repaired
+    """
+    after_id, total = 0, 0
+    while True:
+        last_id, repaired = check_batch(db, after_id, batch_size)
+        total += repaired
+        if last_id is None:
+            break
+        after_id = last_id
+        if pause:
+            time.sleep(pause)
+    if total:
+        logger.warning("Repaired counter drift on %d tasks", total)
+    return total
+
+
+def start_counter_checker(
+    session_factory: Callable[[], Session],
+    interval: float = COUNTER_CHECK_INTERVAL_SECONDS
+) -> Optional[threading.Thread]:
+    """Start a daemon thread that checks task counters every ``interval`` seconds."""
+    if interval <= 0:
+        return None
+
+    def sweep():
+        while True:
+            db = session_factory()
+            try:
+                check_counters(db, pause=0.05)
+            except Exception:
+                logger.exception("Task counter check failed")
+            finally:
+                db.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="counter-checker", daemon=True)
+    thread.start()
+    return thread
@@ -1,11 +1,35 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import create_engine, event, exc, inspect, text, Table, Index, Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text, Enum, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from fastapi import Depends, Request
 from datetime import datetime
+from typing import List, Optional
 import enum
+import itertools
+import logging
+import os
+import threading
+import time
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./tasker.db"
 
+logger = logging.getLogger(__name__)
+
+# Comma-separated read replica URLs, e.g. litestream-restored SQLite copies
+# ("sqlite:///file:replica.db?mode=ro&uri=true") or PostgreSQL streaming replicas
+REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("TASKER_REPLICA_URLS", "").split(",") if url.strip()
+]
+
+# After a write, the same session user reads from the primary for this long
+REPLICA_STICKY_SECONDS = float(os.getenv("TASKER_REPLICA_STICKY_SECONDS", "5"))
+
+# Set to 0 where the schema is managed outside the app, so workers skip
+# create_all at startup
+CREATE_SCHEMA = os.getenv("TASKER_CREATE_SCHEMA", "1") == "1"
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
@@ -13,6 +37,45 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Last edit time of bids, offers, agreements and messages. Rows from before
+# the column existed read as unchanged since the epoch.
+UNCHANGED_SINCE = "1970-01-01 00:00:00.000000"
+
+def updated_at_column():
+    return Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=UNCHANGED_SINCE)
+
+# Every insert or update of an exported row stamps it with its transaction's
+# change number, which incremental exports follow (see export.py). Numbers
+# come from the one-row change_sequence table, bumped by the transaction's
+# first stamped write. SQLite lets one transaction write at a time and the
+# bump is itself a write, so a transaction holds the write lock from taking
+# its number until it commits: numbers are in commit order, and a reader
+# that sees number n sees every change numbered below it. updated_at has
+# neither property, being taken at flush time and left alone by counter
+# writes. Rows written outside the app, or before the column existed, read
+# as change 0.
+CHANGE_KEY = "change_seq"
+
+NEXT_CHANGE = text(
+    "INSERT INTO change_sequence (id, value) VALUES (1, 1) "
+    "ON CONFLICT (id) DO UPDATE SET value = value + 1 RETURNING value"
+)
+
+def next_change(context) -> int:
+    """Change number of the current transaction, taken on first use."""
+    info = context.connection.info
+    if CHANGE_KEY not in info:
+        info[CHANGE_KEY] = context.connection.execute(NEXT_CHANGE).scalar_one()
+    return info[CHANGE_KEY]
+
+@event.listens_for(Engine, "commit")
+@event.listens_for(Engine, "rollback")
+def _end_change(connection):
+    connection.info.pop(CHANGE_KEY, None)
+
+def change_seq_column():
+    return Column(Integer, nullable=False, default=next_change, onupdate=next_change, server_default="0")
+
 class UserRole(str, enum.Enum):
     CUSTOMER = "customer"
     TASKER = "tasker"
@@ -28,6 +91,11 @@ class AgreementStatus(str, enum.Enum):
     ACCEPTED = "accepted"
     COMPLETED = "completed"
 
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -68,6 +136,13 @@ class Task(Base):
     status = Column(Enum(TaskStatus), default=TaskStatus.OPEN)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = change_seq_column()
+    # Denormalized counters, kept in step by bid_stats.refresh_bid_stats and
+    # counters.py and repaired by counters.check_counters
+    bid_count = Column(Integer, nullable=False, default=0, server_default="0")
+    lowest_bid = Column(Float)
+    offer_count = Column(Integer, nullable=False, default=0, server_default="0")
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     customer = relationship("User", back_populates="posted_tasks", foreign_keys=[customer_id])
@@ -76,6 +151,28 @@ class Task(Base):
     agreement = relationship("Agreement", back_populates="task", uselist=False)
     reviews = relationship("Review", back_populates="task")
     messages = relationship("Message", back_populates="task", order_by="Message.created_at")
+    bid_stats = relationship("TaskBidStats", uselist=False, lazy="joined", viewonly=True)
+
+    # Task list filters and sorts (GET /tasks); test_task_filters checks
+    # with EXPLAIN QUERY PLAN that every filter and sort is served by one
+    __table_args__ = (
+        # "Open tasks with no bids yet"
+        Index("ix_tasks_status_bid_count", "status", "bid_count"),
+        Index("ix_tasks_status_created", "status", "created_at"),
+        Index("ix_tasks_status_date", "status", "date"),
+        Index("ix_tasks_status_budget", "status", "budget"),
+        Index("ix_tasks_created", "created_at"),
+        Index("ix_tasks_date", "date"),
+        Index("ix_tasks_budget", "budget"),
+        # NOCASE so case-insensitive prefix (LIKE 'x%') matches use it
+        Index("ix_tasks_location", text("location COLLATE NOCASE"), "date"),
+        # A customer's own tasks (see involvement.py)
+        Index("ix_tasks_customer", "customer_id", "id"),
+        # Closed tasks due for archival (see archive.py)
+        Index("ix_tasks_updated", "updated_at"),
+        # Incremental exports (see export.py)
+        Index("ix_tasks_change", "change_seq", "id"),
+    )
 
 class Bid(Base):
     __tablename__ = "bids"
@@ -87,11 +184,34 @@ class Bid(Base):
     message = Column(Text)
     withdrawn = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = updated_at_column()
+    change_seq = change_seq_column()
     
     # Relationships
     task = relationship("Task", back_populates="bids")
     tasker = relationship("User", back_populates="bids")
 
+    # Bid book ordering: cheapest first, or oldest first
+    __table_args__ = (
+        Index("ix_bids_task_amount", "task_id", "amount", "id"),
+        Index("ix_bids_task_created", "task_id", "created_at", "id"),
+        # A tasker's tasks (see involvement.py)
+        Index("ix_bids_tasker_task", "tasker_id", "task_id"),
+        Index("ix_bids_change", "change_seq", "id"),
+    )
+
+class TaskBidStats(Base):
+    """Per-task summary of active bids, maintained by bid_stats.refresh_bid_stats"""
+    __tablename__ = "task_bid_stats"
+
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    bid_count = Column(Integer, nullable=False, default=0)
+    min_amount = Column(Float)
+    max_amount = Column(Float)
+    mean_amount = Column(Float)
+    median_amount = Column(Float)
+    last_bid_at = Column(DateTime)
+
 class Offer(Base):
     __tablename__ = "offers"
 
@@ -103,26 +223,41 @@ class Offer(Base):
     message = Column(Text)
     accepted = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = updated_at_column()
+    change_seq = change_seq_column()
     
     # Relationships
     task = relationship("Task", back_populates="offers")
     customer = relationship("User", back_populates="offers_made", foreign_keys=[customer_id])
     tasker = relationship("User", back_populates="offers_received", foreign_keys=[tasker_id])
 
+    __table_args__ = (
+        Index("ix_offers_tasker_task", "tasker_id", "task_id"),
+        Index("ix_offers_change", "change_seq", "id"),
+    )
+
 class Agreement(Base):
     __tablename__ = "agreements"
 
     id = Column(Integer, primary_key=True, index=True)
-    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
+    # One agreement per task; concurrent accepts lose on this constraint
+    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False, unique=True, index=True)
     tasker_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     amount = Column(Float, nullable=False)
     status = Column(Enum(AgreementStatus), default=AgreementStatus.ACCEPTED)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
+    updated_at = updated_at_column()
+    change_seq = change_seq_column()
     
     # Relationships
     task = relationship("Task", back_populates="agreement")
 
+    __table_args__ = (
+        Index("ix_agreements_tasker_task", "tasker_id", "task_id"),
+        Index("ix_agreements_change", "change_seq", "id"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -133,12 +268,27 @@ class Message(Base):
     content = Column(Text, nullable=False)
     read = Column(Boolean, default=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = updated_at_column()
+    change_seq = change_seq_column()
     
     # Relationships
     sender = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
     receiver = relationship("User", back_populates="received_messages", foreign_keys=[receiver_id])
     task = relationship("Task", back_populates="messages")
 
+    __table_args__ = (
+        # Thread pages in (created_at, id) order (see threads.py)
+        Index("ix_messages_task_created", "task_id", "created_at", "id"),
+        Index("ix_messages_change", "change_seq", "id"),
+    )
+
+class ChangeSequence(Base):
+    """Last change number handed out (see next_change); a single row"""
+    __tablename__ = "change_sequence"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False)
+
 class Review(Base):
     __tablename__ = "reviews"
 
@@ -155,6 +305,219 @@ class Review(Base):
     reviewer = relationship("User", back_populates="reviews_given", foreign_keys=[reviewer_id])
     reviewee = relationship("User", back_populates="reviews_received", foreign_keys=[reviewee_id])
 
+class MessageBlock(Base):
+    """Compressed block of old messages from one closed task thread (see retention.py)"""
+    __tablename__ = "message_blocks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False, index=True)
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON array
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IdempotencyRecord(Base):
+    """Stored response for a client-supplied Idempotency-Key (see idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # sha256 of token subject + Idempotency-Key
+    fingerprint = Column(String, nullable=False)  # sha256 of path and body; only POSTs are stored
+    status_code = Column(Integer, nullable=False)  # 0 while reserved by a running request
+    content_type = Column(String)
+    body = Column(LargeBinary, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class FeedEntry(Base):
+    """One ranked open task in a tasker's materialized feed (see feed.py)"""
+    __tablename__ = "feed_entries"
+
+    tasker_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True, index=True)
+    score = Column(Float, nullable=False)
+
+    # Feed pages are a seek on (tasker_id, score, task_id)
+    __table_args__ = (
+        Index("ix_feed_entries_rank", "tasker_id", "score", "task_id"),
+    )
+
+class FeedState(Base):
+    """Marks a tasker whose feed has been materialized"""
+    __tablename__ = "feed_states"
+
+    tasker_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    built_at = Column(DateTime, nullable=False)
+
+class SkillIndexEntry(Base):
+    """Inverted index from skill and city tokens to taskers (see notifications.py)"""
+    __tablename__ = "tasker_skill_index"
+
+    token = Column(String, primary_key=True)  # "skill:<word>" or "city:<name>"
+    tasker_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+
+class Notification(Base):
+    """Inbox entry for a user"""
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)
+    task_id = Column(Integer, ForeignKey("tasks.id"))
+    read = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Inbox pages are a seek on (user_id, id)
+    __table_args__ = (
+        Index("ix_notifications_user", "user_id", "id"),
+    )
+
+class Job(Base):
+    """Queued background job (see jobs.py); rows are deleted once they succeed"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON keyword arguments for the handler
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Next time the job may run: the retry time while pending, the lease
+    # expiry while running
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_jobs_due", "status", "run_after"),
+    )
+
+class RefreshToken(Base):
+    """Long-lived, single-use credential exchanged for access tokens (see auth.py)"""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String, unique=True, nullable=False)  # sha256 of the token
+    # Shared by every rotation descending from one login
+    family_id = Column(String, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)  # set when rotated, revoked or logged out
+    rotated_at = Column(DateTime)  # set when exchanged for a successor
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalyticsDay(Base):
+    """Marketplace activity per UTC day, kept up to date by triggers (see analytics.py)"""
+    __tablename__ = "analytics_daily"
+
+    day = Column(Date, primary_key=True)
+    tasks_posted = Column(Integer, nullable=False, default=0, server_default="0")
+    bids_placed = Column(Integer, nullable=False, default=0, server_default="0")
+    agreements_created = Column(Integer, nullable=False, default=0, server_default="0")
+    agreements_completed = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_gmv = Column(Float, nullable=False, default=0, server_default="0")
+
+class AnalyticsSample(Base):
+    """One value of a distribution metric, not yet packed into a block (see analytics.py)"""
+    __tablename__ = "analytics_samples"
+
+    id = Column(Integer, primary_key=True)
+    metric = Column(String, nullable=False)  # e.g. "bid_to_budget"
+    day = Column(Date, nullable=False)
+    value = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_analytics_samples_metric_day", "metric", "day"),
+    )
+
+class AnalyticsSampleBlock(Base):
+    """All packed values of one metric on one day, sorted (see analytics.py)"""
+    __tablename__ = "analytics_sample_blocks"
+
+    metric = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    value_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # little-endian float64 array
+
+class CacheVersion(Base):
+    """Change counter for one cache scope (see invalidation.py)"""
+    __tablename__ = "cache_versions"
+
+    scope = Column(String, primary_key=True)  # e.g. "user:12", "relations:7"
+    version = Column(Integer, nullable=False, default=0)
+
+# Scopes bumped by triggers on each write to the tables the in-process caches
+# read, as SELECTs over the written row ({row} is NEW or OLD). Triggers see
+# writes from every connection, so workers, jobs and maintenance tasks all
+# invalidate without having to remember to.
+CACHE_TRIGGER_SCOPES = {
+    "users": ["SELECT 'user:' || {row}.id, 1 WHERE true"],
+    "tasks": ["SELECT 'task:' || {row}.id, 1 WHERE true"],
+    "bids": [
+        "SELECT 'relations:' || {row}.tasker_id, 1 WHERE true",
+        "SELECT 'relations:' || customer_id, 1 FROM tasks WHERE id = {row}.task_id",
+    ],
+    "offers": [
+        "SELECT 'relations:' || {row}.customer_id, 1 WHERE true",
+        "SELECT 'relations:' || {row}.tasker_id, 1 WHERE true",
+    ],
+    "agreements": [
+        "SELECT 'relations:' || {row}.tasker_id, 1 WHERE true",
+        "SELECT 'relations:' || customer_id, 1 FROM tasks WHERE id = {row}.task_id",
+    ],
+}
+
+def create_cache_triggers(connection):
+    """
+    Create any missing cache_versions triggers, plus the "*" generation row
+    that distinguishes this database from earlier ones at the same path.
+    SQLite only; safe to run repeatedly.
+    """
+    if connection.dialect.name != "sqlite" or not connection.dialect.has_table(connection, "cache_versions"):
+        return
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO cache_versions (scope, version) VALUES ('*', abs(random()))"
+    )
+    for table, scopes in CACHE_TRIGGER_SCOPES.items():
+        if not connection.dialect.has_table(connection, table):
+            continue
+        for operation, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            body = " ".join(
+                f"INSERT INTO cache_versions (scope, version) {scope.format(row=row)} "
+                "ON CONFLICT (scope) DO UPDATE SET version = version + 1;"
+                for scope in scopes
+            )
+            connection.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS cache_{table}_{operation.lower()} "
+                f"AFTER {operation} ON {table} BEGIN {body} END"
+            )
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_cache_triggers(target, connection, **kw):
+    create_cache_triggers(connection)
+
+# Cold storage for closed tasks (see archive.py). Each archive table mirrors
+# its hot table column for column, minus foreign keys, so rows move across
+# with a plain INSERT ... SELECT.
+def _archive_table(model):
+    columns = [
+        Column(
+            column.name,
+            column.type,
+            primary_key=column.primary_key,
+            nullable=column.nullable,
+            server_default=column.server_default.arg if column.server_default is not None else None,
+            # task_id and the user columns for reads, change_seq for
+            # incremental exports
+            index=column.name in ("task_id", "customer_id", "tasker_id", "change_seq")
+        )
+        for column in model.__table__.columns
+    ]
+    return Table(f"archived_{model.__tablename__}", Base.metadata, *columns)
+
+archive_tables = {
+    model.__tablename__: _archive_table(model)
+    for model in (Task, Bid, Offer, Agreement, Message)
+}
+
 def get_db():
     db = SessionLocal()
     try:
@@ -162,5 +525,115 @@ def get_db():
     finally:
         db.close()
 
+
+class ReplicaRouter:
+    """
+    Routes read-only sessions across replica engines.
+
+    Replicas are picked round-robin. A client that has just committed a write
+    is pinned to the primary for ``sticky_seconds`` so it always reads its own
+    writes, even while replicas are still catching up.
+    """
+
+    def __init__(self, engines: List, sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.sticky_seconds = sticky_seconds
+        self._sessionmakers = [
+            sessionmaker(autocommit=False, autoflush=False, bind=replica) for replica in engines
+        ]
+        self._cycle = itertools.cycle(self._sessionmakers)
+        self._sticky_until = {}
+        self._lock = threading.Lock()
+
+    def mark_write(self, client_key: Optional[str]):
+        """Pin a client to the primary for the stickiness window."""
+        if not client_key or not self._sessionmakers:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sticky_until) > 10000:
+                # Drop expired pins so the map stays bounded
+                self._sticky_until = {
+                    key: until for key, until in self._sticky_until.items() if until > now
+                }
+            self._sticky_until[client_key] = now + self.sticky_seconds
+
+    def read_sessionmaker(self, client_key: Optional[str]):
+        """Return a replica sessionmaker, or None if the primary must serve the read."""
+        if not self._sessionmakers:
+            return None
+        if client_key and self._sticky_until.get(client_key, 0) > time.monotonic():
+            return None
+        with self._lock:
+            return next(self._cycle)
+
+
+read_router = ReplicaRouter(
+    [create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+     for url in REPLICA_DATABASE_URLS]
+)
+
+
+def _client_key(request: Request) -> Optional[str]:
+    # The token subject identifies the user without a database lookup, and
+    # survives the client renewing its access token mid-window
+    from auth import token_subject
+    return token_subject(request.headers.get("authorization"))
+
+
+def get_write_db(request: Request, db: Session = Depends(get_db)):
+    """Primary session for handlers that write; commits pin the caller to the primary."""
+    client_key = _client_key(request)
+    event.listen(db, "after_commit", lambda session: read_router.mark_write(client_key))
+    yield db
+
+
+# Scope key under which POST /batch lends its session to read sub-requests
+SHARED_READ_SESSION_KEY = "tasker.shared_read_session"
+
+
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    """Session for read-only handlers, served by a replica when one is configured."""
+    shared = request.scope.get(SHARED_READ_SESSION_KEY)
+    if shared is not None:
+        yield shared
+        return
+    replica_sessionmaker = read_router.read_sessionmaker(_client_key(request))
+    if replica_sessionmaker is None:
+        # Sessions connect lazily, so an unused primary session costs nothing
+        yield primary
+        return
+    db = replica_sessionmaker()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def add_missing_columns(connection):
+    """
+    Add columns introduced since an existing database was created.
+
+    create_all skips tables that already exist. New columns must be nullable
+    or carry a server default for SQLite's ALTER TABLE ... ADD COLUMN.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                definition = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {definition}")
+                logger.info("Added column %s.%s", table.name, column.name)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+    # Likewise add indexes introduced since an existing database was created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except exc.SQLAlchemyError as error:
+                logger.warning("Could not create index %s: %s", index.name, error)
\ No newline at end of file
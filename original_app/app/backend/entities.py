@@ -0,0 +1,109 @@
+"""
+Read-through cache of Task and User rows.
+
+The same hot tasks and users are loaded by id over and over: task pages,
+profile lookups and the permission checks in front of bids, offers,
+messages and reviews, and the multi-get endpoints. Those reads go through
+get_task and get_user (get_tasks and get_users for many ids), which keep an
+immutable snapshot of each row (a namedtuple of its columns, plus the bid
+summary for tasks) rather than a live ORM object, so a cached row can be
+shared between requests and threads and never lazy-loads or writes back.
+
+Snapshots are VersionedCache entries on the row's "task:<id>" or
+"user:<id>" scope, so any write to the row in any worker invalidates them
+(see invalidation.py). The write paths that change tasks also drop the
+local entry explicitly. Entries are evicted least recently used first and
+reloaded after a TTL at the latest.
+
+Code that modifies a row must load it from the session as usual.
+
+Configuration:
+    TASKER_ENTITY_CACHE_SIZE=10000          rows kept per entity type
+    TASKER_ENTITY_CACHE_TTL_SECONDS=300     longest time a snapshot is served
+"""
+
+import os
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from database import Task, TaskBidStats, User
+from invalidation import VersionedCache
+from multiget import load_by_ids
+
+ENTITY_CACHE_SIZE = int(os.getenv("TASKER_ENTITY_CACHE_SIZE", "10000"))
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv("TASKER_ENTITY_CACHE_TTL_SECONDS", "300"))
+
+task_cache = VersionedCache(ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL_SECONDS, name="tasks")
+user_cache = VersionedCache(ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL_SECONDS, name="users")
+
+
+def _snapshot_type(model, exclude=(), relationships=()):
+    columns = [attr.key for attr in inspect(model).column_attrs if attr.key not in exclude]
+    return namedtuple(f"{model.__name__}Snapshot", columns + list(relationships))
+
+
+TaskSnapshot = _snapshot_type(Task, relationships=("bid_stats",))
+BidStatsSnapshot = _snapshot_type(TaskBidStats)
+# Password hashes are never needed from the cache, so they are not kept
+UserSnapshot = _snapshot_type(User, exclude=("hashed_password",))
+
+
+def snapshot(snapshot_type, instance, **related):
+    """Copy the columns of ``instance`` into an immutable ``snapshot_type``."""
+    if instance is None:
+        return None
+    values = {name: related[name] if name in related else getattr(instance, name)
+              for name in snapshot_type._fields}
+    return snapshot_type(**values)
+
+
+def _task_snapshot(task: Task) -> TaskSnapshot:
+    return snapshot(TaskSnapshot, task, bid_stats=snapshot(BidStatsSnapshot, task.bid_stats))
+
+
+def _load_task(db: Session, task_id: int):
+    task = db.query(Task).filter(Task.id == task_id).first()
+    if task is None:
+        return None
+    return _task_snapshot(task)
+
+
+def get_task(db: Session, task_id: int) -> Optional[TaskSnapshot]:
+    """Snapshot of a (non-archived) task, or None if there is no such task."""
+    return task_cache.get(db, task_id, (f"task:{task_id}",), lambda: _load_task(db, task_id))
+
+
+def get_user(db: Session, user_id: int) -> Optional[UserSnapshot]:
+    """Snapshot of a user without the password hash, or None if there is no such user."""
+    return user_cache.get(
+        db, user_id, (f"user:{user_id}",),
+        lambda: snapshot(UserSnapshot, db.query(User).filter(User.id == user_id).first())
+    )
+
+
+def get_tasks(db: Session, task_ids: List[int]) -> Dict[int, TaskSnapshot]:
+    """Snapshots of the (non-archived) tasks found among ``task_ids``, by id."""
+    return task_cache.get_many(
+        db, task_ids, lambda task_id: (f"task:{task_id}",),
+        lambda missing: load_by_ids(
+            lambda chunk: map(_task_snapshot, db.query(Task).filter(Task.id.in_(chunk))), missing
+        )
+    )
+
+
+def get_users(db: Session, user_ids: List[int]) -> Dict[int, UserSnapshot]:
+    """Snapshots of the users found among ``user_ids``, by id."""
+    return user_cache.get_many(
+        db, user_ids, lambda user_id: (f"user:{user_id}",),
+        lambda missing: load_by_ids(
+            lambda chunk: (snapshot(UserSnapshot, user) for user in db.query(User).filter(User.id.in_(chunk))),
+            missing
+        )
+    )
+
+
+def invalidate_task(task_id: int):
+    task_cache.invalidate(task_id)
@@ -0,0 +1,415 @@
+"""
+Consistent snapshot export of marketplace tables to columnar files.
+
+Copying tasker.db while the API writes to it can tear: pages from before
+and after a commit end up in the same copy. export_snapshot reads a
+consistent snapshot instead, in one of two ways:
+
+    backup        copy the database with SQLite's online backup API, which
+                  holds a read lock only while the pages are copied, then
+                  export from the copy (default)
+    transaction   export straight from tasker.db inside one read
+                  transaction; no copy, but writers wait until it ends
+                  unless the database is in WAL mode
+
+Tasks, bids, offers, agreements, messages and reviews are exported, with
+the archived_* copies of the first five (see archive.py) and the messages
+packed into compressed blocks (see retention.py), inflated into a
+compacted_messages table. Rows are written in chunks of at most
+``chunk_rows`` rows, so memory use is bounded by one chunk whatever the
+table size. Each chunk is a directory under the table's name:
+
+    npy       one NumPy .npy file per column (int64, float64, bool, or
+              datetime64[us] with NaT for NULL). Strings are stored as a
+              string table: <column>.offsets.npy (int64, rows + 1) into
+              <column>.utf8. Columns with NULLs in the chunk also get
+              <column>.valid.npy (bool). Written without NumPy installed.
+    parquet   one part-NNNNN.parquet file per chunk (requires pyarrow)
+
+manifest.json, written last, records the row count, column types, chunk
+files and a watermark per table. Passing a previous export's manifest as
+``since`` exports only rows past its watermarks, so rows added or changed
+since then:
+
+    tasks, bids, offers, agreements, messages and their archived_* copies
+        (change_seq, id): every insert or update stamps the row with its
+        transaction's change number (see database.next_change), so edits
+        such as a withdrawn bid or a read message are exported again, and
+        so are counter-only changes such as a new bid_count, which leave
+        updated_at alone. A table and its archive share one watermark, so
+        rows moved to the archive in between are neither missed nor
+        exported twice.
+    reviews                 id; reviews never change
+    compacted_messages      block_id; blocks never change
+
+updated_at used to be the watermark, which missed those counter changes,
+and missed rows whose transaction committed after a newer one: updated_at
+is taken at flush time, so such a row could land below an already advanced
+watermark. Change numbers are handed out in commit order instead, so every
+change committed after an export's snapshot gets a number above anything
+the snapshot saw, and no safety lag behind the watermark is needed.
+
+Tables missing from ``since``, or tracked by other columns there (exports
+from before version 3), are exported in full.
+
+Usage:
+    python export.py OUT_DIR [--since PREVIOUS_DIR] [--format npy|parquet]
+                             [--method backup|transaction] [--database tasker.db]
+
+Configuration:
+    TASKER_EXPORT_CHUNK_ROWS=50000   rows per chunk
+"""
+
+import argparse
+import array
+import json
+import os
+import sqlite3
+import struct
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Boolean, DateTime, Float, Integer
+
+import retention
+from database import Task, Bid, Offer, Agreement, Message, Review, MessageBlock, archive_tables, engine
+
+EXPORT_CHUNK_ROWS = int(os.getenv("TASKER_EXPORT_CHUNK_ROWS", "50000"))
+
+FORMATS = ("npy", "parquet")
+METHODS = ("backup", "transaction")
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 3
+
+CHANGED = ("change_seq", "id")
+
+# Exported tables and the columns each one's watermark follows
+EXPORT_TABLES = {
+    Task: CHANGED,
+    Bid: CHANGED,
+    Offer: CHANGED,
+    Agreement: CHANGED,
+    Message: CHANGED,
+    Review: ("id",),
+}
+
+COMPACTED_MESSAGES = "compacted_messages"
+COMPACTED_WATERMARK = ("block_id",)
+
+EPOCH = datetime(1970, 1, 1)
+NAT = -2 ** 63
+
+
+def column_type(column) -> str:
+    """Export type of a model column: int64, float64, bool, timestamp[us] or string."""
+    if isinstance(column.type, Boolean):
+        return "bool"
+    if isinstance(column.type, Integer):
+        return "int64"
+    if isinstance(column.type, Float):
+        return "float64"
+    if isinstance(column.type, DateTime):
+        return "timestamp[us]"
+    return "string"
+
+
+@contextmanager
+def consistent_snapshot(database_path: str, out_dir: str, method: str = "backup") -> Iterator[sqlite3.Connection]:
+    """Yield a connection that reads one consistent state of the database."""
+    if method == "backup":
+        copy_path = os.path.join(out_dir, ".snapshot.db")
+        source = sqlite3.connect(database_path)
+        copy = sqlite3.connect(copy_path)
+        try:
+            # pages=-1 copies everything in one step, under a single read lock
+            source.backup(copy)
+        finally:
+            source.close()
+        try:
+            yield copy
+        finally:
+            copy.close()
+            os.remove(copy_path)
+    elif method == "transaction":
+        connection = sqlite3.connect(database_path, isolation_level=None)
+        try:
+            connection.execute("BEGIN")
+            yield connection
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+    else:
+        raise ValueError(f"Unknown snapshot method {method!r}; expected one of {METHODS}")
+
+
+# NumPy .npy files (format version 1.0), written without NumPy
+
+def _write_npy(path: str, descr: str, count: int, data: bytes):
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({count},), }}"
+    # The data starts on a 64-byte boundary, as NumPy itself writes it
+    padding = -(10 + len(header) + 1) % 64
+    header = (header + " " * padding + "\n").encode("latin1")
+    with open(path, "wb") as f:
+        f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header + data)
+
+
+def _packed(typecode: str, values) -> bytes:
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _microseconds(value) -> int:
+    if value is None:
+        return NAT
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def write_npy_chunk(chunk_dir: str, columns: Dict[str, str], rows: List[tuple]):
+    """Write one chunk as .npy column files and string tables."""
+    os.makedirs(chunk_dir)
+    for index, (name, kind) in enumerate(columns.items()):
+        values = [row[index] for row in rows]
+        base = os.path.join(chunk_dir, name)
+        if any(value is None for value in values) and kind != "timestamp[us]":
+            _write_npy(f"{base}.valid.npy", "|b1", len(values), bytes(value is not None for value in values))
+        if kind == "int64":
+            _write_npy(f"{base}.npy", "<i8", len(values), _packed("q", (value or 0 for value in values)))
+        elif kind == "float64":
+            data = _packed("d", (float("nan") if value is None else value for value in values))
+            _write_npy(f"{base}.npy", "<f8", len(values), data)
+        elif kind == "bool":
+            _write_npy(f"{base}.npy", "|b1", len(values), bytes(bool(value) for value in values))
+        elif kind == "timestamp[us]":
+            _write_npy(f"{base}.npy", "<M8[us]", len(values), _packed("q", map(_microseconds, values)))
+        else:
+            encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+            offsets = [0]
+            for item in encoded:
+                offsets.append(offsets[-1] + len(item))
+            _write_npy(f"{base}.offsets.npy", "<i8", len(offsets), _packed("q", offsets))
+            with open(f"{base}.utf8", "wb") as f:
+                f.write(b"".join(encoded))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow), or use --format npy")
+    return pyarrow, pyarrow.parquet
+
+
+def write_parquet_chunk(path: str, columns: Dict[str, str], rows: List[tuple]):
+    """Write one chunk as a Parquet file."""
+    pa, pq = _pyarrow()
+    types = {"int64": pa.int64(), "float64": pa.float64(), "bool": pa.bool_(),
+             "timestamp[us]": pa.timestamp("us"), "string": pa.string()}
+    arrays = []
+    for index, kind in enumerate(columns.values()):
+        values = [row[index] for row in rows]
+        if kind == "timestamp[us]":
+            values = [None if value is None else datetime.fromisoformat(value) for value in values]
+        arrays.append(pa.array(values, type=types[kind]))
+    pq.write_table(pa.Table.from_arrays(arrays, names=list(columns)), path)
+
+
+def _export_rows(
+    out_dir: str,
+    name: str,
+    format: str,
+    columns: Dict[str, str],
+    batches: Iterable[List[tuple]],
+    watermark_columns: Tuple[str, ...],
+    since: Optional[list]
+) -> dict:
+    """Write each batch of rows as a chunk under out_dir/name; returns the table's manifest entry."""
+    positions = [list(columns).index(column) for column in watermark_columns]
+    entry = {"rows": 0, "watermark_columns": list(watermark_columns), "since": since, "watermark": since,
+             "columns": columns, "chunks": []}
+    os.makedirs(os.path.join(out_dir, name))
+    for rows in batches:
+        chunk = f"part-{len(entry['chunks']):05d}"
+        if format == "parquet":
+            chunk_path = os.path.join(name, f"{chunk}.parquet")
+            write_parquet_chunk(os.path.join(out_dir, chunk_path), columns, rows)
+        else:
+            chunk_path = os.path.join(name, chunk)
+            write_npy_chunk(os.path.join(out_dir, chunk_path), columns, rows)
+        entry["chunks"].append({"path": chunk_path, "rows": len(rows)})
+        entry["rows"] += len(rows)
+        entry["watermark"] = [rows[-1][position] for position in positions]
+    return entry
+
+
+def export_table(
+    connection: sqlite3.Connection,
+    table,
+    out_dir: str,
+    format: str,
+    chunk_rows: int,
+    watermark_columns: Tuple[str, ...],
+    since: Optional[list] = None
+) -> dict:
+    """
+    Export one table's rows past ``since`` in chunks, in watermark order.
+
+    Returns:
+        The table's manifest entry
+    """
+    columns = {column.name: column_type(column) for column in table.columns}
+    key = ", ".join(watermark_columns)
+    query = f"SELECT {', '.join(columns)} FROM {table.name}"
+    parameters = ()
+    if since is not None:
+        query += f" WHERE ({key}) > ({', '.join('?' * len(since))})"
+        parameters = tuple(since)
+    query += f" ORDER BY {key}"
+    cursor = connection.execute(query, parameters)
+    batches = iter(lambda: cursor.fetchmany(chunk_rows), [])
+    return _export_rows(out_dir, table.name, format, columns, batches, watermark_columns, since)
+
+
+def export_compacted_messages(
+    connection: sqlite3.Connection,
+    out_dir: str,
+    format: str,
+    chunk_rows: int,
+    since: Optional[list] = None
+) -> dict:
+    """
+    Export the messages of compressed blocks past ``since``, one row per
+    message with the id of its block, inflating one block at a time.
+
+    Returns:
+        The table's manifest entry
+    """
+    message_columns = {column.name: column_type(column) for column in Message.__table__.columns}
+    columns = {"block_id": "int64"}
+    columns.update((name, message_columns[name]) for name in ("id", "sender_id", "receiver_id", "task_id",
+                                                              "content", "read", "created_at"))
+    table = MessageBlock.__tablename__
+    if since is None:
+        cursor = connection.execute(f"SELECT id, payload FROM {table} ORDER BY id")
+    else:
+        cursor = connection.execute(f"SELECT id, payload FROM {table} WHERE id > ? ORDER BY id", tuple(since))
+
+    def batches():
+        rows = []
+        for block_id, payload in cursor:
+            for message in retention.decode_rows(payload):
+                rows.append((block_id,) + tuple(message[name] for name in list(columns)[1:]))
+                if len(rows) == chunk_rows:
+                    yield rows
+                    rows = []
+        if rows:
+            yield rows
+
+    return _export_rows(out_dir, COMPACTED_MESSAGES, format, columns, batches(), COMPACTED_WATERMARK, since)
+
+
+def previous_watermark(since: Optional[dict], names: List[str], watermark_columns: Tuple[str, ...]):
+    """The furthest watermark a previous export reached over tables ``names``, or None."""
+    if since is None:
+        return None
+    watermarks = [
+        entry["watermark"] for entry in (since["tables"].get(name) for name in names)
+        if entry and entry.get("watermark_columns") == list(watermark_columns) and entry["watermark"] is not None
+    ]
+    return max(watermarks) if watermarks else None
+
+
+def load_manifest(export_dir: str) -> dict:
+    with open(os.path.join(export_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def export_snapshot(
+    out_dir: str,
+    database_path: Optional[str] = None,
+    format: str = "npy",
+    method: str = "backup",
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    since: Optional[dict] = None
+) -> dict:
+    """
+    Export a consistent snapshot of the marketplace tables to ``out_dir``.
+
+    Args:
+        out_dir: New or empty directory for the export
+        database_path: SQLite file to export (default: the app's database)
+        format: "npy" or "parquet"
+        method: "backup" or "transaction" (see module docstring)
+        chunk_rows: Maximum rows per chunk file
+        since: Manifest of a previous export; only rows past its
+            watermarks are exported
+
+    Returns:
+        The manifest, also written to out_dir/manifest.json
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format {format!r}; expected one of {FORMATS}")
+    if format == "parquet":
+        _pyarrow()
+    database_path = database_path or engine.url.database
+    os.makedirs(out_dir, exist_ok=True)
+    if os.listdir(out_dir):
+        raise ValueError(f"Export directory {out_dir} is not empty")
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+        "source": os.path.abspath(database_path),
+        "method": method,
+        "format": format,
+        "chunk_rows": chunk_rows,
+        "tables": {},
+    }
+    with consistent_snapshot(database_path, out_dir, method) as connection:
+        for model, watermark_columns in EXPORT_TABLES.items():
+            tables = [model.__table__]
+            if model.__tablename__ in archive_tables:
+                tables.append(archive_tables[model.__tablename__])
+            previous = previous_watermark(since, [table.name for table in tables], watermark_columns)
+            for table in tables:
+                manifest["tables"][table.name] = export_table(
+                    connection, table, out_dir, format, chunk_rows, watermark_columns, previous
+                )
+        previous = previous_watermark(since, [COMPACTED_MESSAGES], COMPACTED_WATERMARK)
+        manifest["tables"][COMPACTED_MESSAGES] = export_compacted_messages(
+            connection, out_dir, format, chunk_rows, previous
+        )
+
+    # Written last and atomically: an export without a manifest is incomplete
+    partial = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(partial, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(partial, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a consistent snapshot of tasker.db to columnar files")
+    parser.add_argument("out_dir")
+    parser.add_argument("--since", help="Previous export directory; export only rows past its watermarks")
+    parser.add_argument("--format", choices=FORMATS, default="npy")
+    parser.add_argument("--method", choices=METHODS, default="backup")
+    parser.add_argument("--database", help="SQLite file to export (default: the app's database)")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+    result = export_snapshot(
+        args.out_dir,
+        database_path=args.database,
+        format=args.format,
+        method=args.method,
+        chunk_rows=args.chunk_rows,
+        since=load_manifest(args.since) if args.since else None
+    )
+    for name, table in result["tables"].items():
+        print(f"{name}: {table['rows']} rows in {len(table['chunks'])} chunks")
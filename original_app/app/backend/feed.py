@@ -0,0 +1,299 @@
+"""
+Personalized open-task feeds for taskers.
+
+Each tasker's feed is materialized as FeedEntry rows: one row per open task
+with a precomputed score, so a page of the feed is an index seek on
+(tasker_id, score, task_id) however many tasks are open.
+
+Scores do not decay. Recency is the task's creation time in hours divided
+by FEED_RECENCY_HOURS, and each of three match signals adds up to 1:
+
+    budget    the budget covers TYPICAL_TASK_HOURS at the tasker's hourly rate
+    location  the task is in the tasker's city
+    skills    the title or description mentions two of the tasker's skills
+
+A perfect match therefore outranks a task with no match posted up to three
+FEED_RECENCY_HOURS later. Because stored scores never go stale, feeds are
+maintained incrementally: closed tasks are removed in the transaction that
+closes them, and new or edited tasks are queued as a "feed.add_task" job
+(see jobs.py) that inserts them into every materialized feed, so posting a
+task does not wait on the fan-out. Nothing else has to be rescored.
+
+A feed holds the tasker's best FEED_SIZE tasks. The fan-out inserts a task
+FEED_FANOUT_BATCH_SIZE feeds at a time, committing each batch and trimming
+those feeds back to FEED_SIZE, so neither the feeds nor the fan-out's
+transactions grow with the number of open tasks and taskers.
+
+A background builder materializes feeds for taskers who have none yet and
+rebuilds feeds older than FEED_MAX_AGE_SECONDS to pick up profile changes
+and refill feeds that closed tasks have shrunk. Until a tasker's feed
+exists it is ranked on demand. Either way only candidate tasks are scored:
+match signals add at most MAX_MATCH_SCORE, so an open task posted more than
+MAX_MATCH_SCORE * FEED_RECENCY_HOURS before the FEED_SIZE-th newest one can
+never make a top FEED_SIZE. Candidates are read newest first on
+ix_tasks_status_created, at most FEED_CANDIDATES of them.
+
+Configuration:
+    TASKER_FEED_RECENCY_HOURS=24           hours of recency worth one match signal
+    TASKER_FEED_INTERVAL_SECONDS=60        background builder interval (0 = off)
+    TASKER_FEED_MAX_AGE_SECONDS=3600       rebuild feeds older than this
+    TASKER_FEED_SIZE=500                   tasks kept in each feed
+    TASKER_FEED_FANOUT_BATCH_SIZE=500      feeds a new task is added to per transaction
+    TASKER_FEED_CANDIDATES=5000            most open tasks scored for one feed
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from database import FeedEntry, FeedState, Task, TaskStatus, User, UserRole
+from jobs import enqueue, job
+
+FEED_RECENCY_HOURS = float(os.getenv("TASKER_FEED_RECENCY_HOURS", "24"))
+FEED_INTERVAL_SECONDS = float(os.getenv("TASKER_FEED_INTERVAL_SECONDS", "60"))
+FEED_MAX_AGE_SECONDS = float(os.getenv("TASKER_FEED_MAX_AGE_SECONDS", "3600"))
+FEED_SIZE = int(os.getenv("TASKER_FEED_SIZE", "500"))
+FEED_FANOUT_BATCH_SIZE = int(os.getenv("TASKER_FEED_FANOUT_BATCH_SIZE", "500"))
+FEED_CANDIDATES = int(os.getenv("TASKER_FEED_CANDIDATES", "5000"))
+
+# Hours of work a typical task is assumed to take when judging its budget
+TYPICAL_TASK_HOURS = 2.0
+
+# Budget, location and skills each add at most 1 to a task's score
+MAX_MATCH_SCORE = 3.0
+
+EPOCH = datetime(1970, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+
+class FeedItem(NamedTuple):
+    score: float
+    task: Task
+
+
+def city_of(location: Optional[str]) -> str:
+    """Normalized city part of a free-text location ("Austin, TX" -> "austin")."""
+    return (location or "").split(",")[0].strip().casefold()
+
+
+def _skills(tasker) -> List[str]:
+    return [skill.strip().casefold() for skill in (tasker.skills or "").split(",") if skill.strip()]
+
+
+def score_task(tasker, task) -> float:
+    """
+    Rank a task for a tasker; higher is better.
+
+    Args:
+        tasker: Anything with skills, hourly_rate and location attributes
+        task: Anything with created_at, budget, location, title and description
+    """
+    recency = (task.created_at - EPOCH).total_seconds() / 3600 / FEED_RECENCY_HOURS
+
+    if tasker.hourly_rate:
+        budget = min(task.budget / (tasker.hourly_rate * TYPICAL_TASK_HOURS), 1.0)
+    else:
+        budget = 0.5
+
+    city = city_of(tasker.location)
+    location = 1.0 if city and city == city_of(task.location) else 0.0
+
+    # Two matching skills (or all of them, if fewer) count as a full match
+    wanted = _skills(tasker)
+    text = f"{task.title} {task.description}".casefold()
+    matched = sum(1 for skill in wanted if skill in text)
+    skills = min(matched, 2) / min(len(wanted), 2) if wanted else 0.0
+
+    return recency + budget + location + skills
+
+
+def _open_tasks(db: Session):
+    return db.query(Task).filter(Task.status == TaskStatus.OPEN)
+
+
+def candidate_tasks(db: Session) -> List[Task]:
+    """The open tasks that can make anyone's top FEED_SIZE, newest first."""
+    newest = _open_tasks(db).order_by(Task.created_at.desc())
+    last = newest.with_entities(Task.created_at).offset(FEED_SIZE - 1).limit(1).scalar()
+    if last is not None:
+        newest = newest.filter(Task.created_at >= last - timedelta(hours=MAX_MATCH_SCORE * FEED_RECENCY_HOURS))
+    return newest.limit(FEED_CANDIDATES).all()
+
+
+def rank_open_tasks(db: Session, tasker: User, candidates: Optional[List[Task]] = None) -> List[FeedItem]:
+    """A tasker's best FEED_SIZE open tasks, best first, from ``candidates`` (default: candidate_tasks)."""
+    if candidates is None:
+        candidates = candidate_tasks(db)
+    items = [FeedItem(score_task(tasker, task), task) for task in candidates]
+    items.sort(key=lambda item: (item.score, item.task.id), reverse=True)
+    return items[:FEED_SIZE]
+
+
+def build_feed(db: Session, tasker: User, candidates: Optional[List[Task]] = None):
+    """Rematerialize one tasker's feed from ``candidates`` (default: candidate_tasks); the caller commits."""
+    db.query(FeedEntry).filter(FeedEntry.tasker_id == tasker.id).delete(synchronize_session=False)
+    rows = [
+        {"tasker_id": tasker.id, "task_id": item.task.id, "score": item.score}
+        for item in rank_open_tasks(db, tasker, candidates)
+    ]
+    if rows:
+        db.execute(insert(FeedEntry), rows)
+    state = db.get(FeedState, tasker.id) or FeedState(tasker_id=tasker.id)
+    state.built_at = datetime.utcnow()
+    db.add(state)
+
+
+def trim_feeds(db: Session, tasker_ids: List[int]):
+    """Drop entries ranked below FEED_SIZE from the given taskers' feeds; the caller commits."""
+    ranked = db.query(
+        FeedEntry.tasker_id,
+        FeedEntry.task_id,
+        func.row_number().over(
+            partition_by=FeedEntry.tasker_id, order_by=(FeedEntry.score.desc(), FeedEntry.task_id.desc())
+        ).label("rank")
+    ).filter(FeedEntry.tasker_id.in_(tasker_ids)).subquery()
+    overflow = select(ranked.c.tasker_id, ranked.c.task_id).where(ranked.c.rank > FEED_SIZE)
+    db.execute(delete(FeedEntry).where(tuple_(FeedEntry.tasker_id, FeedEntry.task_id).in_(overflow)))
+
+
+def add_task(db: Session, task: Task, batch_size: int = FEED_FANOUT_BATCH_SIZE):
+    """
+    Insert an open task into every materialized feed, committing after each
+    batch of ``batch_size`` feeds. A task that ranks below a full feed's
+    last entry is trimmed right away.
+    """
+    last_id = 0
+    while True:
+        taskers = db.query(User).join(FeedState, FeedState.tasker_id == User.id).filter(
+            User.id > last_id
+        ).order_by(User.id).limit(batch_size).all()
+        if not taskers:
+            return
+        tasker_ids = [tasker.id for tasker in taskers]
+        try:
+            db.execute(insert(FeedEntry), [
+                {"tasker_id": tasker.id, "task_id": task.id, "score": score_task(tasker, task)}
+                for tasker in taskers
+            ])
+            trim_feeds(db, tasker_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        last_id = tasker_ids[-1]
+
+
+@job("feed.add_task")
+def add_task_job(db: Session, task_id: int):
+    task = db.get(Task, task_id)
+    if task is not None and task.status == TaskStatus.OPEN:
+        # Remove first so a retried or re-run job does not duplicate rows;
+        # the removal commits with add_task's first batch
+        remove_task(db, task_id)
+        add_task(db, task)
+
+
+def queue_task(db: Session, task_id: int):
+    """Queue a new or edited open task for fan-out to the feeds."""
+    enqueue(db, "feed.add_task", task_id=task_id)
+
+
+def remove_task(db: Session, task_id: int):
+    """Drop a task from every feed; the caller commits."""
+    db.query(FeedEntry).filter(FeedEntry.task_id == task_id).delete(synchronize_session=False)
+
+
+def sync_task(db: Session, task: Task):
+    """Drop an edited task from the feeds and queue it again if still open; the caller commits."""
+    remove_task(db, task.id)
+    if task.status == TaskStatus.OPEN:
+        queue_task(db, task.id)
+
+
+def read_feed(db: Session, tasker: User, after: Optional[Sequence] = None, limit: int = 20) -> List[FeedItem]:
+    """
+    One page of a tasker's feed.
+
+    Args:
+        after: (score, task_id) of the last item already seen, if any
+        limit: Maximum number of items returned
+
+    Served from the materialized feed when it exists, otherwise ranked on
+    demand from the open tasks.
+    """
+    if db.get(FeedState, tasker.id) is None:
+        items = rank_open_tasks(db, tasker)
+        if after is not None:
+            after = tuple(after)
+            items = [item for item in items if (item.score, item.task.id) < after]
+        return items[:limit]
+
+    query = db.query(FeedEntry.score, Task).join(Task, Task.id == FeedEntry.task_id).filter(
+        FeedEntry.tasker_id == tasker.id,
+        Task.status == TaskStatus.OPEN
+    )
+    if after is not None:
+        query = query.filter(tuple_(FeedEntry.score, FeedEntry.task_id) < tuple_(*after))
+    rows = query.order_by(FeedEntry.score.desc(), FeedEntry.task_id.desc()).limit(limit)
+    return [FeedItem(score, task) for score, task in rows]
+
+
+def build_stale_feeds(db: Session, max_age: float = FEED_MAX_AGE_SECONDS) -> int:
+    """
+    Build feeds for taskers who have none or whose feed is older than
+    ``max_age`` seconds, committing after each tasker.
+
+    Returns:
+        Number of feeds built
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    taskers = db.query(User).outerjoin(FeedState, FeedState.tasker_id == User.id).filter(
+        User.role == UserRole.TASKER,
+        (FeedState.built_at == None) | (FeedState.built_at < cutoff)
+    ).all()
+    if not taskers:
+        return 0
+    # One candidate list for the whole sweep, detached so the per-tasker
+    # commits do not expire and reload it
+    candidates = candidate_tasks(db)
+    for task in candidates:
+        db.expunge(task)
+    for tasker in taskers:
+        try:
+            build_feed(db, tasker, candidates)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return len(taskers)
+
+
+def start_feed_builder(
+    session_factory: Callable[[], Session],
+    interval: float = FEED_INTERVAL_SECONDS
+) -> Optional[threading.Thread]:
+    """Start a daemon thread that builds missing and stale feeds every ``interval`` seconds."""
+    if interval <= 0:
+        return None
+
+    def sweep():
+        while True:
+            db = session_factory()
+            try:
+                build_stale_feeds(db)
+            except Exception:
+                logger.exception("Feed build sweep failed")
+            finally:
+                db.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="feed-builder", daemon=True)
+    thread.start()
+    return thread
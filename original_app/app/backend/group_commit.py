@@ -0,0 +1,157 @@
+"""
+Group-commit write batching for high-frequency inserts.
+
+SQLite allows a single writer and pays an fsync per commit, so committing
+every chat message on its own caps throughput during busy hours. The
+GroupCommitBatcher collects inserts from concurrent request threads for a
+short window and commits them in one transaction. Each caller blocks on a
+future that resolves only once its batch is durable, so the API contract
+(the row exists when the response is sent) is unchanged. A caller that
+gives up waiting withdraws its row if the worker has not picked it up yet,
+so a request that failed never leaves its row behind to be duplicated by
+the client's retry.
+
+Batching is opt-in:
+    TASKER_MESSAGE_BATCHING=1             enable batching for message inserts
+    TASKER_MESSAGE_BATCH_WINDOW_MS=5      max extra latency added per insert
+    TASKER_MESSAGE_BATCH_MAX=200          max rows per commit
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+MESSAGE_BATCHING_ENABLED = os.getenv("TASKER_MESSAGE_BATCHING", "0") == "1"
+MESSAGE_BATCH_WINDOW_MS = float(os.getenv("TASKER_MESSAGE_BATCH_WINDOW_MS", "5"))
+MESSAGE_BATCH_MAX = int(os.getenv("TASKER_MESSAGE_BATCH_MAX", "200"))
+
+_STOP = object()
+
+
+class GroupCommitBatcher:
+    """
+    Commits ORM inserts from many threads in shared transactions.
+
+    A single daemon worker thread drains the queue: it waits for the first
+    pending insert, then keeps collecting until ``window_ms`` has passed or
+    ``max_batch`` rows are queued, and commits them together.
+
+    Args:
+        session_factory: Callable returning a new Session (e.g. SessionLocal)
+        window_ms: Longest time the first row of a batch waits for company
+        max_batch: Largest number of rows committed in one transaction
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[..., Session],
+        window_ms: float = MESSAGE_BATCH_WINDOW_MS,
+        max_batch: int = MESSAGE_BATCH_MAX
+    ):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, instance, timeout: float = 10.0):
+        """
+        Queue an unsaved ORM instance and wait until it has been committed.
+
+        Returns:
+            The persisted instance, detached but with all column
+            attributes (including generated id and defaults) loaded
+
+        Raises:
+            TimeoutError if the row was still queued after ``timeout``
+            seconds; it has been withdrawn and will not be committed
+            Whatever the commit raised if this row could not be stored
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((instance, future))
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            # The worker is already committing it; the outcome is moments away
+            return future.result()
+
+    def stop(self):
+        """Flush pending inserts and stop the worker thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: List[Tuple[object, Future]]):
+        # Skip rows whose caller timed out; the rest can no longer be withdrawn
+        batch = [(instance, future) for instance, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            self._commit_rows([instance for instance, _ in batch])
+        except Exception:
+            # Retry row by row so one bad insert doesn't fail its neighbours
+            for instance, future in batch:
+                try:
+                    self._commit_rows([instance])
+                except Exception as exc:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(instance)
+            return
+        for instance, future in batch:
+            future.set_result(instance)
+
+    def _commit_rows(self, instances: list):
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            db.add_all(instances)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
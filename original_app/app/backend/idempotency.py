@@ -0,0 +1,348 @@
+"""
+Idempotency-Key support for create endpoints.
+
+Mobile clients on flaky networks retry POSTs, and a retry used to repeat
+every validation query and often create a duplicate row. When a request to
+one of the create endpoints carries an ``Idempotency-Key`` header, the
+first response is stored and any retry with the same key (from the same
+caller) is answered from the store without reaching the handler.
+
+The caller is the subject of the bearer token, so a retry made after the
+client renewed its access token still finds the stored response. Requests
+without a valid token are passed through untouched (the handler rejects
+them) rather than storing their 401 against the key.
+
+Stored responses live in the idempotency_keys table behind an in-memory LRU,
+and expire after TASKER_IDEMPOTENCY_TTL_SECONDS. Before running the handler
+a worker reserves the key by inserting a pending row; the primary key makes
+that claim atomic across processes. Concurrent requests with the same key
+wait for the worker holding it and replay its result, polling the store
+with reads only; they try to reserve the key again only once the
+reservation is gone. A reservation whose worker died lapses after
+TASKER_IDEMPOTENCY_LEASE_SECONDS. Reusing a key
+with a different request body is rejected with 422.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+
+from auth import token_subject
+from database import IdempotencyRecord
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("TASKER_IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("TASKER_IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("TASKER_IDEMPOTENCY_LEASE_SECONDS", "60"))
+
+# status_code of a reserved key whose response is not stored yet
+PENDING = 0
+
+# How often a request waiting on another worker's reservation checks the store
+RESERVATION_POLL_SECONDS = 0.05
+
+# POST routes that honour Idempotency-Key
+IDEMPOTENT_PATHS = (
+    re.compile(r"^/tasks$"),
+    re.compile(r"^/bids$"),
+    re.compile(r"^/offers$"),
+    re.compile(r"^/messages$"),
+    re.compile(r"^/tasks/\d+/messages$"),
+)
+
+# Expired rows are purged from the table once every this many stores
+PURGE_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    content_type: Optional[str]
+    body: bytes
+    expires_at: datetime
+
+
+class IdempotencyStore:
+    """
+    Idempotency records in SQLite with an LRU of recent keys in front.
+
+    Args:
+        session_factory: Callable returning a new Session
+        ttl_seconds: How long a stored response can be replayed
+        cache_size: Number of records kept in memory
+        lease_seconds: How long a reservation holds a key without a response
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+        cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+        lease_seconds: int = IDEMPOTENCY_LEASE_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.lease = timedelta(seconds=lease_seconds)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        """Return the unexpired stored response for a key, if any."""
+        now = datetime.utcnow()
+        with self._lock:
+            stored = self._cache.get(key)
+            if stored is not None:
+                if stored.expires_at > now:
+                    self._cache.move_to_end(key)
+                    return stored
+                del self._cache[key]
+
+        db = self.session_factory()
+        try:
+            record = db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code != PENDING,
+                IdempotencyRecord.expires_at > now
+            ).first()
+            if record is None:
+                return None
+            stored = StoredResponse(
+                record.fingerprint, record.status_code, record.content_type,
+                record.body, record.expires_at
+            )
+        finally:
+            db.close()
+        self._remember(key, stored)
+        return stored
+
+    def reserve(self, key: str, fingerprint: str) -> bool:
+        """
+        Claim a key for this worker by inserting a pending record.
+
+        Returns False if another request, in this process or any other,
+        holds an unexpired record for the key. Expired records, including
+        reservations whose worker never stored a response, are replaced.
+        """
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.expires_at <= now
+            ).delete(synchronize_session=False)
+            db.add(IdempotencyRecord(
+                key=key,
+                fingerprint=fingerprint,
+                status_code=PENDING,
+                body=b"",
+                expires_at=now + self.lease
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return False
+            return True
+        finally:
+            db.close()
+
+    def reserved(self, key: str) -> bool:
+        """Whether a request holds an unexpired reservation on the key; only reads."""
+        db = self.session_factory()
+        try:
+            return db.query(IdempotencyRecord.key).filter(
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code == PENDING,
+                IdempotencyRecord.expires_at > datetime.utcnow()
+            ).first() is not None
+        finally:
+            db.close()
+
+    def release(self, key: str):
+        """Drop this worker's reservation so the key can be retried."""
+        db = self.session_factory()
+        try:
+            db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code == PENDING
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def put(self, key: str, fingerprint: str, status_code: int, content_type: Optional[str], body: bytes):
+        """Store a response for a key, replacing its reservation or any expired record."""
+        stored = StoredResponse(
+            fingerprint, status_code, content_type, body, datetime.utcnow() + self.ttl
+        )
+        db = self.session_factory()
+        try:
+            db.merge(IdempotencyRecord(
+                key=key,
+                fingerprint=fingerprint,
+                status_code=status_code,
+                content_type=content_type,
+                body=body,
+                expires_at=stored.expires_at
+            ))
+            db.commit()
+            self._stores += 1
+            if self._stores % PURGE_EVERY == 0:
+                self.purge_expired(db)
+        finally:
+            db.close()
+        self._remember(key, stored)
+
+    def purge_expired(self, db: Session) -> int:
+        """Delete expired records from the table; returns rows removed."""
+        removed = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return removed
+
+    def _remember(self, key: str, stored: StoredResponse):
+        with self._lock:
+            self._cache[key] = stored
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying stored responses for repeated Idempotency-Keys."""
+
+    def __init__(self, app, store: IdempotencyStore, paths: Iterable = IDEMPOTENT_PATHS):
+        self.app = app
+        self.store = store
+        self.paths = tuple(paths)
+        self._in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not any(path.match(scope["path"]) for path in self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+        client_key = _header(scope, b"idempotency-key")
+        if not client_key:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = _header(scope, b"authorization")
+        caller = token_subject(authorization.decode("latin-1") if authorization else None)
+        if caller is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        key = hashlib.sha256(caller.encode() + b"\0" + client_key).hexdigest()
+        fingerprint = hashlib.sha256(
+            scope["path"].encode() + b"\0" + body
+        ).hexdigest()
+
+        while True:
+            stored = await run_in_threadpool(self.store.get, key)
+            if stored is not None:
+                await self._replay(stored, fingerprint, scope, receive, send)
+                return
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                # Same key already running in this process: wait for it and replay its response
+                await in_flight.wait()
+                continue
+            done = self._in_flight[key] = asyncio.Event()
+            try:
+                if await run_in_threadpool(self.store.reserve, key, fingerprint):
+                    await self._run_and_store(key, fingerprint, body, scope, send)
+                    return
+            finally:
+                del self._in_flight[key]
+                done.set()
+            # Another worker holds the key: wait for its response or for its
+            # lease to lapse without taking the write lock on every poll
+            await asyncio.sleep(RESERVATION_POLL_SECONDS)
+            while await run_in_threadpool(self.store.reserved, key):
+                await asyncio.sleep(RESERVATION_POLL_SECONDS)
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _replay(self, stored: StoredResponse, fingerprint: str, scope, receive, send):
+        if stored.fingerprint != fingerprint:
+            response = JSONResponse(
+                status_code=422,
+                content={"detail": "Idempotency-Key was already used with a different request"}
+            )
+        else:
+            response = Response(
+                content=stored.body,
+                status_code=stored.status_code,
+                media_type=stored.content_type,
+                headers={"Idempotent-Replayed": "true"}
+            )
+        await response(scope, receive, send)
+
+    async def _run_and_store(self, key: str, fingerprint: str, body: bytes, scope, send):
+        sent_body = False
+
+        async def replay_receive():
+            nonlocal sent_body
+            if sent_body:
+                # Nothing more to read; behave like an idle connection
+                return {"type": "http.disconnect"}
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status_code = 500
+        content_type = None
+        chunks = []
+
+        async def capture_send(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = _header(message, b"content-type")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            # Server errors are not stored so the client can retry them
+            if status_code < 500:
+                await run_in_threadpool(
+                    self.store.put, key, fingerprint, status_code,
+                    content_type.decode("latin-1") if content_type else None,
+                    b"".join(chunks)
+                )
+            else:
+                await run_in_threadpool(self.store.release, key)
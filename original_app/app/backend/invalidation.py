@@ -0,0 +1,215 @@
+"""
+Cross-worker invalidation for in-process caches.
+
+Several uvicorn workers share tasker.db, so a value cached in one worker's
+memory goes stale as soon as another worker writes. Each cached value is
+therefore tagged with the versions of the scopes it was computed from
+("user:12", "relations:7", ...), read from the cache_versions table just
+before the value was loaded. Reads check those versions and serve the
+cached value only if none of them has moved.
+
+A session reads each version at most once per transaction, so the lookups
+of one request (a permission check, then the task, then its customer) share
+a single round trip for what they have in common, and get_many checks a
+whole list of keys with one query. Writes made through the session (flushes
+and ORM-enabled UPDATE/DELETE/INSERT statements) and the end of the
+transaction forget what was read.
+
+Versions are bumped by SQLite triggers on the tables the caches read (see
+database.CACHE_TRIGGER_SCOPES), so every write counts, whichever worker,
+job or maintenance task makes it, and the bump commits or rolls back with
+the write itself. Writes to anything else a cache depends on call bump()
+in their own transaction.
+
+The "*" row holds a random generation set when the table is created, so
+entries cached against a database that has since been recreated at the
+same path never match.
+
+Look values up before writing in the same session: versions read inside a
+transaction that later rolls back can be reached again by other writes.
+
+Named caches are listed by cache_stats, which GET /health/caches serves.
+
+Configuration:
+    TASKER_CACHE_SIZE=10000   entries kept per cache
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database import CacheVersion
+
+CACHE_SIZE = int(os.getenv("TASKER_CACHE_SIZE", "10000"))
+
+GENERATION_SCOPE = "*"
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Session.info key of the versions read in the current transaction
+_SESSION_VERSIONS = "cache_versions"
+
+# Named caches, for cache_stats
+CACHES: Dict[str, "VersionedCache"] = {}
+
+
+def bump(db: Session, *scopes: str):
+    """Invalidate ``scopes`` in every worker once the caller commits."""
+    for scope in scopes:
+        db.execute(
+            insert(CacheVersion)
+            .values(scope=scope, version=1)
+            .on_conflict_do_update(
+                index_elements=[CacheVersion.scope],
+                set_={"version": CacheVersion.version + 1}
+            )
+        )
+
+
+def current_versions(db: Session, scopes: Iterable[str]) -> Tuple[int, ...]:
+    """Versions of the generation and of ``scopes``, in that order; 0 if never bumped."""
+    wanted = (GENERATION_SCOPE, *scopes)
+    known = db.info.setdefault(_SESSION_VERSIONS, {})
+    unknown = [scope for scope in dict.fromkeys(wanted) if scope not in known]
+    if unknown:
+        found = dict(
+            db.query(CacheVersion.scope, CacheVersion.version).filter(CacheVersion.scope.in_(unknown)).all()
+        )
+        for scope in unknown:
+            known[scope] = found.get(scope, 0)
+    return tuple(known[scope] for scope in wanted)
+
+
+def _forget_versions(session: Session, *args):
+    session.info.pop(_SESSION_VERSIONS, None)
+
+
+def _forget_versions_on_write(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        _forget_versions(state.session)
+
+
+event.listen(Session, "after_flush", _forget_versions)
+event.listen(Session, "after_transaction_end", _forget_versions)
+event.listen(Session, "do_orm_execute", _forget_versions_on_write)
+
+
+class VersionedCache:
+    """
+    LRU of loaded values, each valid while the versions of its scopes are
+    unchanged.
+
+    Args:
+        size: Number of entries kept in memory
+        ttl: Seconds an entry is served before it is reloaded regardless
+            (None = until its versions change or it is evicted)
+        name: Registers the cache under this name for cache_stats
+    """
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.size = size
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if name is not None:
+            CACHES[name] = self
+
+    def get(self, db: Session, key: Hashable, scopes: Sequence[str], load: Callable[[], V]) -> V:
+        """
+        Return the cached value for ``key``, calling ``load`` if there is
+        none or if any of ``scopes`` has changed since it was loaded.
+        """
+        versions = current_versions(db, scopes)
+        now = time.monotonic()
+        found, _ = self._lookup({key: versions}, now)
+        if key in found:
+            return found[key]
+        value = load()
+        self._store({key: value}, {key: versions}, now)
+        return value
+
+    def get_many(
+        self,
+        db: Session,
+        keys: Sequence[K],
+        scopes_of: Callable[[K], Sequence[str]],
+        load_many: Callable[[List[K]], Dict[K, V]]
+    ) -> Dict[K, V]:
+        """
+        Values for ``keys``: cached ones whose scopes are unchanged, the rest
+        from one ``load_many`` call, which returns the values it found by
+        key. Versions for all keys are read in one query. Keys that
+        ``load_many`` leaves out are cached as None and not returned.
+        """
+        scopes = {key: tuple(scopes_of(key)) for key in keys}
+        current_versions(db, [scope for key_scopes in scopes.values() for scope in key_scopes])
+        versions = {key: current_versions(db, key_scopes) for key, key_scopes in scopes.items()}
+        now = time.monotonic()
+        found, missing = self._lookup(versions, now)
+        if missing:
+            loaded = load_many(missing)
+            self._store({key: loaded.get(key) for key in missing}, versions, now)
+            found.update(loaded)
+        return {key: value for key, value in found.items() if value is not None}
+
+    def _lookup(self, versions: Dict[Hashable, tuple], now: float) -> Tuple[dict, list]:
+        found, missing = {}, []
+        with self._lock:
+            for key, key_versions in versions.items():
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == key_versions and entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[key] = entry[1]
+                else:
+                    self.misses += 1
+                    missing.append(key)
+        return found, missing
+
+    def _store(self, values: dict, versions: Dict[Hashable, tuple], now: float):
+        expires = now + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (versions[key], value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop this worker's entry for ``key``; other workers see the version bump."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+def cache_stats() -> List[dict]:
+    """Hit/miss counters of every named cache in this worker."""
+    return [cache.stats() for cache in CACHES.values()]
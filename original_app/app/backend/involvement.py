@@ -0,0 +1,153 @@
+"""
+The tasks a user is involved in, resolved in one query.
+
+A customer is involved in the tasks they posted. A tasker is involved in a
+task through a bid, an offer or an agreement, often several at once. The
+involvements are gathered with a UNION ALL over the bids, offers and
+agreements tables, each branch an index range scan on its
+(tasker_id, task_id) index, grouped per task and joined to the tasks
+table. A tasker's whole dashboard, or one page of it, is a single round trip
+no matter how many bids they have placed.
+
+Closed tasks move to the archive_* tables together with their bids, offers
+and agreements (see archive.py), so the same query runs once more over the
+archive and the two id-ordered halves are merged.
+
+Each task carries the ways the user is involved in it, e.g.
+``["bid", "agreement"]``.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Row, Table, case, distinct, func, literal, select, union_all
+from sqlalchemy.orm import Query, Session
+
+from fieldsets import load_fields
+from database import Task, Bid, Offer, Agreement, TaskStatus, User, UserRole, archive_tables
+
+OWNER = "owner"
+
+# Involvement types a tasker can have, in the order they are reported
+TASKER_INVOLVEMENT = {
+    "bid": Bid,
+    "offer": Offer,
+    "agreement": Agreement,
+}
+
+INVOLVEMENT_TYPES = (OWNER, *TASKER_INVOLVEMENT)
+
+HOT_TABLES = {model.__tablename__: model.__table__ for model in (Task, *TASKER_INVOLVEMENT.values())}
+
+
+def _involvement(user: User, involvement: Optional[str], tables: Dict[str, Table] = HOT_TABLES):
+    """(task_id, involvement) for every task the user is involved in, over ``tables`` by name."""
+    if user.role == UserRole.CUSTOMER:
+        tasks = tables[Task.__tablename__]
+        branches = [
+            select(tasks.c.id.label("task_id"), literal(OWNER).label("kind")).where(tasks.c.customer_id == user.id)
+        ]
+    else:
+        branches = []
+        for kind, model in TASKER_INVOLVEMENT.items():
+            table = tables[model.__tablename__]
+            branches.append(
+                select(table.c.task_id.label("task_id"), literal(kind).label("kind"))
+                .where(table.c.tasker_id == user.id)
+            )
+    involved = union_all(*branches).subquery()
+    query = select(
+        involved.c.task_id,
+        func.group_concat(distinct(involved.c.kind)).label("involvement")
+    ).group_by(involved.c.task_id)
+    if involvement:
+        # Filter per task rather than per branch so the task still reports
+        # all of its involvements
+        query = query.having(func.sum(case((involved.c.kind == involvement, 1), else_=0)) > 0)
+    return query.subquery()
+
+
+def involved_tasks(
+    db: Session,
+    user: User,
+    status: Optional[TaskStatus] = None,
+    involvement: Optional[str] = None,
+    after_id: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Query:
+    """
+    Query the user's tasks in id order, as (Task, involvement) rows.
+
+    Args:
+        db: Database session
+        user: Customer or tasker whose tasks to list
+        status: Only tasks in this status
+        involvement: Only tasks the user is involved in this way
+        after_id: Only tasks with a greater id (the page cursor)
+        fields: Load only these Task fields (see fieldsets.load_fields)
+    """
+    involved = _involvement(user, involvement)
+    query = db.query(Task, involved.c.involvement).join(involved, involved.c.task_id == Task.id)
+    if status:
+        query = query.filter(Task.status == status)
+    if after_id is not None:
+        query = query.filter(Task.id > after_id)
+    if fields is not None:
+        query = load_fields(query, Task, fields, involved.c.involvement)
+    return query.order_by(Task.id)
+
+
+def involved_archived_tasks(
+    db: Session,
+    user: User,
+    status: Optional[TaskStatus] = None,
+    involvement: Optional[str] = None,
+    after_id: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Query:
+    """
+    Query the user's archived tasks in id order, as column rows.
+
+    Takes the same arguments as involved_tasks. Fields that are not archived
+    columns, such as bid_stats, are left out of the rows.
+    """
+    tasks = archive_tables[Task.__tablename__]
+    involved = _involvement(user, involvement, archive_tables)
+    columns = list(tasks.c) if fields is None else [tasks.c[name] for name in fields if name in tasks.c]
+    query = db.query(*columns, involved.c.involvement).select_from(tasks).join(
+        involved, involved.c.task_id == tasks.c.id
+    )
+    if status:
+        query = query.filter(tasks.c.status == status)
+    if after_id is not None:
+        query = query.filter(tasks.c.id > after_id)
+    return query.order_by(tasks.c.id)
+
+
+def item_id(item) -> int:
+    """Task id of an item from annotate, whether a Task or a dict."""
+    return item.id if isinstance(item, Task) else item["id"]
+
+
+def _as_list(involvement: str) -> List[str]:
+    kinds = set(involvement.split(","))
+    return [kind for kind in INVOLVEMENT_TYPES if kind in kinds]
+
+
+def annotate(rows: Iterable[Row]) -> list:
+    """
+    Items with an ``involvement`` list, from rows of involved_tasks.
+
+    Rows holding a Task entity give the task with the attribute set; column
+    rows (sparse fieldsets and archived tasks) give plain dicts.
+    """
+    items = []
+    for row in rows:
+        if isinstance(row[0], Task):
+            task, involvement = row
+            task.involvement = _as_list(involvement)
+            items.append(task)
+        else:
+            item = row._asdict()
+            item["involvement"] = _as_list(item["involvement"])
+            items.append(item)
+    return items
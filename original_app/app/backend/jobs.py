@@ -0,0 +1,253 @@
+"""
+Durable background jobs for side effects.
+
+Write endpoints should only do the work their response depends on. Anything
+else (fan-out, counters, notifications) is queued with enqueue() in the
+same session as the primary row, so the job is committed, or rolled back,
+together with it, and runs after the response has been sent.
+
+Jobs live in the ``jobs`` table. JobWorker threads claim due jobs with a
+conditional UPDATE, run the registered handler, and delete the job in the
+same session once the handler returns. Only what the handler leaves
+uncommitted commits together with that deletion: handlers that commit as
+they go, such as feed.add_task (one commit per batch of feeds) and
+notifications.task_created (one per batch of notifications), have already
+committed part of their work if they fail or their worker dies. A failing job is retried with exponential
+backoff until it reaches its max_attempts, after which it stays in the
+table as failed.
+
+A claimed job holds a lease (run_after is pushed JOB_LEASE_SECONDS ahead);
+if its worker dies the lease runs out and another worker picks it up.
+Either way a job can run more than once, over effects it has already
+committed, so every handler must be idempotent.
+
+Handlers are registered with the @job decorator, which also sets how many
+jobs of that kind one process runs at a time:
+
+    @job("feed.add_task", concurrency=1)
+    def add_task_to_feeds(db, task_id):
+        ...
+
+    jobs.enqueue(db, "feed.add_task", task_id=task.id)
+
+Configuration:
+    TASKER_JOB_WORKERS=2              worker threads per process (0 = off)
+    TASKER_JOB_POLL_SECONDS=1         how often idle workers look for due jobs
+    TASKER_JOB_LEASE_SECONDS=300      how long a claimed job is reserved
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from database import Job, JobStatus
+
+JOB_WORKERS = int(os.getenv("TASKER_JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("TASKER_JOB_POLL_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("TASKER_JOB_LEASE_SECONDS", "300"))
+
+# Retry delays double from RETRY_BASE_SECONDS up to RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 600.0
+
+logger = logging.getLogger(__name__)
+
+
+class JobType:
+    __slots__ = ("kind", "handler", "concurrency", "max_attempts")
+
+    def __init__(self, kind: str, handler: Callable, concurrency: int, max_attempts: int):
+        self.kind = kind
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+
+job_types: Dict[str, JobType] = {}
+
+# Set after a commit that enqueued jobs, so idle workers in this process
+# start on them without waiting for the next poll
+_wakeup = threading.Event()
+_ENQUEUED = "jobs_enqueued"
+
+
+def job(kind: str, concurrency: int = 1, max_attempts: int = 5):
+    """Register the decorated function, which must be idempotent, as the handler for ``kind`` jobs."""
+    def register(handler):
+        job_types[kind] = JobType(kind, handler, concurrency, max_attempts)
+        return handler
+    return register
+
+
+def enqueue(db: Session, kind: str, delay: float = 0.0, **payload) -> Job:
+    """
+    Queue a job in the caller's transaction; it becomes visible on commit.
+
+    Args:
+        db: Session holding the write the job belongs to
+        kind: Registered job kind
+        delay: Seconds to wait before the job may run
+        **payload: JSON-serializable keyword arguments for the handler
+    """
+    if kind not in job_types:
+        raise ValueError(f"Unknown job kind: {kind}")
+    row = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        run_after=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.add(row)
+    db.info[_ENQUEUED] = True
+    return row
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session):
+    if session.info.pop(_ENQUEUED, False):
+        _wakeup.set()
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+class JobWorker:
+    """
+    Pool of threads running queued jobs.
+
+    Args:
+        session_factory: Callable returning a new Session (e.g. SessionLocal)
+        workers: Number of worker threads started by start()
+        poll_interval: Seconds an idle worker sleeps between checks
+        clock: Returns the current UTC time, replaceable in tests
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_SECONDS,
+        clock: Callable[[], datetime] = datetime.utcnow
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stopping.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_pending(self) -> int:
+        """Run due jobs in the calling thread until none are left; returns how many ran."""
+        count = 0
+        while self.run_one():
+            count += 1
+        return count
+
+    def run_one(self) -> bool:
+        """Claim and run one due job; returns False if none was available."""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        try:
+            self._execute(*claimed)
+        finally:
+            with self._lock:
+                self._running[claimed[1]] -= 1
+        return True
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_one():
+                    continue
+            except Exception:
+                logger.exception("Job worker iteration failed")
+            _wakeup.wait(self.poll_interval)
+            _wakeup.clear()
+
+    def _claim(self):
+        """
+        Reserve the oldest due job whose kind has a free concurrency slot.
+
+        Claims are serialized within the process so concurrency limits hold
+        exactly; across processes, the conditional UPDATE keeps two workers
+        from taking the same job.
+        """
+        with self._lock:
+            kinds = [
+                kind for kind, job_type in job_types.items()
+                if self._running.get(kind, 0) < job_type.concurrency
+            ]
+            if not kinds:
+                return None
+            db = self.session_factory()
+            try:
+                now = self.clock()
+                row = db.query(Job.id, Job.kind, Job.attempts).filter(
+                    Job.status.in_((JobStatus.PENDING, JobStatus.RUNNING)),
+                    Job.run_after <= now,
+                    Job.kind.in_(kinds)
+                ).order_by(Job.run_after, Job.id).first()
+                if row is None:
+                    return None
+                claimed = db.execute(
+                    update(Job)
+                    .where(Job.id == row.id, Job.attempts == row.attempts)
+                    .values(
+                        status=JobStatus.RUNNING,
+                        attempts=row.attempts + 1,
+                        run_after=now + timedelta(seconds=JOB_LEASE_SECONDS)
+                    )
+                ).rowcount
+                db.commit()
+            finally:
+                db.close()
+            if not claimed:
+                return None
+            self._running[row.kind] = self._running.get(row.kind, 0) + 1
+            return row.id, row.kind, row.attempts + 1
+
+    def _execute(self, job_id: int, kind: str, attempts: int):
+        job_type = job_types[kind]
+        db = self.session_factory()
+        try:
+            payload = json.loads(db.query(Job.payload).filter(Job.id == job_id).scalar())
+            job_type.handler(db, **payload)
+            db.query(Job).filter(Job.id == job_id).delete(synchronize_session=False)
+            db.commit()
+        except Exception as error:
+            db.rollback()
+            logger.warning("Job %s (%s) failed on attempt %d: %s", job_id, kind, attempts, error)
+            if attempts >= job_type.max_attempts:
+                values = {"status": JobStatus.FAILED}
+            else:
+                values = {
+                    "status": JobStatus.PENDING,
+                    "run_after": self.clock() + timedelta(seconds=retry_delay(attempts))
+                }
+            db.execute(update(Job).where(Job.id == job_id).values(last_error=repr(error), **values))
+            db.commit()
+        finally:
+            db.close()
@@ -1,18 +1,77 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, aliased
-from sqlalchemy import or_
-from datetime import timedelta, datetime
-from typing import List
+from sqlalchemy import exists, func, or_, select, update, tuple_
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+from datetime import date, timedelta, datetime
+from typing import List, Optional, Union
 
 import database
 import schemas
 import auth
-from permissions import can_message_user
+from permissions import can_message_user_cached, messageable_among
+from invalidation import cache_stats
+from streaming import wants_ndjson, ndjson_response
+from fieldsets import load_fields, parse_fields, partial_schema, sparse_response
+from group_commit import GroupCommitBatcher, MESSAGE_BATCHING_ENABLED
+import analytics
+import archive
+import batch
+import counters
+import entities
+import retention
+import feed
+import threads
+import jobs
+import notifications
+import warmup
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+from rate_limit import RateLimitMiddleware, TokenBucketLimiter
+from bid_stats import refresh_bid_stats
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, paginate
+from multiget import MISSING_IDS_HEADER, in_request_order, load_by_ids, parse_ids
+from involvement import INVOLVEMENT_TYPES, annotate, involved_archived_tasks, involved_tasks, item_id
 from database import Task, Bid, Offer, Agreement, User, UserRole, Message
 
-app = FastAPI(title="Tasker Platform API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize database
+    if database.CREATE_SCHEMA:
+        database.init_db()
+    db = database.SessionLocal()
+    try:
+        notifications.ensure_skill_index(db)
+    finally:
+        db.close()
+    archive.start_archiver(database.SessionLocal)
+    retention.start_compactor(database.SessionLocal)
+    counters.start_counter_checker(database.SessionLocal)
+    analytics.start_analytics_packer(database.SessionLocal)
+    feed.start_feed_builder(database.SessionLocal)
+    auth.start_refresh_token_purger(database.SessionLocal)
+    job_worker.start()
+    warmup.warm_up(database.SessionLocal)
+    app.state.ready = True
+    yield
+    job_worker.stop()
+    if message_batcher is not None:
+        message_batcher.stop()
+
+app = FastAPI(title="Tasker Platform API", lifespan=lifespan)
+
+# Replays stored responses for retried POSTs carrying an Idempotency-Key.
+# Added before CORS so that CORS stays outermost and covers replays too
+idempotency_store = IdempotencyStore(database.SessionLocal)
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+
+# Per-caller token buckets; rejects floods before they reach the database
+rate_limiter = TokenBucketLimiter()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 # CORS middleware
 app.add_middleware(
@@ -21,16 +80,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, MISSING_IDS_HEADER],
 )
 
-# Initialize database
-@app.on_event("startup")
-def startup():
-    database.init_db()
+# Optional group-commit stage for message inserts (see group_commit.py)
+message_batcher = GroupCommitBatcher(database.SessionLocal) if MESSAGE_BATCHING_ENABLED else None
+
+# Runs side effects queued with jobs.enqueue after the request has committed
+job_worker = jobs.JobWorker(database.SessionLocal)
+
+# Set once startup, including warm-up, has finished (see GET /health/ready)
+app.state.ready = False
+
+@app.get("/health/ready")
+def readiness():
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Starting")
+    return {"status": "ready"}
+
+@app.get("/health/caches")
+def cache_health():
+    """Hit rates of this worker's in-process caches"""
+    return cache_stats()
 
 # Authentication endpoints
 @app.post("/register", response_model=schemas.UserResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+def register(user: schemas.UserCreate, db: Session = Depends(database.get_write_db)):
     # Check if user exists
     db_user = db.query(database.User).filter(database.User.email == user.email).first()
     if db_user:
@@ -50,12 +125,15 @@ def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
         bio=user.bio
     )
     db.add(db_user)
+    if db_user.role == database.UserRole.TASKER:
+        db.flush()
+        notifications.index_tasker(db, db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_write_db)):
     user = db.query(database.User).filter(database.User.email == form_data.username).first()
     if not user or not auth.verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
@@ -68,15 +146,57 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     access_token = auth.create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer", "user": user}
+    refresh_token = auth.create_refresh_token(db, user.id)
+    db.commit()
+    return {"access_token": access_token, "token_type": "bearer", "user": user, "refresh_token": refresh_token}
+
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(request: schemas.RefreshRequest, db: Session = Depends(database.get_write_db)):
+    """Renew a session without the password: a new access token and a rotated refresh token"""
+    user, refresh_token = auth.rotate_refresh_token(db, request.refresh_token)
+    db.commit()
+    access_token = auth.create_access_token(
+        data={"sub": user.email}, expires_delta=timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer", "user": user, "refresh_token": refresh_token}
+
+@app.post("/token/revoke")
+def revoke_refresh_token(request: schemas.RefreshRequest, db: Session = Depends(database.get_write_db)):
+    """Log out: revoke the refresh token and every rotation of it"""
+    stored = db.query(database.RefreshToken.family_id).filter(
+        database.RefreshToken.token_hash == auth.hash_refresh_token(request.refresh_token)
+    ).first()
+    if stored:
+        auth.revoke_refresh_family(db, stored.family_id)
+        db.commit()
+    return {"message": "Refresh token revoked"}
 
 @app.get("/users/me", response_model=schemas.UserResponse)
 def get_current_user(current_user: database.User = Depends(auth.get_current_user)):
     return current_user
 
+@app.get("/users", response_model=List[Union[schemas.UserResponse, schemas.UserPublicResponse]])
+def get_users(
+    response: Response,
+    ids: str = Query(..., description="Comma-separated user ids"),
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Several users in one request, in the order asked for. Email and phone
+    are only included for the caller and the users they can message.
+    """
+    user_ids = parse_ids(ids)
+    users = in_request_order(entities.get_users(db, user_ids), user_ids, response)
+    contacts = messageable_among(db, current_user.id, (user.id for user in users)) | {current_user.id}
+    return [
+        (schemas.UserResponse if user.id in contacts else schemas.UserPublicResponse).model_validate(user)
+        for user in users
+    ]
+
 @app.get("/users/{user_id}", response_model=schemas.UserResponse)
-def get_user(user_id: int, db: Session = Depends(database.get_db)):
-    user = db.query(database.User).filter(database.User.id == user_id).first()
+def get_user(user_id: int, db: Session = Depends(database.get_read_db)):
+    user = entities.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -86,7 +206,7 @@ def get_user(user_id: int, db: Session = Depends(database.get_db)):
 def create_task(
     task: schemas.TaskCreate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     if current_user.role != database.UserRole.CUSTOMER:
         raise HTTPException(status_code=403, detail="Only customers can post tasks")
@@ -100,24 +220,182 @@ def create_task(
         budget=task.budget
     )
     db.add(db_task)
+    db.flush()
+    feed.queue_task(db, db_task.id)
+    notifications.queue_task(db, db_task.id)
     db.commit()
     db.refresh(db_task)
     return db_task
 
+# Task list orderings; ties are broken by id
+TASK_SORT_KEYS = {
+    "created_at": database.Task.created_at,
+    "date": database.Task.date,
+    "budget": database.Task.budget,
+    "bid_count": database.Task.bid_count,
+    "lowest_bid": database.Task.lowest_bid,
+    "offer_count": database.Task.offer_count,
+    "message_count": database.Task.message_count,
+}
+
+def task_criteria(
+    columns,
+    status: Optional[database.TaskStatus] = None,
+    min_bids: Optional[int] = None,
+    max_bids: Optional[int] = None,
+    min_budget: Optional[float] = None,
+    max_budget: Optional[float] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    location: Optional[str] = None,
+    customer_id: Optional[int] = None
+) -> list:
+    """
+    Task list filters as SQL criteria on ``columns``, either the Task model
+    or the archived tasks table's columns.
+    """
+    criteria = []
+    if status:
+        criteria.append(columns.status == status)
+    if min_bids is not None:
+        criteria.append(columns.bid_count >= min_bids)
+    if max_bids is not None:
+        criteria.append(columns.bid_count <= max_bids)
+    if min_budget is not None:
+        criteria.append(columns.budget >= min_budget)
+    if max_budget is not None:
+        criteria.append(columns.budget <= max_budget)
+    if date_from is not None:
+        criteria.append(columns.date >= date_from)
+    if date_to is not None:
+        criteria.append(columns.date <= date_to)
+    if location:
+        # Case-insensitive prefix match. The pattern is built here rather than
+        # in SQL so SQLite can serve it from the NOCASE location index
+        escaped = location.replace("/", "//").replace("%", "/%").replace("_", "/_")
+        criteria.append(columns.location.like(f"{escaped}%", escape="/"))
+    if customer_id is not None:
+        criteria.append(columns.customer_id == customer_id)
+    return criteria
+
 @app.get("/tasks", response_model=List[schemas.TaskResponse])
 def list_tasks(
+    request: Request,
+    response: Response,
     status: database.TaskStatus = None,
-    db: Session = Depends(database.get_db),
+    min_bids: Optional[int] = Query(None, ge=0),
+    max_bids: Optional[int] = Query(None, ge=0, description="0 lists tasks with no bids yet"),
+    min_budget: Optional[float] = Query(None, ge=0),
+    max_budget: Optional[float] = Query(None, ge=0),
+    date_from: Optional[datetime] = Query(None, description="Tasks scheduled on or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Tasks scheduled on or before this time"),
+    location: Optional[str] = Query(None, min_length=1, description="Location prefix, case-insensitive"),
+    customer_id: Optional[int] = None,
+    sort: Optional[str] = Query(
+        None, pattern=f"^-?({'|'.join(TASK_SORT_KEYS)})$",
+        description="Sort field; prefix with - for descending, e.g. -created_at (newest), "
+                    "date (soonest), -budget (highest budget)"
+    ),
+    ids: Optional[str] = Query(None, description="Comma-separated task ids to fetch, in order"),
+    fields: Optional[str] = Query(None, description="Comma-separated task fields to return"),
+    db: Session = Depends(database.get_read_db),
     current_user: database.User = Depends(auth.get_current_user)
 ):
-    query = db.query(database.Task)
-    if status:
-        query = query.filter(database.Task.status == status)
+    selected = parse_fields(fields, schemas.TaskResponse)
+    filters = dict(
+        status=status, min_bids=min_bids, max_bids=max_bids, min_budget=min_budget, max_budget=max_budget,
+        date_from=date_from, date_to=date_to, location=location, customer_id=customer_id
+    )
+    query = db.query(database.Task).filter(*task_criteria(database.Task, **filters))
+    if selected:
+        # Multi-get needs the id to put rows in order, even if it isn't returned
+        loaded = selected if ids is None or "id" in selected else selected + ("id",)
+        query = load_fields(query, database.Task, loaded)
+    if ids is not None:
+        task_ids = parse_ids(ids)
+        if any(value is not None for value in filters.values()):
+            found = load_by_ids(lambda chunk: query.filter(database.Task.id.in_(chunk)), task_ids)
+        else:
+            # Plain lookups by id are served from the entity cache
+            found = entities.get_tasks(db, task_ids)
+        missing = [task_id for task_id in task_ids if task_id not in found]
+        if missing:
+            archived_criteria = task_criteria(database.archive_tables[database.Task.__tablename__].c, **filters)
+            found.update(load_by_ids(
+                lambda chunk: archive.find_archived_by_ids(db, database.Task, chunk, *archived_criteria), missing
+            ))
+        tasks = in_request_order(found, task_ids, response)
+        return sparse_response(tasks, schemas.TaskResponse, selected, response.headers) if selected else tasks
+    if wants_ndjson(request):
+        # Stream in primary key order so partners can resume a sync
+        schema = partial_schema(schemas.TaskResponse, selected) if selected else schemas.TaskResponse
+        return ndjson_response(query.order_by(database.Task.id), schema)
+    # Id order unless asked otherwise, whichever index serves the filters
+    order = (database.Task.id,)
+    if sort:
+        column = TASK_SORT_KEYS[sort.lstrip("-")]
+        order = (column.desc(), database.Task.id.desc()) if sort.startswith("-") else (column, database.Task.id)
+    query = query.order_by(*order)
+    if selected:
+        return sparse_response(query.all(), schemas.TaskResponse, selected)
     return query.all()
 
+@app.get("/feed", response_model=List[schemas.TaskResponse])
+def get_feed(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_read_db)
+):
+    """Open tasks ranked for the current tasker, best match first"""
+    if current_user.role != database.UserRole.TASKER:
+        raise HTTPException(status_code=403, detail="Only taskers have a task feed")
+    
+    after = decode_cursor(cursor, 2) if cursor else None
+    items = feed.read_feed(db, current_user, after, limit + 1)
+    items = paginate(items, limit, response, key=lambda item: (item.score, item.task.id))
+    return [item.task for item in items]
+
+@app.get("/tasks/my-tasks", response_model=List[schemas.InvolvedTaskResponse])
+@app.get("/tasks/user/my-tasks", response_model=List[schemas.InvolvedTaskResponse])
+def get_my_tasks(
+    response: Response,
+    status: database.TaskStatus = None,
+    involvement: Optional[str] = Query(None, pattern=f"^({'|'.join(INVOLVEMENT_TYPES)})$"),
+    fields: Optional[str] = Query(None, description="Comma-separated task fields to return"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size; all tasks when omitted"),
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_read_db)
+):
+    """Tasks the user posted, or has bid on, been offered or agreed to do"""
+    selected = parse_fields(fields, schemas.InvolvedTaskResponse)
+    task_fields = None
+    if selected:
+        # Pages need the id for the cursor, even if it isn't returned
+        task_fields = tuple(name for name in selected if name != "involvement")
+        task_fields += () if "id" in task_fields else ("id",)
+    after_id = decode_cursor(cursor, 1)[0] if cursor else None
+    queries = [
+        involved_tasks(db, current_user, status, involvement, after_id, task_fields),
+        involved_archived_tasks(db, current_user, status, involvement, after_id, task_fields)
+    ]
+    if limit is not None:
+        queries = [query.limit(limit + 1) for query in queries]
+    # Both halves are in id order; merging keeps the cursor valid across them
+    tasks = sorted(annotate(queries[0]) + annotate(queries[1]), key=item_id)
+    if limit is not None:
+        tasks = paginate(tasks[:limit + 1], limit, response, key=lambda task: (item_id(task),))
+    if selected:
+        return sparse_response(tasks, schemas.InvolvedTaskResponse, selected, response.headers)
+    return tasks
+
 @app.get("/tasks/{task_id}", response_model=schemas.TaskResponse)
-def get_task(task_id: int, db: Session = Depends(database.get_db)):
-    task = db.query(database.Task).filter(database.Task.id == task_id).first()
+def get_task(task_id: int, db: Session = Depends(database.get_read_db)):
+    task = entities.get_task(db, task_id)
+    if not task:
+        task = archive.get_archived(db, database.Task, id=task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
@@ -127,7 +405,7 @@ def update_task(
     task_id: int,
     task_update: schemas.TaskUpdate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     db_task = db.query(database.Task).filter(database.Task.id == task_id).first()
     if not db_task:
@@ -139,71 +417,24 @@ def update_task(
     for key, value in task_update.dict(exclude_unset=True).items():
         setattr(db_task, key, value)
     
+    feed.sync_task(db, db_task)
     db.commit()
+    entities.invalidate_task(task_id)
     db.refresh(db_task)
     return db_task
 
-@app.get("/tasks/user/my-tasks", response_model=List[schemas.TaskResponse])
-def get_my_tasks(
-    current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
-):
-    if current_user.role == database.UserRole.CUSTOMER:
-        return db.query(database.Task).filter(database.Task.customer_id == current_user.id).all()
-    else:
-        # For taskers, return tasks they've bid on or have agreements for
-        return db.query(database.Task).join(database.Bid).filter(database.Bid.tasker_id == current_user.id).all()
-
-@app.get("/tasks/my-tasks", response_model=List[schemas.TaskResponse])
-def get_user_involved_tasks(
-    current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
-):
-    """Get all tasks where user is involved (creator, bidder, or has agreement)"""
-    if current_user.role == database.UserRole.CUSTOMER:
-        # Get tasks created by customer
-        tasks = db.query(database.Task).filter(
-            database.Task.customer_id == current_user.id
-        ).all()
-    else:  # Tasker
-        # Get tasks where tasker has bid, offer, or agreement
-        task_ids = set()
-        
-        # Tasks with bids
-        bid_tasks = db.query(database.Task.id).join(database.Bid).filter(
-            database.Bid.tasker_id == current_user.id
-        ).all()
-        task_ids.update([t.id for t in bid_tasks])
-        
-        # Tasks with offers
-        offer_tasks = db.query(database.Task.id).join(database.Offer).filter(
-            database.Offer.tasker_id == current_user.id
-        ).all()
-        task_ids.update([t.id for t in offer_tasks])
-        
-        # Tasks with agreements
-        agreement_tasks = db.query(database.Task.id).join(database.Agreement).filter(
-            database.Agreement.tasker_id == current_user.id
-        ).all()
-        task_ids.update([t.id for t in agreement_tasks])
-        
-        # Get all tasks by IDs
-        tasks = db.query(database.Task).filter(database.Task.id.in_(task_ids)).all() if task_ids else []
-    
-    return tasks
-
 # Bid endpoints
 @app.post("/bids", response_model=schemas.BidResponse)
 def create_bid(
     bid: schemas.BidCreate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     if current_user.role != database.UserRole.TASKER:
         raise HTTPException(status_code=403, detail="Only taskers can bid on tasks")
     
     # Check if task exists
-    task = db.query(database.Task).filter(database.Task.id == bid.task_id).first()
+    task = entities.get_task(db, bid.task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -222,26 +453,93 @@ def create_bid(
         message=bid.message
     )
     db.add(db_bid)
+    db.flush()
+    refresh_bid_stats(db, bid.task_id)
     db.commit()
     db.refresh(db_bid)
     return db_bid
 
+@app.post("/bids/{bid_id}/withdraw", response_model=schemas.BidResponse)
+def withdraw_bid(
+    bid_id: int,
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_write_db)
+):
+    bid = db.query(database.Bid).filter(database.Bid.id == bid_id).first()
+    if not bid:
+        raise HTTPException(status_code=404, detail="Bid not found")
+    
+    if bid.tasker_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Only withdraw while the task is still open and the bid still active
+    withdrawn = db.execute(
+        update(database.Bid)
+        .where(
+            database.Bid.id == bid_id,
+            database.Bid.withdrawn == False,
+            database.Bid.task_id.in_(
+                select(database.Task.id).where(
+                    database.Task.id == bid.task_id,
+                    database.Task.status == database.TaskStatus.OPEN
+                )
+            )
+        )
+        .values(withdrawn=True)
+    ).rowcount
+    if not withdrawn:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Bid is already withdrawn or the task is no longer open")
+    
+    refresh_bid_stats(db, bid.task_id)
+    db.commit()
+    db.refresh(bid)
+    return bid
+
+# Keyset ordering for the bid book
+BID_SORT_KEYS = {
+    "amount": (database.Bid.amount, database.Bid.id),
+    "created_at": (database.Bid.created_at, database.Bid.id),
+}
+
 @app.get("/tasks/{task_id}/bids", response_model=List[schemas.BidResponse])
-def get_task_bids(task_id: int, db: Session = Depends(database.get_db)):
-    return db.query(database.Bid).filter(database.Bid.task_id == task_id).all()
+def get_task_bids(
+    task_id: int,
+    request: Request,
+    response: Response,
+    sort: Optional[str] = Query(None, pattern="^(amount|created_at)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(database.get_read_db)
+):
+    query = db.query(database.Bid).filter(database.Bid.task_id == task_id)
+    # The stream and the bid book only list bids that can still be accepted
+    active = query.filter(database.Bid.withdrawn == False)
+    if wants_ndjson(request):
+        return ndjson_response(active.order_by(database.Bid.id), schemas.BidResponse)
+    if sort is None:
+        return query.all() or archive.find_archived(db, database.Bid, task_id=task_id)
+    
+    # Sorted bid book, paged along the (task_id, <sort>, id) index
+    columns = BID_SORT_KEYS[sort]
+    query = active
+    if cursor:
+        query = query.filter(tuple_(*columns) > tuple_(*decode_cursor(cursor, len(columns))))
+    bids = query.order_by(*columns).limit(limit + 1).all()
+    return paginate(bids, limit, response, key=lambda bid: (getattr(bid, sort), bid.id))
 
 # Offer endpoints
 @app.post("/offers", response_model=schemas.OfferResponse)
 def create_offer(
     offer: schemas.OfferCreate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     if current_user.role != database.UserRole.CUSTOMER:
         raise HTTPException(status_code=403, detail="Only customers can make offers")
     
     # Verify the task belongs to the customer
-    task = db.query(database.Task).filter(database.Task.id == offer.task_id).first()
+    task = entities.get_task(db, offer.task_id)
     if not task or task.customer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -257,122 +555,187 @@ def create_offer(
     db.refresh(db_offer)
     return db_offer
 
+def claim_open_task(db: Session, task_id: int, *conditions):
+    """
+    Move a task from open to in progress in a single conditional UPDATE.
+
+    Of several concurrent accepts on the same task exactly one matches the
+    WHERE clause; the rest see rowcount 0 and get a 409. Extra conditions
+    are added to the same WHERE clause.
+    """
+    claimed = db.execute(
+        update(database.Task)
+        .where(database.Task.id == task_id, database.Task.status == database.TaskStatus.OPEN, *conditions)
+        .values(status=database.TaskStatus.IN_PROGRESS)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Task is no longer open")
+    feed.remove_task(db, task_id)
+
+def create_agreement(db: Session, task_id: int, tasker_id: int, amount: float) -> schemas.AgreementResponse:
+    """Insert the agreement and commit; the unique task_id constraint is the final arbiter"""
+    agreement = database.Agreement(task_id=task_id, tasker_id=tasker_id, amount=amount)
+    db.add(agreement)
+    try:
+        db.flush()
+        # Snapshot before commit so the response needs no reload
+        response = schemas.AgreementResponse.model_validate(agreement)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Task already has an agreement")
+    # The task was claimed in this transaction
+    entities.invalidate_task(task_id)
+    return response
+
 @app.post("/offers/{offer_id}/accept", response_model=schemas.AgreementResponse)
 def accept_offer(
     offer_id: int,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
-    offer = db.query(database.Offer).filter(database.Offer.id == offer_id).first()
+    offer = db.query(
+        database.Offer.task_id, database.Offer.tasker_id, database.Offer.amount
+    ).filter(database.Offer.id == offer_id).first()
     if not offer:
         raise HTTPException(status_code=404, detail="Offer not found")
     
     if offer.tasker_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Mark offer as accepted
-    offer.accepted = True
-    
-    # Create agreement
-    agreement = database.Agreement(
-        task_id=offer.task_id,
-        tasker_id=current_user.id,
-        amount=offer.amount
-    )
-    db.add(agreement)
-    
-    # Update task status
-    task = db.query(database.Task).filter(database.Task.id == offer.task_id).first()
-    task.status = database.TaskStatus.IN_PROGRESS
+    # Mark offer as accepted, unless a concurrent request already did
+    accepted = db.execute(
+        update(database.Offer)
+        .where(database.Offer.id == offer_id, database.Offer.accepted == False)
+        .values(accepted=True)
+    ).rowcount
+    if not accepted:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Offer already accepted")
     
-    db.commit()
-    db.refresh(agreement)
-    return agreement
+    claim_open_task(db, offer.task_id)
+    return create_agreement(db, offer.task_id, current_user.id, offer.amount)
 
 @app.post("/bids/{bid_id}/accept", response_model=schemas.AgreementResponse)
 def accept_bid(
     bid_id: int,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
-    bid = db.query(database.Bid).filter(database.Bid.id == bid_id).first()
+    # Bid and task owner in one round trip
+    bid = db.query(
+        database.Bid.task_id, database.Bid.tasker_id, database.Bid.amount, database.Bid.withdrawn,
+        database.Task.customer_id
+    ).join(database.Task, database.Task.id == database.Bid.task_id).filter(
+        database.Bid.id == bid_id
+    ).first()
     if not bid:
         raise HTTPException(status_code=404, detail="Bid not found")
     
-    task = db.query(database.Task).filter(database.Task.id == bid.task_id).first()
-    if task.customer_id != current_user.id:
+    if bid.customer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Create agreement
-    agreement = database.Agreement(
-        task_id=bid.task_id,
-        tasker_id=bid.tasker_id,
-        amount=bid.amount
-    )
-    db.add(agreement)
-    
-    # Update task status
-    task.status = database.TaskStatus.IN_PROGRESS
+    if bid.withdrawn:
+        raise HTTPException(status_code=409, detail="Bid has been withdrawn")
     
-    db.commit()
-    db.refresh(agreement)
-    return agreement
+    # Re-check in the claim itself so a withdraw racing this accept cannot slip in between
+    claim_open_task(db, bid.task_id, exists().where(database.Bid.id == bid_id, database.Bid.withdrawn == False))
+    return create_agreement(db, bid.task_id, bid.tasker_id, bid.amount)
 
 @app.get("/offers/my-offers", response_model=List[schemas.OfferResponse])
 def get_my_offers(
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
     if current_user.role == database.UserRole.CUSTOMER:
-        return db.query(database.Offer).filter(database.Offer.customer_id == current_user.id).all()
+        offers = db.query(database.Offer).filter(database.Offer.customer_id == current_user.id).all()
+        return offers + archive.find_archived(db, database.Offer, customer_id=current_user.id)
     else:
-        return db.query(database.Offer).filter(database.Offer.tasker_id == current_user.id).all()
+        offers = db.query(database.Offer).filter(database.Offer.tasker_id == current_user.id).all()
+        return offers + archive.find_archived(db, database.Offer, tasker_id=current_user.id)
 
 # Agreement endpoints
 @app.post("/agreements/{agreement_id}/complete")
 def complete_agreement(
     agreement_id: int,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
-    agreement = db.query(database.Agreement).filter(database.Agreement.id == agreement_id).first()
+    agreement = db.query(
+        database.Agreement.task_id, database.Task.customer_id
+    ).join(database.Task, database.Task.id == database.Agreement.task_id).filter(
+        database.Agreement.id == agreement_id
+    ).first()
     if not agreement:
         raise HTTPException(status_code=404, detail="Agreement not found")
     
-    task = db.query(database.Task).filter(database.Task.id == agreement.task_id).first()
-    if task.customer_id != current_user.id:
+    if agreement.customer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only the customer can mark task as complete")
     
-    agreement.status = database.AgreementStatus.COMPLETED
-    agreement.completed_at = datetime.utcnow()
-    task.status = database.TaskStatus.COMPLETED
+    completed = db.execute(
+        update(database.Agreement)
+        .where(
+            database.Agreement.id == agreement_id,
+            database.Agreement.status != database.AgreementStatus.COMPLETED
+        )
+        .values(status=database.AgreementStatus.COMPLETED, completed_at=datetime.utcnow())
+    ).rowcount
+    if not completed:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Agreement already completed")
     
+    db.execute(
+        update(database.Task)
+        .where(database.Task.id == agreement.task_id)
+        .values(status=database.TaskStatus.COMPLETED)
+    )
     db.commit()
+    entities.invalidate_task(agreement.task_id)
     return {"message": "Task marked as complete"}
 
 @app.get("/agreements", response_model=List[schemas.AgreementResponse])
 def get_agreements(
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
     if current_user.role == database.UserRole.CUSTOMER:
-        return db.query(database.Agreement).join(database.Task).filter(
+        agreements = db.query(database.Agreement).join(database.Task).filter(
             database.Task.customer_id == current_user.id
         ).all()
+        return agreements + archive.find_archived_for_customer(db, database.Agreement, current_user.id)
     else:
-        return db.query(database.Agreement).filter(
+        agreements = db.query(database.Agreement).filter(
             database.Agreement.tasker_id == current_user.id
         ).all()
+        return agreements + archive.find_archived(db, database.Agreement, tasker_id=current_user.id)
 
 # Message endpoints
+def save_message(db: Session, db_message: database.Message) -> database.Message:
+    """Persist a new message, through the group-commit batcher when enabled"""
+    if message_batcher is None:
+        db.add(db_message)
+        db.commit()
+        db.refresh(db_message)
+        return db_message
+    try:
+        saved = message_batcher.submit(db_message)
+    except TimeoutError:
+        # The message was withdrawn from the batch, so retrying cannot duplicate it
+        raise HTTPException(status_code=503, detail="Message could not be saved in time, please retry")
+    # Nothing is pending on this session; committing ends its read transaction
+    # and keeps read-your-writes routing for the sender
+    db.commit()
+    return saved
+
 @app.post("/messages", response_model=schemas.MessageResponse)
 def send_message(
     message: schemas.MessageCreate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     # Validate messaging permission
-    has_permission = can_message_user(
+    has_permission = can_message_user_cached(
         db=db,
         sender_id=current_user.id,
         receiver_id=message.receiver_id
@@ -388,7 +751,7 @@ def send_message(
     
     # Validate task_id if provided
     if message.task_id is not None:
-        task = db.query(Task).filter(Task.id == message.task_id).first()
+        task = entities.get_task(db, message.task_id)
         if not task:
             raise HTTPException(
                 status_code=404,
@@ -431,54 +794,70 @@ def send_message(
         task_id=message.task_id,
         content=message.content
     )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
-    return db_message
+    return save_message(db, db_message)
 
 @app.get("/messages", response_model=List[schemas.MessageResponseWithTask])
 def get_messages(
+    fields: Optional[str] = Query(None, description="Comma-separated message fields to return"),
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
+    """
+    The user's inbox, newest first. Lists hot messages only; old read
+    messages of closed tasks are compacted (see retention.py) and read back
+    through GET /tasks/{task_id}/messages.
+    """
     # Create aliases for sender and receiver users
     Sender = aliased(User)
     Receiver = aliased(User)
+    # Messages stay hot when their task moves to the archive
+    ArchivedTask = database.archive_tables[Task.__tablename__]
     
-    messages = db.query(
-        Message.id,
-        Message.sender_id,
-        Message.receiver_id,
-        Message.task_id,
-        Message.content,
-        Message.read,
-        Message.created_at,
-        Task.title.label('task_title'),
-        Task.status.label('task_status'),
-        Sender.full_name.label('sender_name'),
-        Sender.role.label('sender_role'),
-        Receiver.full_name.label('receiver_name'),
-        Receiver.role.label('receiver_role')
-    ).outerjoin(
-        Task, Message.task_id == Task.id
-    ).join(
-        Sender, Message.sender_id == Sender.id
-    ).join(
-        Receiver, Message.receiver_id == Receiver.id
-    ).filter(
+    columns = {
+        "id": Message.id,
+        "sender_id": Message.sender_id,
+        "receiver_id": Message.receiver_id,
+        "task_id": Message.task_id,
+        "content": Message.content,
+        "read": Message.read,
+        "created_at": Message.created_at,
+        "task_title": func.coalesce(Task.title, ArchivedTask.c.title),
+        "task_status": func.coalesce(Task.status, ArchivedTask.c.status),
+        "sender_name": Sender.full_name,
+        "sender_role": Sender.role,
+        "receiver_name": Receiver.full_name,
+        "receiver_role": Receiver.role,
+    }
+    selected = parse_fields(fields, schemas.MessageResponseWithTask)
+    names = selected or tuple(columns)
+    
+    # Join only the tables the selected columns come from
+    query = db.query(*(columns[name].label(name) for name in names)).select_from(Message)
+    if {"task_title", "task_status"} & set(names):
+        query = query.outerjoin(Task, Message.task_id == Task.id).outerjoin(
+            ArchivedTask, Message.task_id == ArchivedTask.c.id
+        )
+    if {"sender_name", "sender_role"} & set(names):
+        query = query.join(Sender, Message.sender_id == Sender.id)
+    if {"receiver_name", "receiver_role"} & set(names):
+        query = query.join(Receiver, Message.receiver_id == Receiver.id)
+    
+    messages = query.filter(
         or_(
             Message.sender_id == current_user.id,
             Message.receiver_id == current_user.id
         )
     ).order_by(Message.created_at.desc()).all()
     
+    if selected:
+        return sparse_response(messages, schemas.MessageResponseWithTask, selected)
     return messages
 
 @app.put("/messages/{message_id}/read")
 def mark_message_read(
     message_id: int,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     message = db.query(database.Message).filter(database.Message.id == message_id).first()
     if not message:
@@ -493,7 +872,7 @@ def mark_message_read(
 @app.get("/messages/unread-count")
 def get_unread_count(
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
     """Get count of unread messages for current user"""
     count = db.query(database.Message).filter(
@@ -507,31 +886,63 @@ def get_unread_count(
 @app.get("/tasks/{task_id}/messages", response_model=List[schemas.MessageResponse])
 def get_task_messages(
     task_id: int,
+    before: Optional[int] = Query(None, description="Page of messages just before this message id"),
+    after: Optional[int] = Query(None, description="Page of messages just after this message id"),
+    around: Optional[str] = Query(
+        None, pattern=f"^{threads.FIRST_UNREAD}$", description="first_unread: page around your first unread message"
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=threads.THREAD_MAX_PAGE_SIZE, description="Page size"),
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
-    # Get the task
-    task = db.query(database.Task).filter(database.Task.id == task_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    """The task's message thread, oldest first; whole unless a page is asked for (see threads.py)"""
+    threads.check_paging(before, after, around)
+    paged = limit is not None or before is not None or after is not None or around is not None
+    page = dict(before=before, after=after, around=around, limit=limit or threads.THREAD_PAGE_SIZE)
     
-    # Get the agreement for this task
-    agreement = db.query(database.Agreement).filter(
-        database.Agreement.task_id == task_id
-    ).first()
+    # Task and agreement in one query
+    parties = threads.thread_parties(db, task_id)
+    archived = parties is None
+    if archived:
+        # Closed tasks move to the archive together with their agreement
+        task = archive.get_archived(db, database.Task, id=task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        agreement = archive.get_archived(db, database.Agreement, task_id=task_id)
+        customer_id, tasker_id = task.customer_id, agreement.tasker_id if agreement else None
+    else:
+        customer_id, tasker_id = parties.customer_id, parties.tasker_id
     
-    if not agreement:
+    if tasker_id is None:
         raise HTTPException(status_code=403, detail="No agreement for this task")
     
     # Verify user is either customer or tasker
-    if task.customer_id != current_user.id and agreement.tasker_id != current_user.id:
+    if customer_id != current_user.id and tasker_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view messages for this task")
     
+    if paged and not archived and parties.status not in retention.CLOSED_STATUSES:
+        return threads.page_thread(db, task_id, current_user.id, **page)
+    
     # Get all messages for this task
     messages = db.query(database.Message).filter(
         database.Message.task_id == task_id
-    ).order_by(database.Message.created_at).all()
+    ).order_by(database.Message.created_at, database.Message.id).all()
+    if archived:
+        # Messages stay hot when their task is archived, apart from rows
+        # archived before they did
+        legacy = archive.find_archived(db, database.Message, task_id=task_id)
+        if legacy:
+            messages = sorted(legacy + messages, key=lambda m: (m.created_at, m.id))
     
+    # Old read messages of closed threads live in compressed blocks; a page
+    # only inflates the blocks it reaches
+    ranges = threads.compacted_ranges(messages, current_user.id, **page) if paged else [{}]
+    history = [message for bounds in ranges for message in retention.load_compacted_messages(db, task_id, **bounds)]
+    if history:
+        messages = sorted(history + list(messages), key=lambda m: (m.created_at, m.id))
+    
+    if paged:
+        return threads.page_loaded(messages, current_user.id, **page)
     return messages
 
 @app.post("/tasks/{task_id}/messages", response_model=schemas.MessageResponse)
@@ -539,28 +950,22 @@ def send_task_message(
     task_id: int,
     message: schemas.TaskMessageCreate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
-    # Get the task
-    task = db.query(database.Task).filter(database.Task.id == task_id).first()
-    if not task:
+    # Task and agreement in one query
+    parties = threads.thread_parties(db, task_id)
+    if not parties:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    # Get the agreement for this task
-    agreement = db.query(database.Agreement).filter(
-        database.Agreement.task_id == task_id,
-        database.Agreement.status == database.AgreementStatus.ACCEPTED
-    ).first()
-    
-    if not agreement:
+    if parties.agreement_status != database.AgreementStatus.ACCEPTED:
         raise HTTPException(status_code=403, detail="Agreement must be accepted before messaging")
     
     # Verify user is either customer or tasker
-    if task.customer_id != current_user.id and agreement.tasker_id != current_user.id:
+    if parties.customer_id != current_user.id and parties.tasker_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to send messages for this task")
     
     # Determine receiver
-    receiver_id = agreement.tasker_id if current_user.id == task.customer_id else task.customer_id
+    receiver_id = parties.tasker_id if current_user.id == parties.customer_id else parties.customer_id
     
     # Create message
     db_message = database.Message(
@@ -569,21 +974,91 @@ def send_task_message(
         task_id=task_id,
         content=message.content
     )
-    db.add(db_message)
+    return save_message(db, db_message)
+
+
+# Notification endpoints
+@app.get("/notifications", response_model=List[schemas.NotificationResponse])
+def get_notifications(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_read_db)
+):
+    """The current user's inbox, newest first"""
+    query = db.query(database.Notification).filter(database.Notification.user_id == current_user.id)
+    if cursor:
+        before_id, = decode_cursor(cursor, 1)
+        query = query.filter(database.Notification.id < before_id)
+    rows = query.order_by(database.Notification.id.desc()).limit(limit + 1).all()
+    return paginate(rows, limit, response, key=lambda row: (row.id,))
+
+@app.put("/notifications/{notification_id}/read")
+def mark_notification_read(
+    notification_id: int,
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_write_db)
+):
+    user_id = db.query(database.Notification.user_id).filter(database.Notification.id == notification_id).scalar()
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    
+    if user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db.execute(
+        update(database.Notification)
+        .where(database.Notification.id == notification_id)
+        .values(read=True)
+    )
     db.commit()
-    db.refresh(db_message)
-    return db_message
+    return {"message": "Notification marked as read"}
 
+@app.put("/notifications/read")
+def mark_notifications_read(
+    up_to: int = Query(..., description="Mark this notification and every older one as read"),
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_write_db)
+):
+    """Mark the inbox read up to the newest notification the client has shown"""
+    # A range on the (user_id, id) index
+    updated = db.execute(
+        update(database.Notification)
+        .where(
+            database.Notification.user_id == current_user.id,
+            database.Notification.id <= up_to,
+            database.Notification.read == False
+        )
+        .values(read=True)
+    ).rowcount
+    db.commit()
+    return {"updated": updated}
+
+@app.get("/notifications/stream")
+def stream_notifications(
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """Server-sent events carrying new notifications as they are written"""
+    # The stream can stay open for hours; don't hold a pooled connection for it
+    user_id = current_user.id
+    db.close()
+    return StreamingResponse(
+        notifications.event_stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Review endpoints
 @app.post("/reviews", response_model=schemas.ReviewResponse)
 def create_review(
     review: schemas.ReviewCreate,
     current_user: database.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_write_db)
 ):
     # Verify the task is completed
-    task = db.query(database.Task).filter(database.Task.id == review.task_id).first()
+    task = entities.get_task(db, review.task_id)
     if not task or task.status != database.TaskStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Can only review completed tasks")
     
@@ -616,9 +1091,56 @@ def create_review(
     return db_review
 
 @app.get("/users/{user_id}/reviews", response_model=List[schemas.ReviewResponse])
-def get_user_reviews(user_id: int, db: Session = Depends(database.get_db)):
+def get_user_reviews(user_id: int, db: Session = Depends(database.get_read_db)):
     return db.query(database.Review).filter(database.Review.reviewee_id == user_id).all()
 
+# Analytics endpoints
+def analytics_viewer(current_user: database.User = Depends(auth.get_current_user)) -> database.User:
+    if not analytics.can_view(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized to view analytics")
+    return current_user
+
+@app.get("/analytics/daily", response_model=List[schemas.AnalyticsDayResponse])
+def get_daily_analytics(
+    date_from: Optional[date] = Query(None, description="First UTC day (default: 30 days before date_to)"),
+    date_to: Optional[date] = Query(None, description="Last UTC day (default: today)"),
+    current_user: database.User = Depends(analytics_viewer),
+    db: Session = Depends(database.get_read_db)
+):
+    """Per-day marketplace activity; days without any have no entry"""
+    return analytics.daily(db, *analytics.resolve_range(date_from, date_to))
+
+@app.get("/analytics/summary", response_model=schemas.AnalyticsSummary)
+def get_analytics_summary(
+    date_from: Optional[date] = Query(None, description="First UTC day (default: 30 days before date_to)"),
+    date_to: Optional[date] = Query(None, description="Last UTC day (default: today)"),
+    current_user: database.User = Depends(analytics_viewer),
+    db: Session = Depends(database.get_read_db)
+):
+    """Totals, acceptance rate, bid-to-budget ratios and time to first bid over a range of days"""
+    return analytics.summary(db, *analytics.resolve_range(date_from, date_to))
+
+# Batch endpoint
+@app.post("/batch", response_model=List[schemas.BatchResult])
+async def run_batch(
+    request: Request,
+    current_user: database.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """Run several sub-requests in one round trip, as the current user (see batch.py)"""
+    if int(request.headers.get("content-length") or 0) > batch.BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {batch.BATCH_MAX_BYTES} bytes")
+    body = await request.body()
+    if len(body) > batch.BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {batch.BATCH_MAX_BYTES} bytes")
+    try:
+        payload = schemas.BatchRequest.model_validate_json(body)
+    except ValidationError as error:
+        raise RequestValidationError(error.errors())
+    if len(payload.requests) > batch.BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {batch.BATCH_MAX_REQUESTS} requests")
+    return await batch.run_batch(app, request.scope, payload.requests, current_user, db)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Multi-get: many rows by primary key in one request.
+
+Endpoints take ``ids=3,1,2`` and answer with the rows found in the
+requested order (repeats dropped). Ids with no row are listed in the
+``X-Missing-Ids`` response header, so the body keeps its plain list shape.
+Rows are loaded with IN queries of at most IN_CHUNK_SIZE ids each, well
+under SQLite's limit on bound parameters.
+
+Configuration:
+    TASKER_MULTI_GET_MAX_IDS=200   ids accepted per request
+"""
+
+import os
+from typing import Any, Callable, Dict, Iterable, List
+
+from fastapi import HTTPException, Response
+
+MULTI_GET_MAX_IDS = int(os.getenv("TASKER_MULTI_GET_MAX_IDS", "200"))
+
+MISSING_IDS_HEADER = "X-Missing-Ids"
+
+# Ids bound per IN query
+IN_CHUNK_SIZE = 500
+
+
+def parse_ids(ids: str) -> List[int]:
+    """
+    Parse a comma-separated ``ids`` parameter, dropping repeats.
+
+    Raises:
+        HTTPException(400) if an id is not an integer or there are too many
+    """
+    try:
+        parsed = list(dict.fromkeys(int(value) for value in ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids must name at least one id")
+    if len(parsed) > MULTI_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MULTI_GET_MAX_IDS} ids per request")
+    return parsed
+
+
+def load_by_ids(fetch: Callable[[List[int]], Iterable], ids: List[int]) -> Dict[int, Any]:
+    """
+    Rows keyed by id, fetched chunk by chunk.
+
+    Args:
+        fetch: Returns the rows for one chunk of ids, e.g. an IN query
+        ids: Ids to load
+    """
+    found = {}
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        for row in fetch(ids[start:start + IN_CHUNK_SIZE]):
+            found[row.id] = row
+    return found
+
+
+def in_request_order(found: Dict[int, Any], ids: List[int], response: Response) -> list:
+    """Rows in the order requested; missing ids go to the X-Missing-Ids header."""
+    missing = [key for key in ids if key not in found]
+    if missing:
+        response.headers[MISSING_IDS_HEADER] = ",".join(map(str, missing))
+    return [found[key] for key in ids if key in found]
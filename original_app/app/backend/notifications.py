@@ -0,0 +1,217 @@
+"""
+Task-match notifications for taskers.
+
+When a task is posted, every tasker whose skills appear in the task's title
+or description and who is in the task's city gets an inbox entry. Matching
+runs against an inverted index (tasker_skill_index) from "skill:<word>" and
+"city:<name>" tokens to tasker ids, maintained when taskers register, so
+candidates come from one INTERSECT over two index range scans instead of a
+scan of every tasker profile.
+
+Fan-out runs as a "notifications.task_created" job (see jobs.py), off the
+request path. Inbox rows are inserted in ascending tasker id order, in
+batches of NOTIFY_BATCH_SIZE with a commit after each, so the SQLite write
+lock is only held briefly and other writers interleave with a large
+fan-out. A retried job resumes after the last tasker already notified.
+
+Taskers connected to GET /notifications/stream in this process are pushed
+their new notifications as server-sent events by the NotificationBroker;
+everyone else sees them on the next GET /notifications.
+
+Configuration:
+    TASKER_NOTIFY_BATCH_SIZE=2000       inbox rows inserted per transaction
+    TASKER_NOTIFY_HEARTBEAT_SECONDS=15  keep-alive comment interval on streams
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Set
+
+from sqlalchemy import func, insert, intersect, select
+from sqlalchemy.orm import Session
+
+import schemas
+from database import Notification, SkillIndexEntry, Task, User, UserRole
+from feed import city_of
+from jobs import enqueue, job
+
+NOTIFY_BATCH_SIZE = int(os.getenv("TASKER_NOTIFY_BATCH_SIZE", "2000"))
+NOTIFY_HEARTBEAT_SECONDS = float(os.getenv("TASKER_NOTIFY_HEARTBEAT_SECONDS", "15"))
+
+TASK_MATCH = "task_match"
+
+# Words too common to say anything about a skill
+STOP_WORDS = {"and", "the", "for", "with", "from", "into", "any", "all", "job", "work", "help"}
+
+
+def skill_tokens(text: str) -> Set[str]:
+    words = re.findall(r"[a-z0-9]+", (text or "").casefold())
+    return {f"skill:{word}" for word in words if len(word) >= 3 and word not in STOP_WORDS}
+
+
+def tasker_tokens(tasker) -> Set[str]:
+    tokens = skill_tokens(tasker.skills)
+    city = city_of(tasker.location)
+    if tokens and city:
+        tokens.add(f"city:{city}")
+    return tokens
+
+
+def index_tasker(db: Session, tasker: User):
+    """(Re)index one tasker's skills and city; the caller commits."""
+    db.query(SkillIndexEntry).filter(SkillIndexEntry.tasker_id == tasker.id).delete(synchronize_session=False)
+    rows = [{"token": token, "tasker_id": tasker.id} for token in tasker_tokens(tasker)]
+    if rows:
+        db.execute(insert(SkillIndexEntry), rows)
+
+
+def ensure_skill_index(db: Session) -> int:
+    """
+    Build the index from scratch if it is empty, e.g. on a database created
+    before it existed. Returns the number of taskers indexed.
+    """
+    if db.query(SkillIndexEntry.tasker_id).first() is not None:
+        return 0
+    taskers = db.query(User).filter(User.role == UserRole.TASKER).all()
+    for tasker in taskers:
+        index_tasker(db, tasker)
+    db.commit()
+    return len(taskers)
+
+
+def matching_taskers(db: Session, task: Task, after: int = 0) -> List[int]:
+    """Ids of taskers matching a task, above ``after``, in ascending order."""
+    tokens = skill_tokens(f"{task.title} {task.description}")
+    city = city_of(task.location)
+    if not tokens or not city:
+        return []
+    by_skill = select(SkillIndexEntry.tasker_id).where(
+        SkillIndexEntry.token.in_(tokens), SkillIndexEntry.tasker_id > after
+    )
+    by_city = select(SkillIndexEntry.tasker_id).where(
+        SkillIndexEntry.token == f"city:{city}", SkillIndexEntry.tasker_id > after
+    )
+    return sorted(db.scalars(intersect(by_skill, by_city)))
+
+
+def fan_out(db: Session, task: Task, batch_size: int = NOTIFY_BATCH_SIZE) -> int:
+    """
+    Write a task-match notification for every matching tasker, committing
+    after each batch. Safe to re-run: taskers already notified are skipped.
+
+    Returns:
+        Number of notifications written
+    """
+    notified = db.query(func.max(Notification.user_id)).filter(
+        Notification.task_id == task.id, Notification.kind == TASK_MATCH
+    ).scalar() or 0
+    tasker_ids = matching_taskers(db, task, after=notified)
+    now = datetime.utcnow()
+    for start in range(0, len(tasker_ids), batch_size):
+        batch = tasker_ids[start:start + batch_size]
+        db.execute(insert(Notification), [
+            {"user_id": tasker_id, "kind": TASK_MATCH, "task_id": task.id, "read": False, "created_at": now}
+            for tasker_id in batch
+        ])
+        db.commit()
+        push_new(db, task.id, batch)
+    return len(tasker_ids)
+
+
+@job("notifications.task_created", concurrency=2)
+def task_created_job(db: Session, task_id: int):
+    task = db.get(Task, task_id)
+    if task is not None:
+        fan_out(db, task)
+
+
+def queue_task(db: Session, task_id: int):
+    """Queue notifications for a newly posted task."""
+    enqueue(db, "notifications.task_created", task_id=task_id)
+
+
+def push_new(db: Session, task_id: int, user_ids: Iterable[int]):
+    """Push a task's notifications to whichever of ``user_ids`` are connected."""
+    connected = broker.connected(user_ids)
+    if not connected:
+        return
+    rows = db.query(Notification).filter(
+        Notification.task_id == task_id,
+        Notification.kind == TASK_MATCH,
+        Notification.user_id.in_(connected)
+    )
+    for row in rows:
+        broker.publish(row.user_id, schemas.NotificationResponse.model_validate(row).model_dump(mode="json"))
+
+
+class NotificationBroker:
+    """
+    In-process fan-out to connected push clients.
+
+    Subscribers are asyncio queues owned by the event loop serving the
+    stream; publish() may be called from any thread.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        # user id -> {queue: event loop that owns it}
+        self._subscribers: Dict[int, Dict[asyncio.Queue, asyncio.AbstractEventLoop]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Register a queue for ``user_id``; call from the event loop."""
+        queue = asyncio.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, {})
+            subscribers.pop(queue, None)
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def connected(self, user_ids: Iterable[int]) -> Set[int]:
+        with self._lock:
+            return self._subscribers.keys() & set(user_ids)
+
+    def publish(self, user_id: int, payload: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, {}).items())
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, payload)
+
+
+def _offer(queue: asyncio.Queue, payload: dict):
+    # A client too slow to drain its queue misses pushes, not notifications:
+    # everything is still in its inbox
+    if not queue.full():
+        queue.put_nowait(payload)
+
+
+broker = NotificationBroker()
+
+
+async def event_stream(
+    user_id: int,
+    heartbeat: float = NOTIFY_HEARTBEAT_SECONDS,
+    broker: NotificationBroker = broker
+) -> AsyncIterator[str]:
+    """Server-sent events for one connected user, with keep-alive comments."""
+    queue = broker.subscribe(user_id)
+    try:
+        yield ": connected\n\n"
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: notification\ndata: {json.dumps(payload)}\n\n"
+    finally:
+        broker.unsubscribe(user_id, queue)
@@ -0,0 +1,67 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor is the sort key of the last row a client has seen, encoded as
+URL-safe base64 JSON. List endpoints return the cursor for the next page in
+the ``X-Next-Cursor`` response header and omit it on the last page, so the
+response body keeps its plain list shape.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def _object_hook(value):
+    if set(value) == {"dt"}:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode sort key values into an opaque cursor string."""
+    raw = json.dumps(values, default=_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        HTTPException(400) if the cursor is malformed or has the wrong arity
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")), object_hook=_object_hook)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def paginate(rows: list, limit: int, response: Response, key) -> list:
+    """
+    Trim a page fetched with ``limit + 1`` rows and set the next cursor header.
+
+    Args:
+        rows: Up to limit + 1 rows in page order
+        limit: Page size requested by the client
+        response: Response whose headers receive the next cursor
+        key: Function returning the sort key tuple of a row
+    """
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
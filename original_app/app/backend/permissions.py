@@ -6,9 +6,10 @@ each other based on their relationships through bids, offers, or agreements.
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, select, union
 from database import User, Task, Bid, Offer, Agreement
-from typing import Optional
+from invalidation import VersionedCache
+from typing import Iterable, Optional, Set
 
 
 def can_message_user(
@@ -112,6 +113,25 @@ def can_message_user(
     return False
 
 
+# Shared by all requests in this worker. Whether two users may message each
+# other only changes with their bids, offers and agreements, whose triggers
+# bump both users' "relations:<id>" scopes.
+messaging_permissions = VersionedCache(name="messaging_permissions")
+
+
+def can_message_user_cached(db: Session, sender_id: int, receiver_id: int) -> bool:
+    """
+    can_message_user, answered from this worker's cache while neither user's
+    bids, offers or agreements have changed in any worker.
+    """
+    return messaging_permissions.get(
+        db,
+        (sender_id, receiver_id),
+        (f"relations:{sender_id}", f"relations:{receiver_id}"),
+        lambda: can_message_user(db, sender_id, receiver_id)
+    )
+
+
 def get_messageable_users(db: Session, user_id: int) -> list[int]:
     """
     Get list of user IDs that the specified user can message.
@@ -168,4 +188,27 @@ def get_messageable_users(db: Session, user_id: int) -> list[int]:
     # Remove self if present
     messageable_ids.discard(user_id)
     
-    return list(messageable_ids)
\ No newline at end of file
+    return list(messageable_ids)
+
+
+def messageable_among(db: Session, user_id: int, candidate_ids: Iterable[int]) -> Set[int]:
+    """
+    The users among candidate_ids that user_id can message (the same
+    relationships as get_messageable_users), found in one query.
+    """
+    candidates = [candidate for candidate in set(candidate_ids) if candidate != user_id]
+    if not candidates:
+        return set()
+    related = union(
+        select(Task.customer_id).join(Agreement, Agreement.task_id == Task.id).where(
+            Agreement.tasker_id == user_id, Task.customer_id.in_(candidates)),
+        select(Agreement.tasker_id).join(Task, Agreement.task_id == Task.id).where(
+            Task.customer_id == user_id, Agreement.tasker_id.in_(candidates)),
+        select(Task.customer_id).join(Bid, Bid.task_id == Task.id).where(
+            Bid.tasker_id == user_id, Bid.withdrawn == False, Task.customer_id.in_(candidates)),
+        select(Bid.tasker_id).join(Task, Bid.task_id == Task.id).where(
+            Task.customer_id == user_id, Bid.withdrawn == False, Bid.tasker_id.in_(candidates)),
+        select(Offer.tasker_id).where(Offer.customer_id == user_id, Offer.tasker_id.in_(candidates)),
+        select(Offer.customer_id).where(Offer.tasker_id == user_id, Offer.customer_id.in_(candidates)),
+    )
+    return set(db.execute(related).scalars())
@@ -0,0 +1,194 @@
+"""
+Per-user token-bucket rate limiting and admission control.
+
+One client polling /messages in a tight loop can saturate the single SQLite
+writer and the request threadpool. This middleware gives every caller a
+token bucket per route class and answers 429 with Retry-After once the
+bucket is empty, before any database work happens.
+
+Callers are identified by the subject of a valid, unexpired JWT (see
+auth.token_subject); anonymous requests, expired tokens and the /token and
+/register routes are keyed by client address. Buckets live in a
+plain dict of small slotted objects and are evicted once idle long enough
+to have refilled, so memory tracks the number of active callers.
+
+Configuration:
+    TASKER_RATE_LIMIT_ENABLED=1                      turn limiting on
+    TASKER_RATE_LIMITS=auth=0.2:10,read=20:60,write=5:20
+        per route class: refill rate (requests/second) and burst size
+"""
+
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from auth import token_subject
+
+RATE_LIMIT_ENABLED = os.getenv("TASKER_RATE_LIMIT_ENABLED", "0") == "1"
+
+DEFAULT_LIMITS = "auth=0.2:10,read=20:60,write=5:20"
+
+# Routes that can be called anonymously and deserve their own tight budget
+AUTH_PATHS = ("/token", "/register")
+
+# Health probes from the orchestrator are never limited, and a batch is
+# charged per sub-request as each one passes through this middleware
+EXEMPT_PATHS = ("/health/ready", "/batch")
+
+# Buckets untouched for this many requests are swept if already refilled
+SWEEP_EVERY = 10000
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse "class=rate:burst,..." into {class: (rate, burst)}.
+
+    Raises:
+        ValueError: If a rate or burst is not a positive number; a bucket
+            that never refills could never tell a caller when to retry
+    """
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, values = item.split("=")
+        rate, burst = values.split(":")
+        if float(rate) <= 0 or float(burst) <= 0:
+            raise ValueError(f"Rate limit {item.strip()!r} needs a positive rate and burst")
+        limits[name.strip()] = (float(rate), float(burst))
+    return limits
+
+
+RATE_LIMITS = parse_limits(os.getenv("TASKER_RATE_LIMITS", DEFAULT_LIMITS))
+
+
+class Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by (route class, caller).
+
+    Args:
+        limits: {route class: (refill rate per second, burst size)}
+        enabled: When False the middleware lets every request through
+        clock: Monotonic time source, replaceable in tests
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, float]] = RATE_LIMITS,
+        enabled: bool = RATE_LIMIT_ENABLED,
+        clock=time.monotonic
+    ):
+        self.limits = limits
+        self.enabled = enabled
+        self.clock = clock
+        self.buckets = {}
+        self._calls = 0
+
+    def acquire(self, route_class: str, caller: str) -> Tuple[bool, float, float]:
+        """
+        Take one token from the caller's bucket.
+
+        Returns:
+            (allowed, tokens remaining, seconds until a token is available)
+        """
+        rate, burst = self.limits[route_class]
+        now = self.clock()
+        key = (route_class, caller)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        self._calls += 1
+        if self._calls % SWEEP_EVERY == 0:
+            self.evict_idle(now)
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True, bucket.tokens, 0.0
+        return False, bucket.tokens, (1 - bucket.tokens) / rate
+
+    def evict_idle(self, now: Optional[float] = None):
+        """Drop buckets that have been idle long enough to be full again."""
+        now = self.clock() if now is None else now
+        stale = [
+            key for key, bucket in self.buckets.items()
+            if now - bucket.updated >= self.limits[key[0]][1] / self.limits[key[0]][0]
+        ]
+        for key in stale:
+            del self.buckets[key]
+
+
+def route_class(method: str, path: str) -> str:
+    if path in AUTH_PATHS:
+        return "auth"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing TokenBucketLimiter budgets."""
+
+    def __init__(self, app, limiter: TokenBucketLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    def _caller(self, scope, route: str) -> str:
+        if route != "auth":
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    # Signatures are checked once per token; expiry every time
+                    subject = token_subject(value.decode("latin-1"))
+                    if subject is not None:
+                        return "user:" + subject
+                    break
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not self.limiter.enabled
+            or scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or scope["path"] in EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        route = route_class(scope["method"], scope["path"])
+        allowed, remaining, retry_after = self.limiter.acquire(route, self._caller(scope, route))
+        limit_headers = [
+            (b"x-ratelimit-limit", str(int(self.limiter.limits[route][1])).encode()),
+            (b"x-ratelimit-remaining", str(int(remaining)).encode()),
+        ]
+
+        if not allowed:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+            response.raw_headers.extend(limit_headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + limit_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
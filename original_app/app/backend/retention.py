@@ -0,0 +1,219 @@
+"""
+Message retention and compaction.
+
+The messages table only grows, yet threads on closed tasks are rarely read
+again. Compaction keeps recent messages hot and packs read messages older
+than the retention window, from threads whose task is completed or
+archived, into MessageBlock rows: a zlib-compressed JSON array per block
+plus the block's message id range. Blocks are decompressed only when a
+client reads back into that part of the thread, and a page of a thread
+only inflates the blocks it reaches.
+
+Unread messages are never compacted, so unread counts and mark-as-read keep
+working on the hot table. The GET /messages inbox lists hot messages only:
+everything unread or newer than the retention window, and whole threads of
+open tasks. Compacted history is read back through the task's thread,
+GET /tasks/{task_id}/messages.
+
+Configuration:
+    TASKER_MESSAGE_RETENTION_DAYS=30         keep messages hot for this long
+    TASKER_MESSAGE_BLOCK_SIZE=200            messages per compressed block
+    TASKER_COMPACTION_INTERVAL_SECONDS=0     background sweep interval (0 = off)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+import schemas
+from database import Message, MessageBlock, Task, TaskStatus, archive_tables
+
+MESSAGE_RETENTION_DAYS = int(os.getenv("TASKER_MESSAGE_RETENTION_DAYS", "30"))
+MESSAGE_BLOCK_SIZE = int(os.getenv("TASKER_MESSAGE_BLOCK_SIZE", "200"))
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("TASKER_COMPACTION_INTERVAL_SECONDS", "0"))
+
+CLOSED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.ARCHIVED)
+
+logger = logging.getLogger(__name__)
+
+
+def encode_block(messages: List[Message]) -> bytes:
+    """Serialize messages to a zlib-compressed JSON array."""
+    rows = [
+        {
+            "id": m.id,
+            "sender_id": m.sender_id,
+            "receiver_id": m.receiver_id,
+            "task_id": m.task_id,
+            "content": m.content,
+            "read": m.read,
+            "created_at": m.created_at.isoformat()
+        }
+        for m in messages
+    ]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_rows(payload: bytes) -> List[dict]:
+    """Inflate a block payload into encode_block's rows, timestamps as ISO strings."""
+    return json.loads(zlib.decompress(payload))
+
+
+def decode_block(payload: bytes) -> List[schemas.MessageResponse]:
+    """Inflate a block payload back into message responses."""
+    rows = decode_rows(payload)
+    for row in rows:
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return [schemas.MessageResponse(**row) for row in rows]
+
+
+def _compactable(query, cutoff: datetime):
+    return query.filter(
+        Message.read == True,
+        Message.created_at < cutoff
+    )
+
+
+def compact_task_messages(
+    db: Session,
+    task_id: int,
+    cutoff: datetime,
+    block_size: int = MESSAGE_BLOCK_SIZE
+) -> int:
+    """
+    Compact one task thread, one block per transaction.
+
+    Returns:
+        Number of messages moved into blocks
+    """
+    total = 0
+    while True:
+        messages = _compactable(
+            db.query(Message).filter(Message.task_id == task_id), cutoff
+        ).order_by(Message.id).limit(block_size).all()
+        if not messages:
+            return total
+        try:
+            db.add(MessageBlock(
+                task_id=task_id,
+                first_message_id=messages[0].id,
+                last_message_id=messages[-1].id,
+                message_count=len(messages),
+                payload=encode_block(messages)
+            ))
+            db.query(Message).filter(
+                Message.id.in_([m.id for m in messages])
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        db.expunge_all()
+        total += len(messages)
+        if len(messages) < block_size:
+            return total
+
+
+def compact_closed_conversations(
+    db: Session,
+    older_than_days: int = MESSAGE_RETENTION_DAYS,
+    block_size: int = MESSAGE_BLOCK_SIZE
+) -> int:
+    """
+    Compact old read messages in every closed task thread.
+
+    Returns:
+        Total number of messages moved into blocks
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    # Messages of archived tasks stay hot while their task moves to the archive
+    archived_task_ids = select(archive_tables[Task.__tablename__].c.id)
+    task_ids = [
+        row.task_id for row in _compactable(
+            db.query(Message.task_id).outerjoin(Task, Message.task_id == Task.id), cutoff
+        ).filter(or_(Task.status.in_(CLOSED_STATUSES), Message.task_id.in_(archived_task_ids))).distinct()
+    ]
+    return sum(compact_task_messages(db, task_id, cutoff, block_size) for task_id in task_ids)
+
+
+def load_compacted_messages(
+    db: Session,
+    task_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[schemas.MessageResponse]:
+    """
+    Decompress the compacted history of a task thread, oldest first.
+
+    Args:
+        db: Database session
+        task_id: Thread to load
+        before_id: Only return messages with a smaller id
+        after_id: Only return messages with a larger id
+        limit: Return at least this many of the messages nearest the bound
+            (the newest, unless only after_id is given) when there are that
+            many, so callers paging through a thread only inflate the blocks
+            they actually need
+    """
+    query = db.query(
+        MessageBlock.id, MessageBlock.first_message_id, MessageBlock.last_message_id
+    ).filter(MessageBlock.task_id == task_id)
+    if before_id is not None:
+        query = query.filter(MessageBlock.first_message_id < before_id)
+    if after_id is not None:
+        query = query.filter(MessageBlock.last_message_id > after_id)
+    if limit is not None and limit <= 0:
+        return []
+
+    def wanted(message):
+        return (before_id is None or message.id < before_id) and (after_id is None or message.id > after_id)
+
+    # Blocks are picked by their end nearest the bound. Unread messages are
+    # compacted by a later run, so blocks can nest inside older ones: keep
+    # inflating until no block left can hold a message nearer the bound
+    # than the furthest of the ``limit`` found so far
+    forwards = after_id is not None and before_id is None
+    order = MessageBlock.first_message_id if forwards else MessageBlock.last_message_id.desc()
+    messages = []
+    for block in query.order_by(order):
+        if limit is not None and len(messages) >= limit:
+            messages.sort(key=lambda m: m.id, reverse=not forwards)
+            furthest = messages[limit - 1].id
+            if (block.first_message_id > furthest) if forwards else (block.last_message_id < furthest):
+                break
+        payload = db.query(MessageBlock.payload).filter(MessageBlock.id == block.id).scalar()
+        messages.extend(m for m in decode_block(payload) if wanted(m))
+    return sorted(messages, key=lambda m: m.id)
+
+
+def start_compactor(
+    session_factory: Callable[[], Session],
+    interval: float = COMPACTION_INTERVAL_SECONDS
+) -> Optional[threading.Thread]:
+    """Start a daemon thread that compacts closed threads every ``interval`` seconds."""
+    if interval <= 0:
+        return None
+
+    def sweep():
+        while True:
+            db = session_factory()
+            try:
+                compact_closed_conversations(db)
+            except Exception:
+                logger.exception("Message compaction sweep failed")
+            finally:
+                db.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="message-compactor", daemon=True)
+    thread.start()
+    return thread
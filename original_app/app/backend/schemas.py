@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from typing import Any, Dict, Optional, List
+from datetime import date, datetime
 from database import UserRole, TaskStatus, AgreementStatus
 
 # User schemas
@@ -24,6 +24,20 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserPublicResponse(BaseModel):
+    """A user without contact details, as other users see them"""
+    id: int
+    full_name: str
+    role: UserRole
+    location: Optional[str] = None
+    skills: Optional[str] = None
+    hourly_rate: Optional[float] = None
+    bio: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -32,6 +46,10 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 # Task schemas
 class TaskBase(BaseModel):
@@ -52,16 +70,35 @@ class TaskUpdate(BaseModel):
     budget: Optional[float] = None
     status: Optional[TaskStatus] = None
 
+class BidStats(BaseModel):
+    bid_count: int
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    mean_amount: Optional[float] = None
+    median_amount: Optional[float] = None
+    last_bid_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 class TaskResponse(TaskBase):
     id: int
     customer_id: int
     status: TaskStatus
     created_at: datetime
     updated_at: datetime
+    bid_count: int = 0
+    lowest_bid: Optional[float] = None
+    offer_count: int = 0
+    message_count: int = 0
+    bid_stats: Optional[BidStats] = None
     
     class Config:
         from_attributes = True
 
+class InvolvedTaskResponse(TaskResponse):
+    involvement: List[str] = []
+
 # Bid schemas
 class BidBase(BaseModel):
     task_id: int
@@ -74,6 +111,7 @@ class BidCreate(BidBase):
 class BidResponse(BidBase):
     id: int
     tasker_id: int
+    withdrawn: bool = False
     created_at: datetime
     
     class Config:
@@ -144,6 +182,17 @@ class MessageResponseWithTask(MessageResponse):
     class Config:
         from_attributes = True
 
+# Notification schemas
+class NotificationResponse(BaseModel):
+    id: int
+    kind: str
+    task_id: Optional[int] = None
+    read: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 # Review schemas
 class ReviewBase(BaseModel):
     task_id: int
@@ -160,4 +209,50 @@ class ReviewResponse(ReviewBase):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Analytics schemas
+class AnalyticsDayResponse(BaseModel):
+    day: date
+    tasks_posted: int
+    bids_placed: int
+    agreements_created: int
+    agreements_completed: int
+    completed_gmv: float
+    
+    class Config:
+        from_attributes = True
+
+class DistributionSummary(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class AnalyticsSummary(BaseModel):
+    date_from: date
+    date_to: date
+    tasks_posted: int
+    bids_placed: int
+    agreements_created: int
+    agreements_completed: int
+    completed_gmv: float
+    acceptance_rate: Optional[float] = None  # agreements created per task posted
+    bid_to_budget: DistributionSummary
+    hours_to_first_bid: DistributionSummary
+
+# Batch schemas
+class BatchSubRequest(BaseModel):
+    method: str = Field(pattern="^(GET|POST|PUT|DELETE)$")
+    path: str = Field(pattern="^/")  # may include a query string
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest] = Field(min_length=1)
+
+class BatchResult(BaseModel):
+    status: int
+    headers: Dict[str, str]
+    body: Optional[Any] = None
+    duration_ms: float
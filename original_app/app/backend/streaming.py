@@ -0,0 +1,64 @@
+"""
+Streaming helpers for bulk list endpoints.
+
+Partners that sync whole tables can ask for newline-delimited JSON by sending
+``Accept: application/x-ndjson``. Rows are pulled from the database in
+batches with ``yield_per`` and written to the response as soon as each batch
+is serialized, so server memory stays flat regardless of the result size and
+the first bytes leave the server before the query has finished.
+"""
+
+from typing import Iterator, Type
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Query
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Rows fetched from the cursor (and serialized) per chunk
+STREAM_BATCH_SIZE = 500
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Return True if the client asked for an NDJSON stream."""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "").lower()
+
+
+def iter_ndjson(
+    query: Query,
+    schema: Type[BaseModel],
+    batch_size: int = STREAM_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Serialize query results as NDJSON, one chunk per batch of rows.
+
+    Args:
+        query: ORM query to stream; it is executed with ``yield_per``
+        schema: Pydantic response model used to serialize each row
+        batch_size: Number of rows buffered per chunk
+
+    Yields:
+        UTF-8 encoded chunks, each holding up to ``batch_size`` lines
+    """
+    lines = []
+    for row in query.yield_per(batch_size):
+        lines.append(schema.model_validate(row).model_dump_json())
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines.clear()
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def ndjson_response(
+    query: Query,
+    schema: Type[BaseModel],
+    batch_size: int = STREAM_BATCH_SIZE
+) -> StreamingResponse:
+    """Wrap a query in a StreamingResponse that emits NDJSON."""
+    return StreamingResponse(
+        iter_ndjson(query, schema, batch_size),
+        media_type=NDJSON_MEDIA_TYPE
+    )
@@ -0,0 +1,162 @@
+"""
+Tests for the analytics rollups (analytics.py) and GET /analytics/*.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import analytics
+from database import (
+    Base, User, Task, Bid, Agreement, AgreementStatus, AnalyticsSample, AnalyticsSampleBlock, UserRole,
+    archive_tables
+)
+from auth import create_access_token
+from conftest import engine, TestingSessionLocal
+
+
+CUSTOMER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+TASKER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+DAY = datetime(2030, 3, 1)
+RANGE = {"date_from": "2030-03-01", "date_to": "2030-03-02"}
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_EMAILS", {"customer@test.com"})
+    db = TestingSessionLocal()
+    db.add(User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER))
+    db.add(User(email="tasker@test.com", hashed_password="x", full_name="Tasker", role=UserRole.TASKER))
+    db.commit()
+    db.close()
+    return client
+
+
+def seed(db):
+    """Two tasks on DAY with bids over two days, one agreement completed on the second day."""
+    db.add_all([
+        Task(customer_id=1, title="Fix sink", description="x", location="Austin", date=DAY, budget=100.0, created_at=DAY),
+        Task(customer_id=1, title="Paint", description="x", location="Austin", date=DAY, budget=200.0,
+             created_at=DAY + timedelta(hours=6)),
+    ])
+    db.flush()
+    db.add_all([
+        Bid(task_id=1, tasker_id=2, amount=80.0, created_at=DAY + timedelta(hours=2)),
+        Bid(task_id=1, tasker_id=2, amount=120.0, created_at=DAY + timedelta(hours=3)),
+        Bid(task_id=2, tasker_id=2, amount=100.0, created_at=DAY + timedelta(days=1, hours=6)),
+    ])
+    db.add(Agreement(task_id=1, tasker_id=2, amount=80.0, created_at=DAY + timedelta(hours=4)))
+    db.commit()
+
+
+def test_rollups_follow_writes(client):
+    db = TestingSessionLocal()
+    seed(db)
+    db.close()
+    # Completion is a Core UPDATE, which the triggers see like any other write
+    client.post("/agreements/1/complete", headers=CUSTOMER)
+    today = datetime.utcnow().date().isoformat()
+
+    days = client.get("/analytics/daily", headers=CUSTOMER, params=RANGE).json()
+    [completed] = client.get("/analytics/daily", headers=CUSTOMER, params={"date_from": today}).json()
+
+    assert [(day["day"], day["tasks_posted"], day["bids_placed"], day["agreements_created"]) for day in days] == [
+        ("2030-03-01", 2, 2, 1), ("2030-03-02", 0, 1, 0)
+    ]
+    assert (completed["day"], completed["agreements_completed"], completed["completed_gmv"]) == (today, 1, 80.0)
+
+    summary = client.get("/analytics/summary", headers=CUSTOMER, params=RANGE).json()
+    assert (summary["tasks_posted"], summary["bids_placed"], summary["acceptance_rate"]) == (2, 3, 0.5)
+    assert summary["bid_to_budget"] == {"count": 3, "mean": pytest.approx(2.5 / 3), "p50": 0.8,
+                                        "p90": pytest.approx(1.12), "p99": pytest.approx(1.192)}
+    # First bids only: 2 hours for "Fix sink", 24 for "Paint"
+    assert summary["hours_to_first_bid"]["count"] == 2
+    assert summary["hours_to_first_bid"]["p50"] == pytest.approx(13.0)
+
+
+def test_packed_samples_give_the_same_answers(client):
+    db = TestingSessionLocal()
+    seed(db)
+    before = client.get("/analytics/summary", headers=CUSTOMER, params=RANGE).json()
+
+    assert analytics.pack_all_samples(db, batch_size=2) == 5
+    assert db.query(AnalyticsSample).count() == 0
+    block = db.get(AnalyticsSampleBlock, (analytics.BID_TO_BUDGET, DAY.date()))
+    assert (block.value_count, list(analytics._unpack(block.payload))) == (2, [0.8, 1.2])
+    # A sample arriving after packing is merged into the same block on the next run
+    db.add(Bid(task_id=2, tasker_id=2, amount=150.0, created_at=DAY + timedelta(days=1, hours=7)))
+    db.commit()
+    assert client.get("/analytics/summary", headers=CUSTOMER, params=RANGE).json()["bid_to_budget"]["count"] == 4
+    analytics.pack_all_samples(db)
+    db.close()
+
+    after = client.get("/analytics/summary", headers=CUSTOMER, params=RANGE).json()
+    assert after["bid_to_budget"]["count"] == 4
+    assert after["hours_to_first_bid"] == before["hours_to_first_bid"]
+
+
+def test_existing_databases_are_backfilled(client):
+    db = TestingSessionLocal()
+    seed(db)
+    db.query(Agreement).update({"status": AgreementStatus.COMPLETED, "completed_at": DAY + timedelta(days=1)})
+    db.commit()
+    expected = client.get("/analytics/summary", headers=CUSTOMER, params=RANGE).json()
+    # Closed tasks and their rows live in the archive tables
+    with engine.begin() as connection:
+        for model in (Task, Bid, Agreement):
+            table = model.__table__
+            rows = connection.execute(table.select().where(table.c[("id" if model is Task else "task_id")] == 1)).all()
+            connection.execute(archive_tables[table.name].insert(), [row._asdict() for row in rows])
+        for model in (Agreement, Bid, Task):
+            table = model.__table__
+            connection.execute(table.delete().where(table.c[("id" if model is Task else "task_id")] == 1))
+        # A database from before the rollups: no triggers, nothing counted
+        for name in analytics.TRIGGERS:
+            connection.exec_driver_sql(f"DROP TRIGGER {name}")
+        connection.exec_driver_sql("DELETE FROM analytics_daily")
+        connection.exec_driver_sql("DELETE FROM analytics_samples")
+    db.close()
+
+    Base.metadata.create_all(bind=engine)
+
+    assert client.get("/analytics/summary", headers=CUSTOMER, params=RANGE).json() == expected
+
+
+def test_reads_only_the_rollups(client):
+    db = TestingSessionLocal()
+    seed(db)
+    db.close()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        client.get("/analytics/summary", headers=CUSTOMER, params=RANGE)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    reads = [(statement, parameters) for statement, parameters in statements if "FROM analytics_" in statement]
+    # The daily rows, then blocks and unpacked samples for each of the two metrics
+    assert len(reads) == 5
+    for statement, parameters in reads:
+        assert "FROM tasks" not in statement and "FROM bids" not in statement
+        with engine.connect() as connection:
+            plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        assert not any(step.startswith("SCAN") for step in plan), plan
+
+
+def test_range_and_access_checks(client, monkeypatch):
+    assert client.get("/analytics/daily", headers=CUSTOMER, params={"date_from": "2030-03-02", "date_to": "2030-03-01"}
+                      ).status_code == 422
+    assert client.get("/analytics/summary", headers=CUSTOMER, params={"date_from": "2020-01-01", "date_to": "2030-01-01"}
+                      ).status_code == 422
+    assert client.get("/analytics/summary", headers=CUSTOMER).json()["tasks_posted"] == 0
+    assert client.get("/analytics/daily").status_code == 401
+    assert client.get("/analytics/daily", headers=TASKER).status_code == 403
+    assert client.get("/analytics/summary", headers=TASKER).status_code == 403
+
+    # Without a configured list nobody can read analytics
+    monkeypatch.setattr(analytics, "ANALYTICS_EMAILS", set())
+    assert client.get("/analytics/daily", headers=CUSTOMER).status_code == 403
@@ -0,0 +1,233 @@
+"""
+Tests for hot/cold archival of closed tasks.
+
+Covers which tasks get moved, which child rows travel with their task, batch
+bounds, and that read endpoints keep serving archived tasks transparently.
+"""
+
+import pytest
+from sqlalchemy import select, func
+from datetime import datetime, timedelta
+
+from database import (
+    User, Task, Bid, Offer, Agreement, Message, Review,
+    UserRole, TaskStatus, AgreementStatus, archive_tables
+)
+from auth import get_password_hash, create_access_token
+from archive import archive_batch, archive_closed_tasks
+from retention import compact_closed_conversations
+from pagination import NEXT_CURSOR_HEADER
+from conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def marketplace(client):
+    """
+    One customer and tasker with three tasks:
+    an old completed task with bids/offers/agreement/messages/review,
+    a recently completed task, and an old but still open task.
+    """
+    db = TestingSessionLocal()
+    customer = User(
+        email="customer@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Customer",
+        role=UserRole.CUSTOMER
+    )
+    tasker = User(
+        email="tasker@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Tasker",
+        role=UserRole.TASKER
+    )
+    db.add_all([customer, tasker])
+    db.commit()
+
+    long_ago = datetime.utcnow() - timedelta(days=200)
+
+    def make_task(title, status, updated_at):
+        return Task(
+            customer_id=customer.id,
+            title=title,
+            description="Description",
+            location="Test City",
+            date=long_ago,
+            budget=100.0,
+            status=status,
+            updated_at=updated_at
+        )
+
+    old_done = make_task("Old completed", TaskStatus.COMPLETED, long_ago)
+    recent_done = make_task("Recent completed", TaskStatus.COMPLETED, datetime.utcnow())
+    old_open = make_task("Old open", TaskStatus.OPEN, long_ago)
+    db.add_all([old_done, recent_done, old_open])
+    db.commit()
+
+    db.add_all([
+        Bid(task_id=old_done.id, tasker_id=tasker.id, amount=90.0),
+        Offer(task_id=old_done.id, customer_id=customer.id, tasker_id=tasker.id, amount=95.0),
+        Agreement(task_id=old_done.id, tasker_id=tasker.id, amount=90.0, status=AgreementStatus.COMPLETED),
+        Message(sender_id=customer.id, receiver_id=tasker.id, task_id=old_done.id, content="First"),
+        Message(sender_id=tasker.id, receiver_id=customer.id, task_id=old_done.id, content="Second"),
+        Message(sender_id=customer.id, receiver_id=tasker.id, content="No task"),
+        Review(task_id=old_done.id, reviewer_id=customer.id, reviewee_id=tasker.id, rating=5),
+        Bid(task_id=recent_done.id, tasker_id=tasker.id, amount=80.0)
+    ])
+    db.commit()
+
+    data = {
+        "old_done": old_done.id,
+        "recent_done": recent_done.id,
+        "old_open": old_open.id,
+        "tasker_id": tasker.id,
+        "customer_headers": {"Authorization": f"Bearer {create_access_token(data={'sub': customer.email})}"}
+    }
+    db.close()
+    return data
+
+
+def count(db, table):
+    return db.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_archives_only_old_closed_tasks(marketplace):
+    db = TestingSessionLocal()
+    moved = archive_closed_tasks(db, older_than_days=30)
+
+    assert moved == 1
+    remaining = {t.id for t in db.query(Task).all()}
+    assert remaining == {marketplace["recent_done"], marketplace["old_open"]}
+    db.close()
+
+
+def test_child_rows_move_with_task(marketplace):
+    db = TestingSessionLocal()
+    archive_closed_tasks(db, older_than_days=30)
+    task_id = marketplace["old_done"]
+
+    for model in (Bid, Offer, Agreement):
+        assert db.query(model).filter(model.task_id == task_id).count() == 0
+    assert count(db, archive_tables["bids"]) == 1
+    assert count(db, archive_tables["offers"]) == 1
+    assert count(db, archive_tables["agreements"]) == 1
+    assert count(db, archive_tables["tasks"]) == 1
+    # Messages and reviews stay hot
+    assert count(db, archive_tables["messages"]) == 0
+    assert db.query(Message).count() == 3
+    assert db.query(Review).count() == 1
+    db.close()
+
+
+def test_archive_batch_is_bounded(marketplace):
+    db = TestingSessionLocal()
+    for task in db.query(Task).all():
+        task.status = TaskStatus.ARCHIVED
+        task.updated_at = datetime.utcnow() - timedelta(days=200)
+    db.commit()
+
+    cutoff = datetime.utcnow() - timedelta(days=30)
+    assert archive_batch(db, cutoff, batch_size=2) == 2
+    assert archive_batch(db, cutoff, batch_size=2) == 1
+    assert archive_batch(db, cutoff, batch_size=2) == 0
+    db.close()
+
+
+def test_archived_task_reads_are_transparent(client, marketplace):
+    db = TestingSessionLocal()
+    archive_closed_tasks(db, older_than_days=30)
+    db.close()
+    task_id = marketplace["old_done"]
+
+    task = client.get(f"/tasks/{task_id}")
+    assert task.status_code == 200
+    assert task.json()["title"] == "Old completed"
+    assert task.json()["status"] == "completed"
+
+    bids = client.get(f"/tasks/{task_id}/bids")
+    assert [b["amount"] for b in bids.json()] == [90.0]
+
+    messages = client.get(f"/tasks/{task_id}/messages", headers=marketplace["customer_headers"])
+    assert messages.status_code == 200
+    assert [m["content"] for m in messages.json()] == ["First", "Second"]
+
+    reviews = client.get(f"/users/{marketplace['tasker_id']}/reviews")
+    assert [r["rating"] for r in reviews.json()] == [5]
+
+
+def test_missing_task_still_404(client, marketplace):
+    assert client.get("/tasks/9999").status_code == 404
+
+
+def test_messages_of_archived_tasks_stay_in_the_inbox(client, marketplace):
+    tasker = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+    db = TestingSessionLocal()
+    archive_closed_tasks(db, older_than_days=30)
+    db.close()
+
+    inbox = client.get("/messages", headers=tasker).json()
+    assert [(m["content"], m["task_title"], m["task_status"]) for m in inbox if m["task_id"]] == [
+        ("Second", "Old completed", "completed"), ("First", "Old completed", "completed")
+    ]
+    assert client.get("/messages/unread-count", headers=tasker).json() == {"unread_count": 2}
+    first = next(m for m in inbox if m["content"] == "First")
+    assert client.put(f"/messages/{first['id']}/read", headers=tasker).status_code == 200
+    assert client.get("/messages/unread-count", headers=tasker).json() == {"unread_count": 1}
+
+
+def test_messages_of_archived_tasks_are_compacted(client, marketplace):
+    db = TestingSessionLocal()
+    db.query(Message).update({"read": True, "created_at": datetime.utcnow() - timedelta(days=60)})
+    db.commit()
+    archive_closed_tasks(db, older_than_days=30)
+
+    assert compact_closed_conversations(db, older_than_days=30) == 2
+    db.close()
+    messages = client.get(f"/tasks/{marketplace['old_done']}/messages", headers=marketplace["customer_headers"])
+    assert [m["content"] for m in messages.json()] == ["First", "Second"]
+
+
+def test_old_agreements_and_offers_still_list(client, marketplace):
+    tasker = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+    customer = marketplace["customer_headers"]
+    before = {
+        (path, name): client.get(path, headers=headers).json()
+        for path in ("/agreements", "/offers/my-offers")
+        for name, headers in (("tasker", tasker), ("customer", customer))
+    }
+    db = TestingSessionLocal()
+    archive_closed_tasks(db, older_than_days=30)
+    db.close()
+
+    for (path, name), listed in before.items():
+        headers = tasker if name == "tasker" else customer
+        assert len(listed) == 1
+        assert client.get(path, headers=headers).json() == listed
+
+
+def test_my_tasks_include_archived_tasks(client, marketplace):
+    tasker = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+    customer = marketplace["customer_headers"]
+    before = {
+        name: client.get("/tasks/my-tasks", headers=headers).json()
+        for name, headers in (("tasker", tasker), ("customer", customer))
+    }
+    db = TestingSessionLocal()
+    archive_closed_tasks(db, older_than_days=30)
+    db.close()
+
+    for name, headers in (("tasker", tasker), ("customer", customer)):
+        after = client.get("/tasks/my-tasks", headers=headers).json()
+        assert [(t["id"], t["involvement"]) for t in after] == [(t["id"], t["involvement"]) for t in before[name]]
+    tasker_tasks = client.get("/tasks/my-tasks", headers=tasker).json()
+    assert tasker_tasks[0]["title"] == "Old completed"
+    assert tasker_tasks[0]["involvement"] == ["bid", "offer", "agreement"]
+
+    # Pages run across the hot and archived halves in id order
+    first = client.get("/tasks/my-tasks?limit=1&fields=id,title", headers=customer)
+    assert first.json() == [{"id": marketplace["old_done"], "title": "Old completed"}]
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+    rest = client.get(f"/tasks/my-tasks?limit=5&fields=id&cursor={cursor}", headers=customer).json()
+    assert rest == [{"id": marketplace["recent_done"]}, {"id": marketplace["old_open"]}]
+
+    closed = client.get("/tasks/my-tasks?status=completed&involvement=agreement", headers=tasker).json()
+    assert [t["id"] for t in closed] == [marketplace["old_done"]]
@@ -0,0 +1,145 @@
+"""
+Tests and benchmarks for POST /batch.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from jose import jwt
+
+import batch
+from auth import create_access_token
+
+
+def auth_headers(email):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+CUSTOMER = auth_headers("customer@test.com")
+TASKER = auth_headers("tasker@test.com")
+
+
+def new_task(title="Fix sink"):
+    return {
+        "title": title, "description": "Details", "location": "Austin",
+        "date": (datetime.utcnow() + timedelta(days=1)).isoformat(), "budget": 100.0
+    }
+
+
+@pytest.fixture
+def client(client):
+    for email, role in (("customer@test.com", "customer"), ("tasker@test.com", "tasker")):
+        response = client.post("/register", json={
+            "email": email, "password": "password123", "full_name": email, "role": role
+        })
+        assert response.status_code == 200
+    return client
+
+
+def run(client, *requests, headers=CUSTOMER):
+    return client.post("/batch", headers=headers, json={"requests": [
+        {"method": method, "path": path, **({"body": body} if body is not None else {})}
+        for method, path, body in requests
+    ]})
+
+
+def get(path):
+    return ("GET", path, None)
+
+
+def test_batch_matches_individual_requests(client):
+    task_id = client.post("/tasks", headers=CUSTOMER, json=new_task()).json()["id"]
+    client.post("/bids", headers=TASKER, json={"task_id": task_id, "amount": 80.0})
+    paths = [f"/tasks/{task_id}", f"/tasks/{task_id}/bids", "/offers/my-offers", "/agreements"]
+
+    response = run(client, *map(get, paths))
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["body"] for result in results] == [client.get(path, headers=CUSTOMER).json() for path in paths]
+    assert all(result["status"] == 200 and result["duration_ms"] >= 0 for result in results)
+
+
+def test_sub_request_headers_and_query_strings(client):
+    task_id = client.post("/tasks", headers=CUSTOMER, json=new_task()).json()["id"]
+    for email in ("tasker@test.com", "tasker2@test.com"):
+        client.post("/register", json={"email": email, "password": "password123", "full_name": email, "role": "tasker"})
+        client.post("/bids", headers=auth_headers(email), json={"task_id": task_id, "amount": 80.0})
+
+    [page] = run(client, get(f"/tasks/{task_id}/bids?sort=amount&limit=1")).json()
+
+    assert len(page["body"]) == 1
+    assert "x-next-cursor" in page["headers"]
+
+
+def test_authenticates_once(client, monkeypatch):
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+    response = run(client, get("/users/me"), get("/tasks"), get("/offers/my-offers"), get("/agreements"))
+
+    assert [result["status"] for result in response.json()] == [200] * 4
+    assert len(calls) == 1
+
+
+def test_reads_see_earlier_writes(client):
+    results = run(
+        client,
+        get("/tasks/user/my-tasks"),
+        ("POST", "/tasks", new_task("Paint fence")),
+        get("/tasks/user/my-tasks"),
+    ).json()
+
+    assert [result["status"] for result in results] == [200, 200, 200]
+    assert results[0]["body"] == []
+    assert [task["title"] for task in results[2]["body"]] == ["Paint fence"]
+
+
+def test_failures_stay_in_their_result(client):
+    results = run(
+        client,
+        get("/tasks/999"),
+        ("POST", "/bids", {"task_id": 1, "amount": 10.0}),
+        get("/notifications/stream"),
+        get("/batch"),
+        get("/users/me"),
+    ).json()
+
+    assert [result["status"] for result in results] == [404, 403, 400, 400, 200]
+    assert results[0]["body"] == {"detail": "Task not found"}
+
+
+def test_limits(client, monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_MAX_REQUESTS", 2)
+    assert run(client, get("/tasks"), get("/tasks"), get("/tasks")).status_code == 413
+
+    monkeypatch.setattr(batch, "BATCH_MAX_BYTES", 100)
+    assert run(client, ("POST", "/tasks", new_task("x" * 200))).status_code == 413
+
+    assert run(client, ("PATCH", "/tasks/1", {})).status_code == 422
+    assert client.post("/batch", headers=CUSTOMER, json={"requests": []}).status_code == 422
+    assert run(client, get("/tasks"), headers={}).status_code == 401
+
+
+@pytest.fixture
+def task_detail(client):
+    task_id = client.post("/tasks", headers=CUSTOMER, json=new_task()).json()["id"]
+    client.post("/bids", headers=TASKER, json={"task_id": task_id, "amount": 80.0})
+    return client, [f"/tasks/{task_id}", f"/tasks/{task_id}/bids", "/offers/my-offers", "/agreements"]
+
+
+@pytest.mark.benchmark(group="task-detail-screen")
+def test_benchmark_separate_requests(task_detail, benchmark):
+    client, paths = task_detail
+    benchmark(lambda: [client.get(path, headers=CUSTOMER) for path in paths])
+
+
+@pytest.mark.benchmark(group="task-detail-screen")
+def test_benchmark_batched_requests(task_detail, benchmark):
+    client, paths = task_detail
+    response = benchmark(lambda: run(client, *map(get, paths)))
+    assert response.status_code == 200
@@ -0,0 +1,198 @@
+"""
+Tests for precomputed bid statistics, bid withdrawal and the sorted,
+cursor-paged bid book.
+"""
+
+import json
+import pytest
+from datetime import datetime, timedelta
+
+from database import User, Task, TaskBidStats, UserRole, TaskStatus
+from auth import get_password_hash, create_access_token
+from pagination import NEXT_CURSOR_HEADER
+from streaming import NDJSON_MEDIA_TYPE
+from conftest import TestingSessionLocal
+
+TASKERS = 5
+
+
+def auth_headers(email):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+@pytest.fixture
+def task_id(client):
+    """An open task and TASKERS taskers, none of whom has bid yet."""
+    db = TestingSessionLocal()
+    password = get_password_hash("password123")
+    customer = User(email="customer@test.com", hashed_password=password,
+                    full_name="Customer", role=UserRole.CUSTOMER)
+    db.add(customer)
+    db.add_all([
+        User(email=f"tasker{i}@test.com", hashed_password=password,
+             full_name=f"Tasker {i}", role=UserRole.TASKER)
+        for i in range(TASKERS)
+    ])
+    db.flush()
+    task = Task(customer_id=customer.id, title="Task", description="Description",
+                location="Test City", date=datetime.utcnow() + timedelta(days=1), budget=100.0)
+    db.add(task)
+    db.commit()
+    task_id = task.id
+    db.close()
+    return task_id
+
+
+def place_bids(client, task_id, amounts):
+    ids = []
+    for i, amount in enumerate(amounts):
+        response = client.post("/bids", json={"task_id": task_id, "amount": amount},
+                               headers=auth_headers(f"tasker{i}@test.com"))
+        assert response.status_code == 200
+        ids.append(response.json()["id"])
+    return ids
+
+
+def test_stats_follow_new_bids(client, task_id):
+    place_bids(client, task_id, [40.0, 10.0, 30.0, 20.0])
+
+    db = TestingSessionLocal()
+    stats = db.get(TaskBidStats, task_id)
+    assert stats.bid_count == 4
+    assert (stats.min_amount, stats.max_amount) == (10.0, 40.0)
+    assert stats.mean_amount == 25.0
+    assert stats.median_amount == 25.0
+    assert stats.last_bid_at is not None
+    db.close()
+
+
+def test_task_responses_embed_stats(client, task_id):
+    place_bids(client, task_id, [10.0, 20.0, 60.0])
+    headers = auth_headers("customer@test.com")
+
+    task = client.get(f"/tasks/{task_id}").json()
+    listed = client.get("/tasks", headers=headers).json()
+
+    assert task["bid_stats"]["bid_count"] == 3
+    assert task["bid_stats"]["median_amount"] == 20.0
+    assert listed[0]["bid_stats"] == task["bid_stats"]
+
+
+def test_task_without_bids_has_no_stats(client, task_id):
+    assert client.get(f"/tasks/{task_id}").json()["bid_stats"] is None
+
+
+def test_withdraw_updates_stats(client, task_id):
+    bid_ids = place_bids(client, task_id, [10.0, 20.0, 30.0])
+
+    response = client.post(f"/bids/{bid_ids[0]}/withdraw", headers=auth_headers("tasker0@test.com"))
+
+    assert response.status_code == 200
+    assert response.json()["withdrawn"] is True
+    stats = client.get(f"/tasks/{task_id}").json()["bid_stats"]
+    assert stats["bid_count"] == 2
+    assert stats["min_amount"] == 20.0
+    assert stats["mean_amount"] == 25.0
+
+
+def test_withdraw_rules(client, task_id):
+    bid_ids = place_bids(client, task_id, [10.0, 20.0])
+    owner = auth_headers("tasker0@test.com")
+
+    assert client.post("/bids/9999/withdraw", headers=owner).status_code == 404
+    assert client.post(f"/bids/{bid_ids[0]}/withdraw", headers=auth_headers("tasker1@test.com")).status_code == 403
+    assert client.post(f"/bids/{bid_ids[0]}/withdraw", headers=owner).status_code == 200
+    assert client.post(f"/bids/{bid_ids[0]}/withdraw", headers=owner).status_code == 409
+
+    db = TestingSessionLocal()
+    db.query(Task).filter(Task.id == task_id).update({"status": TaskStatus.IN_PROGRESS})
+    db.commit()
+    db.close()
+    response = client.post(f"/bids/{bid_ids[1]}/withdraw", headers=auth_headers("tasker1@test.com"))
+    assert response.status_code == 409
+    assert client.get(f"/tasks/{task_id}").json()["bid_stats"]["bid_count"] == 1
+
+
+def test_withdrawn_bid_cannot_be_accepted(client, task_id):
+    bid_ids = place_bids(client, task_id, [10.0, 20.0])
+    client.post(f"/bids/{bid_ids[0]}/withdraw", headers=auth_headers("tasker0@test.com"))
+    customer = auth_headers("customer@test.com")
+
+    response = client.post(f"/bids/{bid_ids[0]}/accept", headers=customer)
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Bid has been withdrawn"
+    assert client.get(f"/tasks/{task_id}").json()["status"] == "open"
+    assert client.post(f"/bids/{bid_ids[1]}/accept", headers=customer).status_code == 200
+
+
+def read_all_pages(client, task_id, sort, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"sort": sort, "limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/tasks/{task_id}/bids", params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
+def test_bid_book_sorted_by_amount(client, task_id):
+    # Duplicate amounts make the id tie-breaker matter
+    place_bids(client, task_id, [30.0, 10.0, 20.0, 10.0, 50.0])
+
+    pages = read_all_pages(client, task_id, "amount", 2)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    bids = [bid for page in pages for bid in page]
+    assert [bid["amount"] for bid in bids] == [10.0, 10.0, 20.0, 30.0, 50.0]
+    assert len({bid["id"] for bid in bids}) == 5
+
+
+def test_bid_book_sorted_by_created_at(client, task_id):
+    bid_ids = place_bids(client, task_id, [30.0, 10.0, 20.0, 40.0])
+
+    pages = read_all_pages(client, task_id, "created_at", 3)
+
+    assert [bid["id"] for page in pages for bid in page] == bid_ids
+
+
+def test_bid_book_and_stream_skip_withdrawn_bids(client, task_id):
+    bid_ids = place_bids(client, task_id, [30.0, 10.0, 20.0])
+    client.post(f"/bids/{bid_ids[1]}/withdraw", headers=auth_headers("tasker1@test.com"))
+
+    pages = read_all_pages(client, task_id, "amount", 2)
+    streamed = client.get(f"/tasks/{task_id}/bids", headers={"Accept": NDJSON_MEDIA_TYPE})
+
+    assert [bid["id"] for page in pages for bid in page] == [bid_ids[2], bid_ids[0]]
+    assert [json.loads(line)["id"] for line in streamed.text.splitlines() if line] == [bid_ids[0], bid_ids[2]]
+    # The plain list still shows every bid with its withdrawn flag
+    assert len(client.get(f"/tasks/{task_id}/bids").json()) == 3
+
+
+def test_last_page_has_no_cursor(client, task_id):
+    place_bids(client, task_id, [10.0, 20.0])
+
+    response = client.get(f"/tasks/{task_id}/bids", params={"sort": "amount", "limit": 2})
+
+    assert len(response.json()) == 2
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_unsorted_bids_keep_plain_list(client, task_id):
+    place_bids(client, task_id, [10.0, 20.0, 30.0])
+
+    response = client.get(f"/tasks/{task_id}/bids")
+
+    assert len(response.json()) == 3
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_bad_sort_and_cursor_rejected(client, task_id):
+    assert client.get(f"/tasks/{task_id}/bids", params={"sort": "tasker"}).status_code == 422
+    response = client.get(f"/tasks/{task_id}/bids", params={"sort": "amount", "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,142 @@
+"""
+Tests for the denormalized task counters and their consistency checker.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect
+
+import counters
+from database import add_missing_columns, User, Task, Bid, Message, MessageBlock, UserRole
+from auth import create_access_token
+from group_commit import GroupCommitBatcher
+from conftest import TestingSessionLocal
+
+
+def auth_headers(email):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+CUSTOMER = auth_headers("customer@test.com")
+LAST_EDIT = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def client(client):
+    db = TestingSessionLocal()
+    db.add(User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER))
+    for n in range(1, 4):
+        db.add(User(email=f"tasker{n}@test.com", hashed_password="x", full_name=f"Tasker {n}", role=UserRole.TASKER))
+    db.flush()
+    for n in range(1, 4):
+        db.add(Task(customer_id=1, title=f"Task {n}", description="Details", location="Austin",
+                    date=datetime.utcnow() + timedelta(days=1), budget=100.0 * n, updated_at=LAST_EDIT))
+    db.commit()
+    db.close()
+    return client
+
+
+def bid(client, tasker, task_id, amount):
+    response = client.post("/bids", headers=auth_headers(f"tasker{tasker}@test.com"),
+                           json={"task_id": task_id, "amount": amount})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def task(client, task_id):
+    return client.get(f"/tasks/{task_id}").json()
+
+
+def test_bids_maintain_count_and_lowest_bid(client):
+    bid(client, 1, 1, 90.0)
+    cheapest = bid(client, 2, 1, 70.0)
+    assert (task(client, 1)["bid_count"], task(client, 1)["lowest_bid"]) == (2, 70.0)
+
+    client.post(f"/bids/{cheapest}/withdraw", headers=auth_headers("tasker2@test.com"))
+
+    result = task(client, 1)
+    assert (result["bid_count"], result["lowest_bid"]) == (1, 90.0)
+    # Counter writes are not edits
+    assert result["updated_at"] == LAST_EDIT.isoformat()
+
+
+def test_offers_and_messages_are_counted(client):
+    response = client.post("/offers", headers=CUSTOMER, json={"task_id": 2, "tasker_id": 2, "amount": 150.0})
+    assert response.status_code == 200
+    response = client.post("/messages", headers=CUSTOMER, json={"receiver_id": 2, "task_id": 2, "content": "Hi"})
+    assert response.status_code == 200
+
+    result = task(client, 2)
+    assert (result["offer_count"], result["message_count"]) == (1, 1)
+    assert result["updated_at"] == LAST_EDIT.isoformat()
+
+
+def test_batched_messages_are_counted(client):
+    batcher = GroupCommitBatcher(TestingSessionLocal, window_ms=1)
+    try:
+        for content in ("One", "Two"):
+            batcher.submit(Message(sender_id=1, receiver_id=2, task_id=3, content=content))
+    finally:
+        batcher.stop()
+
+    assert task(client, 3)["message_count"] == 2
+
+
+def test_filter_and_sort_on_counters(client):
+    bid(client, 1, 1, 90.0)
+    bid(client, 1, 2, 80.0)
+    bid(client, 2, 2, 60.0)
+
+    unbid = client.get("/tasks", headers=CUSTOMER, params={"max_bids": 0, "fields": "title"}).json()
+    busiest = client.get("/tasks", headers=CUSTOMER, params={"sort": "-bid_count", "fields": "id,bid_count"}).json()
+    cheapest = client.get("/tasks", headers=CUSTOMER, params={"min_bids": 1, "sort": "lowest_bid"}).json()
+
+    assert unbid == [{"title": "Task 3"}]
+    assert busiest == [{"id": 2, "bid_count": 2}, {"id": 1, "bid_count": 1}, {"id": 3, "bid_count": 0}]
+    assert [(t["id"], t["lowest_bid"]) for t in cheapest] == [(2, 60.0), (1, 90.0)]
+    assert client.get("/tasks", headers=CUSTOMER, params={"sort": "description"}).status_code == 422
+
+
+def test_checker_repairs_drift_in_batches(client, monkeypatch):
+    bid(client, 1, 1, 90.0)
+    db = TestingSessionLocal()
+    db.add(Bid(task_id=2, tasker_id=3, amount=55.0))
+    db.add(MessageBlock(task_id=3, first_message_id=1, last_message_id=5, message_count=5, payload=b""))
+    db.commit()
+    db.query(Task).filter(Task.id == 1).update({"offer_count": 7}, synchronize_session=False)
+    db.commit()
+
+    batches = []
+    check_batch = counters.check_batch
+    monkeypatch.setattr(counters, "check_batch", lambda *args: batches.append(args) or check_batch(*args))
+
+    assert counters.check_counters(db, batch_size=2) == 3
+    assert len(batches) == 3
+    assert counters.check_counters(db, batch_size=2) == 0
+    db.close()
+
+    assert [(t["bid_count"], t["lowest_bid"], t["offer_count"], t["message_count"])
+            for t in map(lambda task_id: task(client, task_id), (1, 2, 3))] == [
+        (1, 90.0, 0, 0), (1, 55.0, 0, 0), (0, None, 0, 5)
+    ]
+
+
+def test_existing_databases_gain_counter_columns():
+    old = create_engine("sqlite:///:memory:")
+    before = MetaData()
+    Table("tasks", before, *[
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        # The change_seq column came later still
+        for column in Task.__table__.columns if column.name not in (*counters.COUNTERS, "change_seq")
+    ])
+    before.create_all(old)
+    with old.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO tasks (id, customer_id, title, description, location, date, budget) "
+            "VALUES (1, 1, 'Old task', 'Details', 'Austin', '2024-01-01', 100.0)"
+        )
+        add_missing_columns(connection)
+        row = connection.exec_driver_sql("SELECT bid_count, lowest_bid, offer_count, message_count FROM tasks").one()
+
+    assert tuple(row) == (0, None, 0, 0)
+    assert set(counters.COUNTERS) <= {column["name"] for column in inspect(old).get_columns("tasks")}
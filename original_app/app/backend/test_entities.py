@@ -0,0 +1,125 @@
+"""
+Tests for the Task/User entity cache and GET /health/caches.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import entities
+from database import User, Task, UserRole
+from auth import create_access_token
+from conftest import engine, TestingSessionLocal
+
+
+CUSTOMER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+TASKER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+
+
+@pytest.fixture
+def client(client):
+    entities.task_cache.clear()
+    entities.user_cache.clear()
+    db = TestingSessionLocal()
+    db.add(User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER))
+    db.add(User(email="tasker@test.com", hashed_password="x", full_name="Tasker", role=UserRole.TASKER))
+    db.flush()
+    for n in range(1, 4):
+        db.add(Task(customer_id=1, title=f"Task {n}", description="Details", location="Austin",
+                    date=datetime.utcnow() + timedelta(days=1), budget=100.0))
+    db.commit()
+    db.close()
+    return client
+
+
+@pytest.fixture
+def row_loads():
+    """SELECTs that load task or user rows while the test runs."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and ("FROM tasks" in statement or "FROM users" in statement):
+            seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_repeated_reads_are_served_from_cache(client, row_loads):
+    first = client.get("/tasks/1").json()
+    hits = entities.task_cache.hits
+
+    assert client.get("/tasks/1").json() == first
+    assert client.get("/users/2").json() == client.get("/users/2").json()
+
+    assert entities.task_cache.hits == hits + 1
+    # One load per row; the rest only compared versions
+    assert len(row_loads) == 2
+
+
+def test_snapshots_are_immutable_and_hold_no_password(client):
+    db = TestingSessionLocal()
+    user = entities.get_user(db, 1)
+    db.close()
+
+    assert user.full_name == "Customer"
+    assert not hasattr(user, "hashed_password")
+    with pytest.raises(AttributeError):
+        user.full_name = "Changed"
+
+
+def test_write_paths_invalidate(client):
+    client.get("/tasks/1")
+    client.put("/tasks/1", headers=CUSTOMER, json={"title": "Renamed"})
+    assert client.get("/tasks/1").json()["title"] == "Renamed"
+
+    bid_id = client.post("/bids", headers=TASKER, json={"task_id": 1, "amount": 80.0}).json()["id"]
+    task = client.get("/tasks/1").json()
+    assert (task["bid_count"], task["bid_stats"]["min_amount"]) == (1, 80.0)
+
+    client.post(f"/bids/{bid_id}/accept", headers=CUSTOMER)
+    assert client.get("/tasks/1").json()["status"] == "in_progress"
+
+    [agreement] = client.get("/agreements", headers=CUSTOMER).json()
+    client.post(f"/agreements/{agreement['id']}/complete", headers=CUSTOMER)
+    assert client.get("/tasks/1").json()["status"] == "completed"
+
+
+def test_writes_elsewhere_invalidate_through_versions(client):
+    assert client.get("/users/1").json()["full_name"] == "Customer"
+
+    # Another worker, job or script updating the row
+    db = TestingSessionLocal()
+    db.query(User).filter(User.id == 1).update({"full_name": "Renamed"})
+    db.commit()
+    db.close()
+
+    assert client.get("/users/1").json()["full_name"] == "Renamed"
+
+
+def test_ttl_and_lru_eviction(client, monkeypatch):
+    monkeypatch.setattr(entities.task_cache, "ttl", 0)
+    client.get("/tasks/1")
+    misses = entities.task_cache.misses
+    client.get("/tasks/1")
+    assert entities.task_cache.misses == misses + 1
+
+    monkeypatch.setattr(entities.task_cache, "ttl", None)
+    monkeypatch.setattr(entities.task_cache, "size", 2)
+    evictions = entities.task_cache.evictions
+    for task_id in (1, 2, 3):
+        client.get(f"/tasks/{task_id}")
+    assert entities.task_cache.evictions == evictions + 1
+    assert entities.task_cache.stats()["entries"] == 2
+
+
+def test_cache_metrics_endpoint(client):
+    client.get("/tasks/1")
+    client.get("/tasks/1")
+
+    stats = {cache["name"]: cache for cache in client.get("/health/caches").json()}
+
+    assert {"tasks", "users", "messaging_permissions"} <= set(stats)
+    assert stats["tasks"]["hits"] >= 1
+    assert 0 < stats["tasks"]["hit_rate"] <= 1
@@ -0,0 +1,290 @@
+"""
+Tests for consistent snapshot exports (export.py).
+"""
+
+import array
+import ast
+import json
+import os
+import sqlite3
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import export
+from archive import archive_batch
+from counters import set_task_counters
+from database import Base, User, Task, Bid, Message, TaskStatus, UserRole
+from retention import compact_closed_conversations
+
+
+def read_npy(path):
+    """(descr, values) of a 1-d .npy file, read without NumPy."""
+    with open(path, "rb") as f:
+        assert f.read(8) == b"\x93NUMPY\x01\x00"
+        header_length = int.from_bytes(f.read(2), "little")
+        header = ast.literal_eval(f.read(header_length).decode("latin1"))
+        data = f.read()
+    assert (10 + header_length) % 64 == 0
+    descr = header["descr"]
+    if descr == "|b1":
+        return descr, [bool(byte) for byte in data]
+    values = array.array({"<i8": "q", "<M8[us]": "q", "<f8": "d"}[descr])
+    values.frombytes(data)
+    assert len(values) == header["shape"][0]
+    return descr, list(values)
+
+
+def read_strings(base):
+    _, offsets = read_npy(f"{base}.offsets.npy")
+    with open(f"{base}.utf8", "rb") as f:
+        data = f.read()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+def column(out_dir, manifest, table, name):
+    """A column's values across all chunks of an npy export."""
+    values = []
+    for chunk in manifest["tables"][table]["chunks"]:
+        base = os.path.join(out_dir, chunk["path"], name)
+        if manifest["tables"][table]["columns"][name] == "string":
+            values += read_strings(base)
+        else:
+            values += read_npy(f"{base}.npy")[1]
+    return values
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A tasker database file with three tasks, two bids and a message."""
+    path = str(tmp_path / "tasker.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(email="c@test.com", hashed_password="x", full_name="C", role=UserRole.CUSTOMER))
+    session.add(User(email="t@test.com", hashed_password="x", full_name="T", role=UserRole.TASKER))
+    session.flush()
+    for n in range(3):
+        session.add(Task(customer_id=1, title=f"Tâsk {n}", description="Details" if n else "",
+                         location="Austin", date=datetime(2030, 1, 1 + n), budget=100.0 + n,
+                         updated_at=datetime(2030, 1, 1, 0, 0, n)))
+    session.flush()
+    session.add_all([
+        Bid(task_id=1, tasker_id=2, amount=80.0, message="Hi"),
+        Bid(task_id=2, tasker_id=2, amount=90.5),
+        Message(sender_id=2, receiver_id=1, task_id=1, content="Hello"),
+    ])
+    session.commit()
+    session.close()
+    yield path, sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_full_export_round_trips(database, tmp_path):
+    path, _ = database
+    out = str(tmp_path / "export")
+
+    manifest = export.export_snapshot(out, database_path=path, chunk_rows=2)
+
+    assert json.load(open(os.path.join(out, export.MANIFEST))) == manifest
+    assert {name: table["rows"] for name, table in manifest["tables"].items()} == {
+        "tasks": 3, "archived_tasks": 0, "bids": 2, "archived_bids": 0, "offers": 0, "archived_offers": 0,
+        "agreements": 0, "archived_agreements": 0, "messages": 1, "archived_messages": 0, "reviews": 0,
+        "compacted_messages": 0
+    }
+    assert [chunk["rows"] for chunk in manifest["tables"]["tasks"]["chunks"]] == [2, 1]
+    assert column(out, manifest, "tasks", "title") == ["Tâsk 0", "Tâsk 1", "Tâsk 2"]
+    assert column(out, manifest, "tasks", "description") == ["", "Details", "Details"]
+    assert column(out, manifest, "tasks", "budget") == [100.0, 101.0, 102.0]
+    assert column(out, manifest, "tasks", "date")[1] == (datetime(2030, 1, 2) - export.EPOCH) // timedelta(microseconds=1)
+    assert column(out, manifest, "bids", "withdrawn") == [False, False]
+    # The fixture's rows were all written in one transaction, change 1
+    assert manifest["tables"]["tasks"]["watermark"] == [1, 3]
+    assert manifest["tables"]["bids"]["watermark"][1] == 2
+    assert manifest["tables"]["reviews"]["watermark"] is None
+    assert not os.path.exists(os.path.join(out, ".snapshot.db"))
+
+
+def test_nulls_get_a_validity_mask(database, tmp_path):
+    path, _ = database
+    out = str(tmp_path / "export")
+
+    manifest = export.export_snapshot(out, database_path=path)
+
+    chunk = os.path.join(out, manifest["tables"]["bids"]["chunks"][0]["path"])
+    assert read_npy(os.path.join(chunk, "message.valid.npy")) == ("|b1", [True, False])
+    assert read_strings(os.path.join(chunk, "message")) == ["Hi", ""]
+    assert not os.path.exists(os.path.join(chunk, "amount.valid.npy"))
+
+
+def test_incremental_export(database, tmp_path):
+    path, session_factory = database
+    first = export.export_snapshot(str(tmp_path / "first"), database_path=path)
+
+    db = session_factory()
+    db.add(Bid(task_id=3, tasker_id=2, amount=70.0))
+    db.query(Task).filter(Task.id == 1).update({"title": "Edited", "updated_at": datetime(2030, 2, 1)})
+    # Edits to bids and messages are exported again
+    db.query(Bid).filter(Bid.id == 1).update({"withdrawn": True})
+    db.query(Message).update({"read": True})
+    db.commit()
+    db.close()
+
+    out = str(tmp_path / "second")
+    second = export.export_snapshot(out, database_path=path, since=first, method="transaction")
+
+    assert {name: table["rows"] for name, table in second["tables"].items() if table["rows"]} == {
+        "tasks": 1, "bids": 2, "messages": 1
+    }
+    assert column(out, second, "tasks", "title") == ["Edited"]
+    assert column(out, second, "bids", "id") == [1, 3]
+    assert column(out, second, "bids", "withdrawn") == [True, False]
+    assert column(out, second, "messages", "read") == [True]
+    # Tables with nothing new keep their watermark for the next run
+    assert second["tables"]["reviews"]["watermark"] == first["tables"]["reviews"]["watermark"]
+    third = export.export_snapshot(str(tmp_path / "third"), database_path=path, since=second)
+    assert not any(table["rows"] for table in third["tables"].values())
+
+
+def test_timestamp_ties_are_not_skipped(database, tmp_path):
+    path, session_factory = database
+    db = session_factory()
+    db.query(Task).update({"updated_at": datetime(2030, 2, 1)})
+    db.commit()
+    first = export.export_snapshot(str(tmp_path / "first"), database_path=path, chunk_rows=2)
+    # A task edited within the same microsecond as the last one exported
+    db.add(Task(customer_id=1, title="Tie", description="", location="Austin", date=datetime(2030, 1, 1),
+                budget=1.0, updated_at=datetime(2030, 2, 1)))
+    db.commit()
+    db.close()
+
+    out = str(tmp_path / "second")
+    second = export.export_snapshot(out, database_path=path, since=json.loads(json.dumps(first)))
+
+    assert column(out, second, "tasks", "title") == ["Tie"]
+
+
+def test_counter_only_changes_are_exported(database, tmp_path):
+    path, session_factory = database
+    first = export.export_snapshot(str(tmp_path / "first"), database_path=path)
+    db = session_factory()
+    set_task_counters(db, 2, bid_count=5, lowest_bid=42.0)
+    db.commit()
+    db.close()
+
+    out = str(tmp_path / "second")
+    second = export.export_snapshot(out, database_path=path, since=first)
+
+    assert {name: table["rows"] for name, table in second["tables"].items() if table["rows"]} == {"tasks": 1}
+    assert column(out, second, "tasks", "bid_count") == [5]
+    assert column(out, second, "tasks", "updated_at") == column(str(tmp_path / "first"), first, "tasks", "updated_at")[1:2]
+
+
+def test_late_commits_are_not_skipped(database, tmp_path):
+    path, session_factory = database
+    first = export.export_snapshot(str(tmp_path / "first"), database_path=path)
+    db = session_factory()
+    # Stamped (flushed) long before the bids already exported, but committed
+    # after the export
+    db.add(Bid(task_id=3, tasker_id=2, amount=70.0, updated_at=datetime(2000, 1, 1)))
+    db.commit()
+    db.close()
+
+    out = str(tmp_path / "second")
+    second = export.export_snapshot(out, database_path=path, since=first)
+
+    assert {name: table["rows"] for name, table in second["tables"].items() if table["rows"]} == {"bids": 1}
+    assert column(out, second, "bids", "amount") == [70.0]
+
+
+def test_archived_and_compacted_rows_are_exported(database, tmp_path):
+    path, session_factory = database
+    first = export.export_snapshot(str(tmp_path / "first"), database_path=path)
+    db = session_factory()
+    db.query(Task).filter(Task.id == 1).update({"status": TaskStatus.COMPLETED, "updated_at": datetime(2030, 2, 1)})
+    db.query(Message).update({"read": True, "created_at": datetime(2020, 1, 1)})
+    db.commit()
+    # The edited task moves to the archive before the next export sees it
+    archive_batch(db, datetime(2031, 1, 1))
+    compact_closed_conversations(db, older_than_days=30)
+    db.close()
+
+    out = str(tmp_path / "second")
+    second = export.export_snapshot(out, database_path=path, since=first)
+
+    assert {name: table["rows"] for name, table in second["tables"].items() if table["rows"]} == {
+        "archived_tasks": 1, "compacted_messages": 1
+    }
+    assert column(out, second, "archived_tasks", "status") == ["COMPLETED"]
+    assert column(out, second, "compacted_messages", "content") == ["Hello"]
+    assert column(out, second, "compacted_messages", "block_id") == [1]
+    # The task's bid moved to the archive unchanged, so it is not exported again
+    assert second["tables"]["archived_bids"]["since"] == first["tables"]["bids"]["watermark"]
+
+
+def test_writes_during_export_are_not_seen(database, tmp_path, monkeypatch):
+    path, _ = database
+    export_table = export.export_table
+
+    def write_meanwhile(connection, table, *args):
+        if table is Task.__table__:
+            # Another process commits while the export is running
+            writer = sqlite3.connect(path)
+            writer.execute("INSERT INTO bids (task_id, tasker_id, amount, withdrawn) VALUES (3, 2, 60.0, 0)")
+            writer.commit()
+            writer.close()
+        return export_table(connection, table, *args)
+
+    monkeypatch.setattr(export, "export_table", write_meanwhile)
+    manifest = export.export_snapshot(str(tmp_path / "export"), database_path=path)
+
+    assert manifest["tables"]["bids"]["rows"] == 2
+
+
+def test_refuses_non_empty_directory_and_unknown_format(database, tmp_path):
+    path, _ = database
+    (tmp_path / "busy").mkdir()
+    (tmp_path / "busy" / "file").write_text("x")
+
+    with pytest.raises(ValueError):
+        export.export_snapshot(str(tmp_path / "busy"), database_path=path)
+    with pytest.raises(ValueError):
+        export.export_snapshot(str(tmp_path / "csv"), database_path=path, format="csv")
+
+
+def test_parquet_export(database, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path, _ = database
+    out = str(tmp_path / "export")
+
+    manifest = export.export_snapshot(out, database_path=path, format="parquet")
+
+    table = pq.read_table(os.path.join(out, manifest["tables"]["tasks"]["chunks"][0]["path"]))
+    assert table.column("title").to_pylist() == ["Tâsk 0", "Tâsk 1", "Tâsk 2"]
+
+
+TASK_ROWS = 100000
+
+
+@pytest.mark.benchmark(group="snapshot-export")
+def test_benchmark_export_100k_tasks(tmp_path, benchmark):
+    path = str(tmp_path / "large.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(Task), [
+            {"customer_id": 1, "title": f"Task {n}", "description": "Bring tools. " * 20, "location": "Austin",
+             "date": now, "budget": 100.0, "created_at": now, "updated_at": now + timedelta(microseconds=n)}
+            for n in range(TASK_ROWS)
+        ])
+    engine.dispose()
+    runs = iter(range(100))
+
+    manifest = benchmark.pedantic(
+        lambda: export.export_snapshot(str(tmp_path / f"export-{next(runs)}"), database_path=path), rounds=2
+    )
+
+    assert manifest["tables"]["tasks"]["rows"] == TASK_ROWS
+    benchmark.extra_info["chunks"] = len(manifest["tables"]["tasks"]["chunks"])
@@ -0,0 +1,267 @@
+"""
+Tests for the materialized tasker feed and GET /feed.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import feed
+from jobs import JobWorker
+from database import User, Task, FeedEntry, FeedState, UserRole
+from auth import get_password_hash, create_access_token
+from pagination import NEXT_CURSOR_HEADER
+from conftest import engine, TestingSessionLocal
+
+
+def auth_headers(email):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+CUSTOMER = auth_headers("customer@test.com")
+PLUMBER = auth_headers("plumber@test.com")
+
+
+@pytest.fixture
+def client(client):
+    db = TestingSessionLocal()
+    password = get_password_hash("password123")
+    db.add_all([
+        User(email="customer@test.com", hashed_password=password, full_name="Customer",
+             role=UserRole.CUSTOMER, location="Austin, TX"),
+        User(email="plumber@test.com", hashed_password=password, full_name="Plumber",
+             role=UserRole.TASKER, location="Austin, TX", skills="plumbing, pipes", hourly_rate=50.0),
+        User(email="painter@test.com", hashed_password=password, full_name="Painter",
+             role=UserRole.TASKER, location="Denver", skills="painting", hourly_rate=30.0),
+    ])
+    db.commit()
+    db.close()
+    return client
+
+
+def post_task(client, title, location="Austin, TX", budget=100.0, description="Details"):
+    response = client.post("/tasks", headers=CUSTOMER, json={
+        "title": title, "description": description, "location": location,
+        "date": (datetime.utcnow() + timedelta(days=1)).isoformat(), "budget": budget
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def build_all():
+    db = TestingSessionLocal()
+    built = feed.build_stale_feeds(db)
+    db.close()
+    return built
+
+
+def run_jobs():
+    return JobWorker(TestingSessionLocal).run_pending()
+
+
+def titles(response):
+    return [task["title"] for task in response.json()]
+
+
+def test_score_prefers_matching_tasks():
+    tasker = User(location="Austin, TX", skills="plumbing", hourly_rate=50.0)
+    now = datetime.utcnow()
+    match = Task(title="Fix plumbing", description="", location="Austin", budget=100.0, created_at=now)
+    other = Task(title="Walk dog", description="", location="Boston", budget=20.0, created_at=now)
+
+    assert feed.score_task(tasker, match) == pytest.approx(feed.score_task(tasker, other) + 2.8)
+
+
+def test_cold_feed_is_ranked_on_demand(client):
+    post_task(client, "Walk dog", location="Denver", budget=20.0)
+    post_task(client, "Fix plumbing leak")
+
+    response = client.get("/feed", headers=PLUMBER)
+
+    assert response.status_code == 200
+    assert titles(response) == ["Fix plumbing leak", "Walk dog"]
+    db = TestingSessionLocal()
+    assert db.query(FeedEntry).count() == 0
+    db.close()
+
+
+def test_builder_materializes_feeds(client):
+    post_task(client, "Walk dog", location="Denver", budget=20.0)
+    post_task(client, "Fix plumbing leak")
+    cold = client.get("/feed", headers=PLUMBER).json()
+
+    assert build_all() == 2
+    assert build_all() == 0
+
+    db = TestingSessionLocal()
+    assert db.query(FeedEntry).count() == 4
+    assert db.query(FeedState).count() == 2
+    db.close()
+    assert client.get("/feed", headers=PLUMBER).json() == cold
+
+
+def test_new_tasks_join_warm_feeds(client):
+    post_task(client, "Walk dog", location="Denver", budget=20.0)
+    build_all()
+
+    post_task(client, "Fix plumbing leak")
+    post_task(client, "Paint fence", location="Denver", description="painting job")
+    assert titles(client.get("/feed", headers=PLUMBER)) == ["Walk dog"]
+
+    run_jobs()
+    assert titles(client.get("/feed", headers=PLUMBER)) == ["Fix plumbing leak", "Paint fence", "Walk dog"]
+    painter = auth_headers("painter@test.com")
+    assert titles(client.get("/feed", headers=painter))[0] == "Paint fence"
+
+
+def test_closed_tasks_leave_feeds(client):
+    task_id = post_task(client, "Fix plumbing leak")
+    other_id = post_task(client, "Walk dog")
+    build_all()
+
+    bid = client.post("/bids", json={"task_id": task_id, "amount": 90.0}, headers=PLUMBER).json()
+    assert client.post(f"/bids/{bid['id']}/accept", headers=CUSTOMER).status_code == 200
+    client.put(f"/tasks/{other_id}", json={"status": "archived"}, headers=CUSTOMER)
+
+    assert client.get("/feed", headers=PLUMBER).json() == []
+    db = TestingSessionLocal()
+    assert db.query(FeedEntry).count() == 0
+    db.close()
+
+
+def test_edited_tasks_are_reranked(client):
+    first = post_task(client, "Walk dog")
+    post_task(client, "Water plants")
+    build_all()
+    assert titles(client.get("/feed", headers=PLUMBER)) == ["Water plants", "Walk dog"]
+
+    client.put(f"/tasks/{first}", json={"description": "and check the plumbing"}, headers=CUSTOMER)
+    run_jobs()
+
+    assert titles(client.get("/feed", headers=PLUMBER)) == ["Walk dog", "Water plants"]
+
+
+@pytest.mark.parametrize("materialized", [False, True])
+def test_feed_pages_with_cursor(client, materialized):
+    for n in range(5):
+        post_task(client, f"Task {n}")
+    if materialized:
+        build_all()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/feed", headers=PLUMBER, params=params)
+        seen.append(titles(response))
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+
+    # Otherwise equal tasks rank newest first
+    assert seen == [["Task 4", "Task 3"], ["Task 2", "Task 1"], ["Task 0"]]
+
+
+def test_feed_is_for_taskers_only(client):
+    assert client.get("/feed", headers=CUSTOMER).status_code == 403
+
+
+def test_feeds_keep_only_the_top_tasks(client, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_SIZE", 2)
+    post_task(client, "Walk dog", location="Denver", budget=20.0)
+    post_task(client, "Fix plumbing leak")
+    post_task(client, "Water plants")
+    build_all()
+    assert titles(client.get("/feed", headers=PLUMBER)) == ["Fix plumbing leak", "Water plants"]
+
+    post_task(client, "Unblock pipes")
+    post_task(client, "Paint fence", location="Denver", description="painting job")
+    run_jobs()
+
+    assert titles(client.get("/feed", headers=PLUMBER)) == ["Unblock pipes", "Fix plumbing leak"]
+    db = TestingSessionLocal()
+    assert db.query(FeedEntry).filter(FeedEntry.tasker_id == 2).count() == 2
+    assert db.query(FeedEntry).filter(FeedEntry.tasker_id == 3).count() == 2
+    db.close()
+
+
+def test_fan_out_commits_in_batches(client, monkeypatch):
+    post_task(client, "Walk dog")
+    build_all()
+    db = TestingSessionLocal()
+    task = Task(customer_id=1, title="Fix plumbing leak", description="x", location="Austin, TX",
+                date=datetime.utcnow(), budget=100.0)
+    db.add(task)
+    db.commit()
+    commits = []
+    commit = db.commit
+
+    def counting_commit():
+        commit()
+        commits.append(db.query(FeedEntry).count())
+
+    monkeypatch.setattr(db, "commit", counting_commit)
+
+    feed.add_task(db, task, batch_size=1)
+
+    # One feed per transaction
+    assert commits == [3, 4]
+    db.close()
+
+
+def test_cold_feed_scores_only_recent_candidates(client, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_SIZE", 1)
+    now = datetime.utcnow()
+    db = TestingSessionLocal()
+    db.add_all([
+        # A perfect match, but posted too long before the newest task to outrank it
+        Task(customer_id=1, title="Fix plumbing pipes", description="x", location="Austin", date=now,
+             budget=500.0, created_at=now - timedelta(days=4)),
+        Task(customer_id=1, title="Walk dog", description="x", location="Denver", date=now, budget=1.0,
+             created_at=now),
+    ])
+    db.commit()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert [task.title for task in feed.candidate_tasks(db)] == ["Walk dog"]
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    for statement, parameters in statements:
+        with engine.connect() as connection:
+            plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        assert any("ix_tasks_status_created" in step for step in plan), plan
+
+    # Within MAX_MATCH_SCORE days of recency the match wins
+    db.query(Task).filter(Task.title == "Fix plumbing pipes").update({"created_at": now - timedelta(days=1)})
+    db.commit()
+    plumber = db.query(User).filter(User.email == "plumber@test.com").one()
+    assert [item.task.title for item in feed.rank_open_tasks(db, plumber)] == ["Fix plumbing pipes"]
+    db.close()
+
+
+def test_a_sweep_loads_the_candidates_once(client):
+    for n in range(3):
+        post_task(client, f"Task {n}")
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM tasks" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert build_all() == 2
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # The FEED_SIZE-th newest task's age, then the candidates, for both taskers
+    assert len(statements) == 2
+    db = TestingSessionLocal()
+    assert db.query(FeedEntry).count() == 6
+    db.close()
@@ -0,0 +1,161 @@
+"""
+Tests and benchmarks for sparse fieldsets (the ``fields`` query parameter).
+"""
+
+import json
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from database import Base, User, Task, Message, UserRole
+from auth import create_access_token
+from conftest import engine, TestingSessionLocal, get_db_overridden
+
+
+HEADERS = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+
+
+@pytest.fixture
+def client(client):
+    db = TestingSessionLocal()
+    customer = User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER)
+    tasker = User(email="tasker@test.com", hashed_password="x", full_name="Tasker", role=UserRole.TASKER)
+    db.add_all([customer, tasker])
+    db.flush()
+    for n in range(3):
+        db.add(Task(customer_id=customer.id, title=f"Task {n}", description="Long text " * 50,
+                    location="Austin", date=datetime.utcnow() + timedelta(days=1), budget=100.0))
+    db.flush()
+    db.add(Message(sender_id=tasker.id, receiver_id=customer.id, task_id=1, content="Hi"))
+    db.commit()
+    db.close()
+    return client
+
+
+@pytest.fixture
+def statements():
+    """SQL statements executed while the test runs."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def task_selects(statements):
+    return [statement for statement in statements if "FROM tasks" in statement]
+
+
+def test_tasks_return_only_requested_fields(client):
+    full = client.get("/tasks", headers=HEADERS).json()
+
+    response = client.get("/tasks", headers=HEADERS, params={"fields": "id,title,status"})
+
+    assert response.status_code == 200
+    assert response.json() == [{"id": t["id"], "title": t["title"], "status": t["status"]} for t in full]
+
+
+def test_unrequested_columns_are_not_read(client, statements):
+    client.get("/tasks", headers=HEADERS, params={"fields": "id,title"})
+
+    [select] = task_selects(statements)
+    assert "tasks.title" in select
+    assert "tasks.description" not in select
+    assert "task_bid_stats" not in select
+
+
+def test_requested_relationships_still_load(client):
+    [task, *_] = client.get("/tasks", headers=HEADERS, params={"fields": "id,bid_stats"}).json()
+
+    assert set(task) == {"id", "bid_stats"}
+
+
+def test_unknown_fields_are_rejected(client):
+    response = client.get("/tasks", headers=HEADERS, params={"fields": "id,hashed_password"})
+
+    assert response.status_code == 400
+    assert "hashed_password" in response.json()["detail"]
+    assert client.get("/tasks", headers=HEADERS, params={"fields": ","}).status_code == 400
+
+
+def test_ndjson_stream_honours_fields(client):
+    response = client.get("/tasks", params={"fields": "id,budget"},
+                          headers={**HEADERS, "Accept": "application/x-ndjson"})
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == [{"id": n, "budget": 100.0} for n in (1, 2, 3)]
+
+
+def test_my_tasks_fields(client):
+    tasks = client.get("/tasks/user/my-tasks", headers=HEADERS, params={"fields": "title"}).json()
+
+    assert tasks == [{"title": f"Task {n}"} for n in range(3)]
+
+
+def test_messages_skip_unneeded_joins(client, statements):
+    full = client.get("/messages", headers=HEADERS).json()
+    assert full[0]["sender_name"] == "Tasker"
+    statements.clear()
+
+    sparse = client.get("/messages", headers=HEADERS, params={"fields": "id,content,task_title"}).json()
+
+    assert sparse == [{"id": full[0]["id"], "content": "Hi", "task_title": "Task 0"}]
+    [select] = [statement for statement in statements if "FROM messages" in statement]
+    assert "JOIN users" not in select
+
+
+TASK_ROWS = 100000
+
+
+@pytest.fixture(scope="module")
+def large_client(tmp_path_factory):
+    """TASK_ROWS tasks with realistic descriptions in a file database."""
+    path = tmp_path_factory.mktemp("fieldsets") / "tasks.db"
+    large_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=large_engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=large_engine)
+    db = session_factory()
+    db.add(User(id=1, email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER))
+    db.flush()
+    now = datetime.utcnow()
+    db.execute(insert(Task), [
+        {"customer_id": 1, "title": f"Task {n}", "description": f"Task {n} details. " + "Bring tools. " * 40,
+         "location": "Austin", "date": now, "budget": 100.0, "created_at": now, "updated_at": now}
+        for n in range(TASK_ROWS)
+    ])
+    db.commit()
+    db.close()
+
+    def override():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    with get_db_overridden(override):
+        yield TestClient(app)
+    large_engine.dispose()
+
+
+@pytest.mark.benchmark(group="task-list-100k")
+def test_benchmark_all_fields(large_client, benchmark):
+    response = benchmark.pedantic(lambda: large_client.get("/tasks", headers=HEADERS), rounds=2)
+
+    assert len(response.json()) == TASK_ROWS
+    benchmark.extra_info["response_bytes"] = len(response.content)
+
+
+@pytest.mark.benchmark(group="task-list-100k")
+def test_benchmark_sparse_fields(large_client, benchmark):
+    params = {"fields": "id,title,status,budget"}
+    response = benchmark.pedantic(lambda: large_client.get("/tasks", headers=HEADERS, params=params), rounds=2)
+
+    assert len(response.json()) == TASK_ROWS
+    benchmark.extra_info["response_bytes"] = len(response.content)
@@ -0,0 +1,213 @@
+"""
+Tests and benchmarks for group-commit batching of message inserts.
+
+The benchmarks insert the same number of messages from concurrent threads
+through the per-request commit path and through the GroupCommitBatcher;
+compare them with ``pytest test_group_commit.py --benchmark-group-by=group``.
+"""
+
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
+
+import main
+from main import app
+from database import Base, User, Task, Agreement, Message, UserRole, TaskStatus
+from auth import get_password_hash, create_access_token
+from group_commit import GroupCommitBatcher
+from conftest import get_db_overridden
+
+MESSAGE_COUNT = 200
+WRITER_THREADS = 16
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """File-backed database so every commit pays for a real journal sync."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'group_commit.db'}",
+        connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    factory.commit_count = 0
+
+    @event.listens_for(engine, "commit")
+    def count_commit(conn):
+        factory.commit_count += 1
+
+    yield factory
+    engine.dispose()
+
+
+def new_message(i):
+    return Message(sender_id=1, receiver_id=2, task_id=1, content=f"Message {i}")
+
+
+def insert_per_request(session_factory, i):
+    db = session_factory()
+    try:
+        db.add(new_message(i))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_batcher_commits_rows_in_groups(session_factory):
+    batcher = GroupCommitBatcher(session_factory, window_ms=20)
+    with ThreadPoolExecutor(max_workers=WRITER_THREADS) as pool:
+        saved = list(pool.map(lambda i: batcher.submit(new_message(i)), range(MESSAGE_COUNT)))
+    batcher.stop()
+
+    assert len({m.id for m in saved}) == MESSAGE_COUNT
+    assert all(m.created_at is not None for m in saved)
+    db = session_factory()
+    assert db.query(Message).count() == MESSAGE_COUNT
+    db.close()
+    assert session_factory.commit_count < MESSAGE_COUNT
+
+
+def test_batcher_isolates_failing_row(session_factory):
+    batcher = GroupCommitBatcher(session_factory, window_ms=50)
+    bad = Message(sender_id=1, receiver_id=2, content=None)
+    results = {}
+
+    def submit(name, instance):
+        try:
+            results[name] = batcher.submit(instance)
+        except Exception as exc:
+            results[name] = exc
+
+    threads = [
+        threading.Thread(target=submit, args=("good", new_message(0))),
+        threading.Thread(target=submit, args=("bad", bad))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.stop()
+
+    assert isinstance(results["good"], Message)
+    assert isinstance(results["bad"], Exception)
+
+
+def test_timed_out_rows_are_never_committed(session_factory, monkeypatch):
+    batcher = GroupCommitBatcher(session_factory, window_ms=0)
+    committing = threading.Event()
+    release = threading.Event()
+    commit_rows = batcher._commit_rows
+
+    def slow_commit_rows(instances):
+        committing.set()
+        release.wait()
+        commit_rows(instances)
+
+    monkeypatch.setattr(batcher, "_commit_rows", slow_commit_rows)
+    results = {}
+
+    def submit():
+        # Times out mid-commit, so it waits for the outcome instead
+        results["running"] = batcher.submit(new_message(0), timeout=0.05)
+
+    running = threading.Thread(target=submit)
+    running.start()
+    committing.wait()
+    with pytest.raises(TimeoutError):
+        batcher.submit(new_message(1), timeout=0.05)
+    release.set()
+    running.join()
+    batcher.stop()
+
+    assert results["running"].content == "Message 0"
+    db = session_factory()
+    assert [m.content for m in db.query(Message).all()] == ["Message 0"]
+    db.close()
+
+
+def test_send_task_message_through_batcher(session_factory, monkeypatch):
+    db = session_factory()
+    customer = User(
+        email="customer@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Customer",
+        role=UserRole.CUSTOMER
+    )
+    tasker = User(
+        email="tasker@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Tasker",
+        role=UserRole.TASKER
+    )
+    db.add_all([customer, tasker])
+    db.commit()
+    task = Task(
+        customer_id=customer.id,
+        title="Task",
+        description="Description",
+        location="Test City",
+        date=datetime.utcnow() + timedelta(days=1),
+        budget=100.0,
+        status=TaskStatus.IN_PROGRESS
+    )
+    db.add(task)
+    db.commit()
+    db.add(Agreement(task_id=task.id, tasker_id=tasker.id, amount=90.0))
+    db.commit()
+    task_id, tasker_id = task.id, tasker.id
+    db.close()
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    batcher = GroupCommitBatcher(session_factory)
+    monkeypatch.setattr(main, "message_batcher", batcher)
+    try:
+        with get_db_overridden(override_get_db):
+            token = create_access_token(data={"sub": "customer@test.com"})
+            response = TestClient(app).post(
+                f"/tasks/{task_id}/messages",
+                json={"content": "Hello"},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+    finally:
+        batcher.stop()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["receiver_id"] == tasker_id
+    assert body["read"] is False
+    db = session_factory()
+    assert db.query(Message).filter(Message.id == body["id"]).first().content == "Hello"
+    db.close()
+
+
+@pytest.mark.benchmark(group="message-inserts")
+def test_benchmark_per_request_commit(session_factory, benchmark):
+    def run():
+        with ThreadPoolExecutor(max_workers=WRITER_THREADS) as pool:
+            list(pool.map(lambda i: insert_per_request(session_factory, i), range(MESSAGE_COUNT)))
+
+    benchmark.pedantic(run, rounds=3)
+    benchmark.extra_info["messages_per_sec"] = MESSAGE_COUNT / benchmark.stats.stats.mean
+
+
+@pytest.mark.benchmark(group="message-inserts")
+def test_benchmark_group_commit(session_factory, benchmark):
+    batcher = GroupCommitBatcher(session_factory, window_ms=5)
+
+    def run():
+        with ThreadPoolExecutor(max_workers=WRITER_THREADS) as pool:
+            list(pool.map(lambda i: batcher.submit(new_message(i)), range(MESSAGE_COUNT)))
+
+    benchmark.pedantic(run, rounds=3)
+    batcher.stop()
+    benchmark.extra_info["messages_per_sec"] = MESSAGE_COUNT / benchmark.stats.stats.mean
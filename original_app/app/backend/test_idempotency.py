@@ -0,0 +1,222 @@
+"""
+Tests for Idempotency-Key handling on create endpoints.
+"""
+
+import asyncio
+import threading
+import pytest
+import httpx
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import main
+from main import app
+from database import Base, User, Task, IdempotencyRecord, UserRole
+from auth import get_password_hash, create_access_token
+from idempotency import IdempotencyStore
+from conftest import engine, TestingSessionLocal
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    """Test client with the idempotency store pointed at the test database."""
+    monkeypatch.setattr(main.idempotency_store, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(main.idempotency_store, "_cache", OrderedDict())
+    return client
+
+
+@pytest.fixture
+def headers(client):
+    """Auth headers for two customers."""
+    db = TestingSessionLocal()
+    users = [
+        User(
+            email=f"customer{i}@test.com",
+            hashed_password=get_password_hash("password123"),
+            full_name=f"Customer {i}",
+            role=UserRole.CUSTOMER
+        )
+        for i in range(2)
+    ]
+    db.add_all(users)
+    db.commit()
+    db.close()
+    return [
+        {"Authorization": f"Bearer {create_access_token(data={'sub': f'customer{i}@test.com'})}"}
+        for i in range(2)
+    ]
+
+
+TASK = {
+    "title": "Fix sink",
+    "description": "Leaky sink",
+    "location": "Test City",
+    "date": (datetime.utcnow() + timedelta(days=1)).isoformat(),
+    "budget": 100.0
+}
+
+
+def task_count():
+    db = TestingSessionLocal()
+    count = db.query(Task).count()
+    db.close()
+    return count
+
+
+def test_retry_replays_stored_response(client, headers):
+    request_headers = dict(headers[0], **{"Idempotency-Key": "abc"})
+    first = client.post("/tasks", json=TASK, headers=request_headers)
+    second = client.post("/tasks", json=TASK, headers=request_headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert task_count() == 1
+
+
+def test_replay_survives_cache_eviction(client, headers):
+    request_headers = dict(headers[0], **{"Idempotency-Key": "abc"})
+    first = client.post("/tasks", json=TASK, headers=request_headers)
+    main.idempotency_store._cache.clear()
+    second = client.post("/tasks", json=TASK, headers=request_headers)
+
+    assert second.json() == first.json()
+    assert task_count() == 1
+
+
+def test_key_reused_with_different_body_is_rejected(client, headers):
+    request_headers = dict(headers[0], **{"Idempotency-Key": "abc"})
+    client.post("/tasks", json=TASK, headers=request_headers)
+    response = client.post("/tasks", json=dict(TASK, budget=5.0), headers=request_headers)
+
+    assert response.status_code == 422
+    assert task_count() == 1
+
+
+def test_keys_are_scoped_per_caller(client, headers):
+    for h in headers:
+        response = client.post("/tasks", json=TASK, headers=dict(h, **{"Idempotency-Key": "abc"}))
+        assert response.status_code == 200
+
+    assert task_count() == 2
+
+
+def test_requests_without_key_are_not_deduplicated(client, headers):
+    client.post("/tasks", json=TASK, headers=headers[0])
+    client.post("/tasks", json=TASK, headers=headers[0])
+
+    assert task_count() == 2
+
+
+def test_concurrent_duplicates_are_coalesced(client, headers):
+    request_headers = dict(headers[0], **{"Idempotency-Key": "race"})
+
+    async def fire():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(*[
+                async_client.post("/tasks", json=TASK, headers=request_headers)
+                for _ in range(5)
+            ])
+
+    responses = asyncio.run(fire())
+
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert task_count() == 1
+
+
+def test_retry_with_renewed_token_replays(client, headers):
+    # A new access token for the same user, as issued by POST /token/refresh
+    renewed = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer0@test.com'}, expires_delta=timedelta(minutes=5))}"}
+    assert renewed != headers[0]
+
+    first = client.post("/tasks", json=TASK, headers=dict(headers[0], **{"Idempotency-Key": "abc"}))
+    second = client.post("/tasks", json=TASK, headers=dict(renewed, **{"Idempotency-Key": "abc"}))
+
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert task_count() == 1
+
+
+def test_unauthenticated_requests_are_not_stored(client, headers):
+    expired = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer0@test.com'}, expires_delta=timedelta(seconds=-1))}"}
+
+    assert client.post("/tasks", json=TASK, headers=dict(expired, **{"Idempotency-Key": "abc"})).status_code == 401
+    response = client.post("/tasks", json=TASK, headers=dict(headers[0], **{"Idempotency-Key": "abc"}))
+
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+
+
+def test_waits_for_a_key_reserved_by_another_worker(client, headers, monkeypatch):
+    request_headers = dict(headers[0], **{"Idempotency-Key": "abc"})
+    first = client.post("/tasks", json=TASK, headers=request_headers)
+    # Make it look like another process has just reserved the key and is still running
+    db = TestingSessionLocal()
+    record = db.query(IdempotencyRecord).one()
+    key, response = record.key, (record.fingerprint, record.status_code, record.content_type, record.body)
+    record.status_code, record.body = 0, b""
+    db.commit()
+    db.close()
+    main.idempotency_store._cache.clear()
+    other_worker = IdempotencyStore(TestingSessionLocal)
+    assert not other_worker.reserve(key, response[0])
+    finish = threading.Timer(0.3, other_worker.put, (key, *response))
+    reserve_calls = []
+    reserve = main.idempotency_store.reserve
+    monkeypatch.setattr(
+        main.idempotency_store, "reserve", lambda *args: reserve_calls.append(args) or reserve(*args)
+    )
+    finish.start()
+
+    second = client.post("/tasks", json=TASK, headers=request_headers)
+
+    finish.join()
+    # Polled with reads while the other worker held the key
+    assert len(reserve_calls) == 1
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert task_count() == 1
+
+
+def test_reservations_are_released_or_lapse():
+    Base.metadata.create_all(bind=engine)
+    try:
+        store = IdempotencyStore(TestingSessionLocal)
+        assert store.reserve("k", "f")
+        assert not IdempotencyStore(TestingSessionLocal).reserve("k", "f")
+        assert store.get("k") is None
+        assert store.reserved("k")
+        store.release("k")
+        assert not store.reserved("k")
+        assert store.reserve("k", "f")
+
+        crashed = IdempotencyStore(TestingSessionLocal, lease_seconds=0)
+        assert crashed.reserve("lost", "f")
+        assert not store.reserved("lost")
+        assert store.reserve("lost", "f")
+    finally:
+        Base.metadata.drop_all(bind=engine)
+
+
+def test_store_ttl_and_lru():
+    Base.metadata.create_all(bind=engine)
+    try:
+        expired = IdempotencyStore(TestingSessionLocal, ttl_seconds=0)
+        expired.put("k", "f", 200, "application/json", b"{}")
+        assert expired.get("k") is None
+        db = TestingSessionLocal()
+        assert expired.purge_expired(db) == 1
+        db.close()
+
+        store = IdempotencyStore(TestingSessionLocal, cache_size=2)
+        for key in ("a", "b", "c"):
+            store.put(key, "f", 201, None, key.encode())
+        assert list(store._cache) == ["b", "c"]
+        assert store.get("a").body == b"a"
+
+        db = TestingSessionLocal()
+        assert db.query(IdempotencyRecord).count() == 3
+        db.close()
+    finally:
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,226 @@
+"""
+Tests for cross-worker cache invalidation.
+
+The multi-process test runs two app workers in subprocesses against one
+SQLite file, the way several uvicorn workers share tasker.db.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Task, Bid, UserRole
+from invalidation import VersionedCache, bump, current_versions
+
+BACKEND = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    customer = User(email="customer@test.com", hashed_password="x", full_name="C", role=UserRole.CUSTOMER)
+    tasker = User(email="tasker@test.com", hashed_password="x", full_name="T", role=UserRole.TASKER)
+    session.add_all([customer, tasker])
+    session.flush()
+    session.add(Task(customer_id=customer.id, title="Fix sink", description="Details",
+                     location="Austin", date=datetime.utcnow(), budget=100.0))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def cached_count(cache, db, scopes):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return len(loads)
+
+    cache.get(db, "key", scopes, load)
+    return len(loads)
+
+
+def test_unchanged_scopes_are_served_from_cache(db):
+    cache = VersionedCache()
+
+    assert cached_count(cache, db, ["relations:1"]) == 1
+    assert cached_count(cache, db, ["relations:1"]) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_writes_from_another_connection_invalidate(db, tmp_path):
+    cache = VersionedCache()
+    cached_count(cache, db, ["relations:1", "relations:2"])
+    db.commit()
+
+    # A raw connection stands in for another worker; the triggers still fire
+    with sqlite3.connect(tmp_path / "cache.db") as other:
+        other.execute("INSERT INTO bids (task_id, tasker_id, amount, withdrawn) VALUES (1, 2, 80.0, 0)")
+
+    assert cached_count(cache, db, ["relations:1", "relations:2"]) == 1
+    assert cached_count(cache, db, ["user:1"]) == 1
+    assert cached_count(cache, db, ["user:1"]) == 0
+
+
+def test_versions_are_read_once_per_transaction(db):
+    cache = VersionedCache()
+    reads = []
+    event.listen(db.bind, "before_cursor_execute", lambda *args: reads.append(args[2]))
+
+    cached_count(cache, db, ["relations:2"])
+    cached_count(cache, db, ["relations:2"])
+    assert len(reads) == 1
+    # A write in the session makes the next lookup look again
+    db.add(Bid(task_id=1, tasker_id=2, amount=80.0))
+    db.flush()
+    assert cached_count(cache, db, ["relations:2"]) == 1
+    db.rollback()
+    cached_count(cache, db, ["relations:2"])
+    assert sum("cache_versions" in statement for statement in reads) == 3
+
+
+def test_get_many_checks_all_keys_in_one_query(db):
+    cache = VersionedCache()
+    loads = []
+
+    def load_many(keys):
+        loads.append(keys)
+        return {key: key * 10 for key in keys if key != 3}
+
+    assert cache.get_many(db, [1, 2, 3], lambda key: (f"user:{key}",), load_many) == {1: 10, 2: 20}
+    db.commit()
+    assert cache.get_many(db, [2, 4, 3], lambda key: (f"user:{key}",), load_many) == {2: 20, 4: 40}
+
+    assert loads == [[1, 2, 3], [4]]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_rolled_back_writes_do_not_invalidate(db):
+    before = current_versions(db, ["relations:2"])
+    db.add(Bid(task_id=1, tasker_id=2, amount=80.0))
+    db.flush()
+    assert current_versions(db, ["relations:2"]) != before
+    db.rollback()
+
+    assert current_versions(db, ["relations:2"]) == before
+
+
+def test_explicit_bump(db):
+    cache = VersionedCache()
+    cached_count(cache, db, ["feed:2"])
+    bump(db, "feed:2")
+    db.commit()
+
+    assert current_versions(db, ["feed:2"])[1] == 1
+    assert cached_count(cache, db, ["feed:2"]) == 1
+
+
+def test_recreated_database_is_a_new_generation(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        first = current_versions(db, ["user:1"])
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with session_factory() as db:
+        second = current_versions(db, ["user:1"])
+
+    assert first[1:] == second[1:] == (0,)
+    assert first[0] != second[0]
+
+
+# One app worker: replays JSON requests from stdin through its own copy of
+# the app and reports each response with its permission cache counters
+WORKER = """
+import json, sys
+import main, permissions
+from auth import create_access_token
+from fastapi.testclient import TestClient
+
+with TestClient(main.app) as client:
+    print(json.dumps({"ready": True}), flush=True)
+    for line in sys.stdin:
+        request = json.loads(line)
+        token = create_access_token(data={"sub": request["user"]})
+        response = client.request(
+            request["method"], request["path"], json=request.get("json"),
+            headers={"Authorization": "Bearer " + token}
+        )
+        cache = permissions.messaging_permissions
+        print(json.dumps({
+            "status": response.status_code, "body": response.json(),
+            "hits": cache.hits, "misses": cache.misses
+        }), flush=True)
+"""
+
+
+class Worker:
+    def __init__(self, workdir):
+        env = dict(os.environ, PYTHONPATH=str(BACKEND), TASKER_FEED_INTERVAL_SECONDS="0", TASKER_JOB_WORKERS="0")
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", WORKER], cwd=workdir, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        assert json.loads(self.process.stdout.readline()) == {"ready": True}
+
+    def request(self, method, path, user="", json_body=None):
+        self.process.stdin.write(json.dumps({"method": method, "path": path, "user": user, "json": json_body}) + "\n")
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait(30)
+
+
+@pytest.fixture
+def workers(tmp_path):
+    # Started one after the other so only the first creates the schema
+    started = []
+    try:
+        started.append(Worker(tmp_path))
+        started.append(Worker(tmp_path))
+        yield started
+    finally:
+        for worker in started:
+            worker.close()
+
+
+def test_write_in_one_worker_invalidates_another(workers):
+    a, b = workers
+    for email, role in (("customer@test.com", "customer"), ("tasker@test.com", "tasker")):
+        assert a.request("POST", "/register", json_body={
+            "email": email, "password": "password123", "full_name": email, "role": role
+        })["status"] == 200
+    tasker_id = b.request("GET", "/users/me", "tasker@test.com")["body"]["id"]
+    task_id = a.request("POST", "/tasks", "customer@test.com", {
+        "title": "Fix sink", "description": "Details", "location": "Austin",
+        "date": (datetime.utcnow() + timedelta(days=1)).isoformat(), "budget": 100.0
+    })["body"]["id"]
+    message = {"receiver_id": tasker_id, "content": "Hello"}
+
+    first = a.request("POST", "/messages", "customer@test.com", message)
+    again = a.request("POST", "/messages", "customer@test.com", message)
+    assert (first["status"], again["status"]) == (403, 403)
+    assert (again["hits"], again["misses"]) == (1, 1)
+
+    bid = b.request("POST", "/bids", "tasker@test.com", {"task_id": task_id, "amount": 80.0})
+    assert bid["status"] == 200
+
+    allowed = a.request("POST", "/messages", "customer@test.com", message)
+    assert allowed["status"] == 200
+    assert allowed["misses"] == 2
+
+    assert b.request("POST", f"/bids/{bid['body']['id']}/withdraw", "tasker@test.com")["status"] == 200
+    assert a.request("POST", "/messages", "customer@test.com", message)["status"] == 403
@@ -0,0 +1,120 @@
+"""
+Tests for the one-query "my tasks" endpoints (GET /tasks/user/my-tasks and
+GET /tasks/my-tasks).
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, text
+
+from database import User, Task, Bid, Offer, Agreement, TaskStatus, UserRole
+from auth import create_access_token
+from involvement import involved_tasks
+from pagination import NEXT_CURSOR_HEADER
+from conftest import engine, TestingSessionLocal
+
+
+CUSTOMER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+TASKER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+
+
+@pytest.fixture
+def client(client):
+    """Tasker bid on task 1, was offered task 2, bid on and agreed to task 3; task 4 is someone else's."""
+    db = TestingSessionLocal()
+    db.add(User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER))
+    db.add(User(email="tasker@test.com", hashed_password="x", full_name="Tasker", role=UserRole.TASKER))
+    db.add(User(email="other@test.com", hashed_password="x", full_name="Other", role=UserRole.TASKER))
+    db.flush()
+    for n in range(1, 5):
+        db.add(Task(customer_id=1, title=f"Task {n}", description="Details", location="Austin",
+                    date=datetime.utcnow() + timedelta(days=1), budget=100.0,
+                    status=TaskStatus.IN_PROGRESS if n == 3 else TaskStatus.OPEN))
+    db.flush()
+    db.add_all([
+        Bid(task_id=1, tasker_id=2, amount=90.0),
+        Offer(task_id=2, customer_id=1, tasker_id=2, amount=80.0),
+        Bid(task_id=3, tasker_id=2, amount=70.0),
+        Agreement(task_id=3, tasker_id=2, amount=70.0),
+        Bid(task_id=4, tasker_id=3, amount=60.0),
+    ])
+    db.commit()
+    db.close()
+    return client
+
+
+@pytest.fixture
+def statements():
+    """SELECT statements executed while the test runs."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and "FROM tasks" in statement:
+            seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def summary(response):
+    assert response.status_code == 200
+    return [(task["title"], task["involvement"]) for task in response.json()]
+
+
+def test_tasker_tasks_in_one_query(client, statements):
+    response = client.get("/tasks/user/my-tasks", headers=TASKER)
+
+    assert summary(response) == [
+        ("Task 1", ["bid"]),
+        ("Task 2", ["offer"]),
+        ("Task 3", ["bid", "agreement"]),
+    ]
+    assert len(statements) == 1
+
+
+def test_both_routes_agree(client):
+    for headers in (TASKER, CUSTOMER):
+        assert client.get("/tasks/my-tasks", headers=headers).json() == \
+            client.get("/tasks/user/my-tasks", headers=headers).json()
+
+
+def test_customer_owns_their_tasks(client):
+    response = client.get("/tasks/my-tasks", headers=CUSTOMER)
+
+    assert summary(response) == [(f"Task {n}", ["owner"]) for n in (1, 2, 3, 4)]
+
+
+def test_status_and_involvement_filters(client):
+    agreed = client.get("/tasks/my-tasks", headers=TASKER, params={"involvement": "agreement"})
+    open_bids = client.get("/tasks/my-tasks", headers=TASKER, params={"involvement": "bid", "status": "open"})
+
+    assert summary(agreed) == [("Task 3", ["bid", "agreement"])]
+    assert summary(open_bids) == [("Task 1", ["bid"])]
+    assert client.get("/tasks/my-tasks", headers=TASKER, params={"involvement": "watcher"}).status_code == 422
+
+
+def test_cursor_pagination_with_fields(client):
+    params = {"limit": 2, "fields": "title,involvement"}
+    first = client.get("/tasks/my-tasks", headers=TASKER, params=params)
+    second = client.get("/tasks/my-tasks", headers=TASKER,
+                        params={**params, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+
+    assert first.json() == [
+        {"title": "Task 1", "involvement": ["bid"]},
+        {"title": "Task 2", "involvement": ["offer"]},
+    ]
+    assert second.json() == [{"title": "Task 3", "involvement": ["bid", "agreement"]}]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+
+def test_branches_use_tasker_indexes(client):
+    db = TestingSessionLocal()
+    tasker = db.query(User).filter(User.email == "tasker@test.com").one()
+    statement = involved_tasks(db, tasker).statement.compile(compile_kwargs={"literal_binds": True})
+
+    plan = " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+    db.close()
+
+    for index in ("ix_bids_tasker_task", "ix_offers_tasker_task", "ix_agreements_tasker_task"):
+        assert index in plan
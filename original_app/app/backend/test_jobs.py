@@ -0,0 +1,206 @@
+"""
+Tests for the durable background job queue.
+"""
+
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import jobs
+from database import Base, Job, JobStatus, User, UserRole
+from jobs import JobWorker, enqueue, job, job_types
+
+
+class FakeClock:
+    """Starts just ahead of real time so freshly enqueued jobs are due."""
+
+    def __init__(self):
+        self.now = datetime.utcnow() + timedelta(seconds=1)
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'jobs.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def register():
+    """Register test job kinds for the duration of one test."""
+    added = []
+
+    def register(kind, handler, **options):
+        job(kind, **options)(handler)
+        added.append(kind)
+
+    yield register
+    for kind in added:
+        job_types.pop(kind, None)
+
+
+def add_user(db, email):
+    db.add(User(email=email, hashed_password="x", full_name=email, role=UserRole.CUSTOMER))
+
+
+def test_job_commits_with_the_caller(session_factory, register):
+    register("test.add_user", lambda db, email: add_user(db, email))
+    db = session_factory()
+    enqueue(db, "test.add_user", email="kept@test.com")
+    db.commit()
+    enqueue(db, "test.add_user", email="dropped@test.com")
+    db.rollback()
+    db.close()
+
+    assert JobWorker(session_factory).run_pending() == 1
+
+    db = session_factory()
+    assert [user.email for user in db.query(User)] == ["kept@test.com"]
+    assert db.query(Job).count() == 0
+    db.close()
+
+
+def test_unknown_kind_is_rejected(session_factory):
+    db = session_factory()
+    with pytest.raises(ValueError):
+        enqueue(db, "test.missing")
+    db.close()
+
+
+def test_failures_retry_with_backoff(session_factory, register):
+    calls = []
+
+    def flaky(db):
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("not yet")
+
+    register("test.flaky", flaky)
+    clock = FakeClock()
+    worker = JobWorker(session_factory, clock=clock)
+    db = session_factory()
+    enqueue(db, "test.flaky")
+    db.commit()
+
+    assert worker.run_pending() == 1
+    row = db.query(Job).one()
+    assert row.status == JobStatus.PENDING
+    assert row.attempts == 1
+    assert "not yet" in row.last_error
+    assert row.run_after == clock.now + timedelta(seconds=jobs.retry_delay(1))
+
+    # Not due again until the backoff has passed
+    assert worker.run_pending() == 0
+    clock.now += timedelta(seconds=jobs.retry_delay(1))
+    assert worker.run_pending() == 1
+    clock.now += timedelta(seconds=jobs.retry_delay(2))
+    assert worker.run_pending() == 1
+
+    assert len(calls) == 3
+    db.expire_all()
+    assert db.query(Job).count() == 0
+    db.close()
+
+
+def test_job_fails_after_max_attempts(session_factory, register):
+    def broken(db):
+        raise RuntimeError("broken")
+
+    register("test.broken", broken, max_attempts=2)
+    clock = FakeClock()
+    worker = JobWorker(session_factory, clock=clock)
+    db = session_factory()
+    enqueue(db, "test.broken")
+    db.commit()
+
+    worker.run_pending()
+    clock.now += timedelta(hours=1)
+    worker.run_pending()
+    clock.now += timedelta(hours=1)
+
+    assert worker.run_pending() == 0
+    row = db.query(Job).one()
+    assert row.status == JobStatus.FAILED
+    assert row.attempts == 2
+    db.close()
+
+
+def test_expired_lease_is_reclaimed(session_factory, register):
+    ran = []
+    register("test.record", lambda db: ran.append(1))
+    clock = FakeClock()
+    db = session_factory()
+    enqueue(db, "test.record")
+    db.commit()
+    # A worker claimed the job and died
+    db.query(Job).update({"status": JobStatus.RUNNING, "attempts": 1,
+                          "run_after": clock.now + timedelta(seconds=jobs.JOB_LEASE_SECONDS)})
+    db.commit()
+    db.close()
+    worker = JobWorker(session_factory, clock=clock)
+
+    assert worker.run_pending() == 0
+    clock.now += timedelta(seconds=jobs.JOB_LEASE_SECONDS)
+    assert worker.run_pending() == 1
+    assert ran == [1]
+
+
+def test_concurrency_limit_per_kind(session_factory, register):
+    lock = threading.Lock()
+    active = {"slow": 0, "fast": 0}
+    peak = {"slow": 0, "fast": 0}
+
+    def tracked(kind):
+        def handler(db):
+            with lock:
+                active[kind] += 1
+                peak[kind] = max(peak[kind], active[kind])
+            time.sleep(0.05)
+            with lock:
+                active[kind] -= 1
+        return handler
+
+    register("test.slow", tracked("slow"), concurrency=1)
+    register("test.fast", tracked("fast"), concurrency=3)
+    db = session_factory()
+    for _ in range(6):
+        enqueue(db, "test.slow")
+        enqueue(db, "test.fast")
+    db.commit()
+
+    worker = JobWorker(session_factory, workers=4, poll_interval=0.01)
+    worker.start()
+    deadline = time.time() + 10
+    while db.query(Job).count() and time.time() < deadline:
+        time.sleep(0.05)
+    worker.stop()
+
+    assert db.query(Job).count() == 0
+    assert peak["slow"] == 1
+    assert 1 < peak["fast"] <= 3
+    db.close()
+
+
+def test_started_workers_wake_on_commit(session_factory, register):
+    done = threading.Event()
+    register("test.signal", lambda db: done.set())
+    worker = JobWorker(session_factory, workers=1, poll_interval=30)
+    worker.start()
+    try:
+        db = session_factory()
+        enqueue(db, "test.signal")
+        db.commit()
+        db.close()
+        assert done.wait(5)
+    finally:
+        worker.stop()
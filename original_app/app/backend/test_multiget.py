@@ -0,0 +1,150 @@
+"""
+Tests for the multi-get endpoints GET /users?ids= and GET /tasks?ids=.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import archive
+import entities
+import multiget
+from database import User, Task, Bid, TaskStatus, UserRole
+from auth import create_access_token
+from multiget import MISSING_IDS_HEADER
+from conftest import engine, TestingSessionLocal
+
+
+HEADERS = {"Authorization": f"Bearer {create_access_token(data={'sub': 'user1@test.com'})}"}
+
+
+@pytest.fixture
+def client(client):
+    entities.task_cache.clear()
+    entities.user_cache.clear()
+    db = TestingSessionLocal()
+    for n in range(1, 6):
+        db.add(User(email=f"user{n}@test.com", hashed_password="x", full_name=f"User {n}", role=UserRole.CUSTOMER))
+    db.flush()
+    for n in range(1, 6):
+        db.add(Task(customer_id=1, title=f"Task {n}", description="Details", location="Austin",
+                    date=datetime.utcnow() + timedelta(days=1), budget=100.0,
+                    status=TaskStatus.COMPLETED if n == 5 else TaskStatus.OPEN))
+    db.commit()
+    db.close()
+    return client
+
+
+@pytest.fixture
+def statements():
+    """SELECT statements executed while the test runs."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_users_in_requested_order(client, statements):
+    response = client.get("/users", headers=HEADERS, params={"ids": "3,1,2,3"})
+
+    assert response.status_code == 200
+    assert [user["full_name"] for user in response.json()] == ["User 3", "User 1", "User 2"]
+    assert MISSING_IDS_HEADER not in response.headers
+    # The caller, the versions of all three users, the users, then which of
+    # them the caller can see contact details of
+    assert len(statements) == 4
+
+
+def test_repeated_multi_gets_are_served_from_cache(client, statements):
+    first = client.get("/users", headers=HEADERS, params={"ids": "3,1,2"}).json()
+    statements.clear()
+
+    second = client.get("/users", headers=HEADERS, params={"ids": "2,3,1,4"}).json()
+
+    assert second == [first[2], first[0], first[1], second[3]]
+    assert second[3]["full_name"] == "User 4"
+    # One versions query for everything, and only user 4 loaded
+    assert len(statements) == 4
+    assert statements[2].count("?") == 1
+
+    statements.clear()
+    assert client.get("/tasks", headers=HEADERS, params={"ids": "1,2"}).status_code == 200
+    cached = client.get("/tasks", headers=HEADERS, params={"ids": "2,1", "fields": "id,title,bid_stats"})
+    # Only the signed-in user's lookup and the versions check
+    assert not any("FROM tasks" in statement for statement in statements[-2:])
+    assert cached.json() == [{"id": 2, "title": "Task 2", "bid_stats": None}, {"id": 1, "title": "Task 1", "bid_stats": None}]
+
+
+def test_missing_ids_are_reported(client):
+    response = client.get("/users", headers=HEADERS, params={"ids": "2,99,4,98"})
+
+    assert [user["id"] for user in response.json()] == [2, 4]
+    assert response.headers[MISSING_IDS_HEADER] == "99,98"
+
+
+def test_large_requests_are_chunked(client, statements, monkeypatch):
+    monkeypatch.setattr(multiget, "IN_CHUNK_SIZE", 2)
+
+    response = client.get("/users", headers=HEADERS, params={"ids": "5,4,3,2,1"})
+
+    assert [user["id"] for user in response.json()] == [5, 4, 3, 2, 1]
+    assert len(statements) == 1 + 1 + 3 + 1
+
+
+def test_bad_and_oversized_id_lists(client, monkeypatch):
+    assert client.get("/users", headers=HEADERS, params={"ids": "1,x"}).status_code == 400
+    assert client.get("/users", headers=HEADERS, params={"ids": ","}).status_code == 400
+    assert client.get("/users", headers=HEADERS).status_code == 422
+
+    monkeypatch.setattr(multiget, "MULTI_GET_MAX_IDS", 3)
+    assert client.get("/users", headers=HEADERS, params={"ids": "1,2,3,4"}).status_code == 400
+
+
+def test_tasks_by_ids(client):
+    response = client.get("/tasks", headers=HEADERS, params={"ids": "4,2,42"})
+
+    assert [task["title"] for task in response.json()] == ["Task 4", "Task 2"]
+    assert response.headers[MISSING_IDS_HEADER] == "42"
+
+
+def test_tasks_by_ids_with_fields_and_status(client):
+    response = client.get("/tasks", headers=HEADERS, params={"ids": "5,3,1", "fields": "title", "status": "open"})
+
+    assert response.json() == [{"title": "Task 3"}, {"title": "Task 1"}]
+    assert response.headers[MISSING_IDS_HEADER] == "5"
+
+
+def test_archived_tasks_are_found(client):
+    db = TestingSessionLocal()
+    db.query(Task).filter(Task.id == 5).update({"updated_at": datetime.utcnow() - timedelta(days=365)})
+    db.commit()
+    assert archive.archive_closed_tasks(db, older_than_days=1) == 1
+    db.close()
+
+    response = client.get("/tasks", headers=HEADERS, params={"ids": "5,1"})
+
+    assert [task["title"] for task in response.json()] == ["Task 5", "Task 1"]
+    assert MISSING_IDS_HEADER not in response.headers
+
+
+def test_contact_details_only_for_counterparties(client):
+    db = TestingSessionLocal()
+    db.query(User).filter(User.id == 2).update({"phone": "555-0102", "role": UserRole.TASKER})
+    db.add(Bid(task_id=1, tasker_id=2, amount=90.0))
+    db.commit()
+    db.close()
+
+    assert client.get("/users", params={"ids": "1,2"}).status_code == 401
+    users = client.get("/users", headers=HEADERS, params={"ids": "1,2,3"}).json()
+
+    # Themselves, and user 2 who bid on their task
+    assert [(user["email"], user.get("phone")) for user in users[:2]] == [
+        ("user1@test.com", None), ("user2@test.com", "555-0102")
+    ]
+    assert users[2]["full_name"] == "User 3"
+    assert "email" not in users[2] and "phone" not in users[2]
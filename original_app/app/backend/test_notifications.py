@@ -0,0 +1,220 @@
+"""
+Tests and benchmarks for task-match notifications.
+"""
+
+import asyncio
+import threading
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import notifications
+from jobs import JobWorker
+from database import Base, User, Task, Notification, SkillIndexEntry, UserRole
+from auth import create_access_token
+from notifications import NotificationBroker, event_stream
+from pagination import NEXT_CURSOR_HEADER
+from conftest import engine, TestingSessionLocal
+
+
+def auth_headers(email):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+TASKERS = [
+    ("plumber@test.com", "Plumbing, pipe repair", "Austin, TX"),
+    ("denver@test.com", "Plumbing", "Denver"),
+    ("painter@test.com", "Painting", "Austin"),
+]
+
+
+@pytest.fixture
+def client(client):
+    for email, skills, location in [("customer@test.com", None, "Austin")] + TASKERS:
+        response = client.post("/register", json={
+            "email": email, "password": "password123", "full_name": email,
+            "role": "customer" if skills is None else "tasker",
+            "skills": skills, "location": location
+        })
+        assert response.status_code == 200
+    return client
+
+
+def post_task(client, title, location="Austin, TX"):
+    response = client.post("/tasks", headers=auth_headers("customer@test.com"), json={
+        "title": title, "description": "Details", "location": location,
+        "date": (datetime.utcnow() + timedelta(days=1)).isoformat(), "budget": 100.0
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def run_jobs():
+    return JobWorker(TestingSessionLocal).run_pending()
+
+
+def inbox(client, email, **params):
+    return client.get("/notifications", headers=auth_headers(email), params=params)
+
+
+def test_register_indexes_tasker_tokens(client):
+    db = TestingSessionLocal()
+    tokens = {row.token for row in db.query(SkillIndexEntry).join(User).filter(User.email == "plumber@test.com")}
+    assert tokens == {"skill:plumbing", "skill:pipe", "skill:repair", "city:austin"}
+    assert db.query(SkillIndexEntry).join(User).filter(User.role == UserRole.CUSTOMER).count() == 0
+    db.close()
+
+
+def test_new_task_notifies_matching_taskers(client):
+    task_id = post_task(client, "Leaking pipe under the sink")
+    assert inbox(client, "plumber@test.com").json() == []
+
+    run_jobs()
+
+    [notification] = inbox(client, "plumber@test.com").json()
+    assert notification["task_id"] == task_id
+    assert notification["kind"] == "task_match"
+    assert notification["read"] is False
+    # Right skill, wrong city; right city, wrong skill
+    assert inbox(client, "denver@test.com").json() == []
+    assert inbox(client, "painter@test.com").json() == []
+
+
+def test_inbox_pages_newest_first(client):
+    task_ids = [post_task(client, f"Plumbing job {n}") for n in range(5)]
+    run_jobs()
+
+    seen, cursor = [], None
+    while True:
+        response = inbox(client, "plumber@test.com", limit=2, **({"cursor": cursor} if cursor else {}))
+        seen.extend(n["task_id"] for n in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+
+    assert seen == task_ids[::-1]
+
+
+def test_marking_notifications_read(client):
+    task_ids = [post_task(client, f"Plumbing job {n}") for n in range(3)]
+    run_jobs()
+    plumber = auth_headers("plumber@test.com")
+    newest_first = inbox(client, "plumber@test.com").json()
+    ids = [n["id"] for n in newest_first]
+
+    assert client.put(f"/notifications/{ids[0]}/read", headers=plumber).status_code == 200
+    assert client.put(f"/notifications/{ids[0]}/read", headers=auth_headers("painter@test.com")).status_code == 403
+    assert client.put("/notifications/9999/read", headers=plumber).status_code == 404
+    assert [n["read"] for n in inbox(client, "plumber@test.com").json()] == [True, False, False]
+
+    # Read up to the second newest: only the oldest unread one is left to update
+    response = client.put("/notifications/read", headers=plumber, params={"up_to": ids[1]})
+
+    assert response.json() == {"updated": 2}
+    assert all(n["read"] for n in inbox(client, "plumber@test.com").json())
+    assert [n["task_id"] for n in newest_first] == task_ids[::-1]
+
+
+def test_fan_out_is_resumable(client):
+    task_id = post_task(client, "Plumbing emergency")
+    run_jobs()
+    db = TestingSessionLocal()
+    task = db.get(Task, task_id)
+
+    assert notifications.fan_out(db, task) == 0
+    assert db.query(Notification).filter(Notification.task_id == task_id).count() == 1
+    db.close()
+
+
+def test_broker_pushes_across_threads():
+    broker = NotificationBroker()
+
+    async def receive():
+        stream = event_stream(7, heartbeat=0.05, broker=broker)
+        assert await stream.__anext__() == ": connected\n\n"
+        assert await stream.__anext__() == ": keep-alive\n\n"
+        threading.Thread(target=broker.publish, args=(7, {"task_id": 1})).start()
+        event = await stream.__anext__()
+        while event == ": keep-alive\n\n":
+            event = await stream.__anext__()
+        await stream.aclose()
+        return event
+
+    event = asyncio.run(receive())
+
+    assert event == 'event: notification\ndata: {"task_id": 1}\n\n'
+    assert broker.connected([7]) == set()
+
+
+def test_fan_out_pushes_to_connected_taskers(client, monkeypatch):
+    broker = NotificationBroker()
+    monkeypatch.setattr(notifications, "broker", broker)
+    db = TestingSessionLocal()
+    plumber_id = db.query(User.id).filter(User.email == "plumber@test.com").scalar()
+    db.close()
+    task_id = post_task(client, "Pipe repair")
+
+    async def receive():
+        stream = event_stream(plumber_id, broker=broker)
+        await stream.__anext__()
+        await asyncio.get_running_loop().run_in_executor(None, run_jobs)
+        event = await asyncio.wait_for(stream.__anext__(), 5)
+        await stream.aclose()
+        return event
+
+    event = asyncio.run(receive())
+
+    assert event.startswith("event: notification\n")
+    assert f'"task_id": {task_id}' in event
+
+
+CANDIDATES = 50000
+
+
+@pytest.fixture
+def crowded_market(tmp_path):
+    """A file database with CANDIDATES Austin plumbers and one matching task."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fanout.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = session_factory()
+    db.execute(insert(User), [
+        {"id": i, "email": f"tasker{i}@test.com", "hashed_password": "x", "full_name": "Tasker",
+         "role": UserRole.TASKER, "skills": "plumbing", "location": "Austin"}
+        for i in range(1, CANDIDATES + 1)
+    ])
+    db.execute(insert(SkillIndexEntry), [
+        {"token": token, "tasker_id": i}
+        for i in range(1, CANDIDATES + 1) for token in ("skill:plumbing", "city:austin")
+    ])
+    task = Task(customer_id=1, title="Plumbing", description="Details", location="Austin",
+                date=datetime.utcnow(), budget=100.0)
+    db.add(task)
+    db.commit()
+    task_id = task.id
+    db.close()
+    yield session_factory, task_id
+    engine.dispose()
+
+
+@pytest.mark.benchmark(group="notification-fanout")
+def test_benchmark_fan_out_50k(crowded_market, benchmark):
+    session_factory, task_id = crowded_market
+
+    def setup():
+        db = session_factory()
+        db.query(Notification).delete()
+        db.commit()
+        return (db,), {}
+
+    def run(db):
+        try:
+            return notifications.fan_out(db, db.get(Task, task_id))
+        finally:
+            db.close()
+
+    written = benchmark.pedantic(run, setup=setup, rounds=3)
+
+    assert written == CANDIDATES
+    assert benchmark.stats.stats.max < 5.0
@@ -0,0 +1,138 @@
+"""
+Tests for per-user token-bucket rate limiting.
+"""
+
+import time
+import pytest
+from datetime import timedelta
+
+import main
+from database import User, UserRole
+from auth import get_password_hash, create_access_token
+from rate_limit import TokenBucketLimiter, parse_limits
+from conftest import TestingSessionLocal
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def client(client, monkeypatch, clock):
+    """Test client with limiting enabled, tiny budgets and a fake clock."""
+    monkeypatch.setattr(main.rate_limiter, "enabled", True)
+    monkeypatch.setattr(main.rate_limiter, "limits", parse_limits("auth=0.1:2,read=1:3,write=1:2"))
+    monkeypatch.setattr(main.rate_limiter, "clock", clock)
+    monkeypatch.setattr(main.rate_limiter, "buckets", {})
+    return client
+
+
+@pytest.fixture
+def headers(client):
+    db = TestingSessionLocal()
+    for i in range(2):
+        db.add(User(
+            email=f"user{i}@test.com",
+            hashed_password=get_password_hash("password123"),
+            full_name=f"User {i}",
+            role=UserRole.CUSTOMER
+        ))
+    db.commit()
+    db.close()
+    return [
+        {"Authorization": f"Bearer {create_access_token(data={'sub': f'user{i}@test.com'})}"}
+        for i in range(2)
+    ]
+
+
+def test_burst_then_429_with_retry_after(client, headers):
+    statuses = [client.get("/users/me", headers=headers[0]).status_code for _ in range(4)]
+
+    assert statuses == [200, 200, 200, 429]
+    rejected = client.get("/users/me", headers=headers[0])
+    assert rejected.headers["retry-after"] == "1"
+    assert rejected.headers["x-ratelimit-limit"] == "3"
+    assert rejected.headers["x-ratelimit-remaining"] == "0"
+
+
+def test_limit_headers_on_allowed_responses(client, headers):
+    response = client.get("/users/me", headers=headers[0])
+
+    assert response.headers["x-ratelimit-limit"] == "3"
+    assert response.headers["x-ratelimit-remaining"] == "2"
+
+
+def test_buckets_refill_over_time(client, headers, clock):
+    for _ in range(3):
+        client.get("/users/me", headers=headers[0])
+    assert client.get("/users/me", headers=headers[0]).status_code == 429
+
+    clock.now += 1.0
+    assert client.get("/users/me", headers=headers[0]).status_code == 200
+
+
+def test_users_have_separate_buckets(client, headers):
+    for _ in range(3):
+        client.get("/users/me", headers=headers[0])
+
+    assert client.get("/users/me", headers=headers[0]).status_code == 429
+    assert client.get("/users/me", headers=headers[1]).status_code == 200
+
+
+def test_auth_routes_use_anonymous_bucket(client):
+    form = {"username": "nobody@test.com", "password": "wrong"}
+    statuses = [client.post("/token", data=form).status_code for _ in range(3)]
+
+    assert statuses == [401, 401, 429]
+
+
+def test_expired_tokens_use_the_address_bucket(client):
+    expired = [
+        {"Authorization": f"Bearer {create_access_token(data={'sub': f'user{i}@test.com'}, expires_delta=timedelta(seconds=-1))}"}
+        for i in range(2)
+    ]
+    statuses = [client.get("/users/me", headers=expired[i % 2]).status_code for i in range(4)]
+
+    assert statuses == [401, 401, 401, 429]
+
+
+def test_rates_must_be_positive():
+    for spec in ("read=0:10", "read=-1:10", "read=1:0"):
+        with pytest.raises(ValueError):
+            parse_limits(spec)
+
+
+def test_disabled_limiter_lets_everything_through(client, headers, monkeypatch):
+    monkeypatch.setattr(main.rate_limiter, "enabled", False)
+
+    assert all(client.get("/users/me", headers=headers[0]).status_code == 200 for _ in range(10))
+
+
+def test_idle_buckets_are_evicted(clock):
+    limiter = TokenBucketLimiter(parse_limits("read=1:5"), enabled=True, clock=clock)
+    limiter.acquire("read", "a")
+    clock.now += 2
+    limiter.acquire("read", "b")
+    clock.now += 4
+
+    limiter.evict_idle()
+    assert list(limiter.buckets) == [("read", "b")]
+
+
+def test_acquire_costs_microseconds():
+    limiter = TokenBucketLimiter(parse_limits("read=1000000:1000000"), enabled=True)
+    start = time.perf_counter()
+    for i in range(10000):
+        limiter.acquire("read", f"user:{i % 100}")
+    per_call = (time.perf_counter() - start) / 10000
+
+    assert per_call < 50e-6
@@ -0,0 +1,176 @@
+"""
+Tests and benchmarks for refresh-token session renewal.
+"""
+
+import hashlib
+import time
+import pytest
+from datetime import datetime, timedelta
+
+import auth
+from database import RefreshToken
+from conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def client(client):
+    response = client.post("/register", json={
+        "email": "user@test.com", "password": "password123", "full_name": "User", "role": "customer"
+    })
+    assert response.status_code == 200
+    return client
+
+
+def login(client):
+    response = client.post("/token", data={"username": "user@test.com", "password": "password123"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def refresh(client, refresh_token):
+    return client.post("/token/refresh", json={"refresh_token": refresh_token})
+
+
+def test_login_issues_refresh_token_stored_hashed(client):
+    refresh_token = login(client)["refresh_token"]
+
+    db = TestingSessionLocal()
+    stored = db.query(RefreshToken).one()
+    assert stored.token_hash == hashlib.sha256(refresh_token.encode()).hexdigest()
+    assert stored.revoked_at is None
+    db.close()
+
+
+def test_refresh_rotates_without_bcrypt(client, monkeypatch):
+    tokens = login(client)
+
+    def no_bcrypt(*args):
+        raise AssertionError("refresh must not verify the password")
+
+    monkeypatch.setattr(auth, "verify_password", no_bcrypt)
+    response = refresh(client, tokens["refresh_token"])
+
+    assert response.status_code == 200
+    renewed = response.json()
+    assert renewed["user"]["email"] == "user@test.com"
+    assert renewed["refresh_token"] != tokens["refresh_token"]
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {renewed['access_token']}"})
+    assert me.status_code == 200
+
+
+def rotated_ago(seconds):
+    db = TestingSessionLocal()
+    db.query(RefreshToken).filter(RefreshToken.rotated_at.isnot(None)).update(
+        {"rotated_at": datetime.utcnow() - timedelta(seconds=seconds)}
+    )
+    db.commit()
+    db.close()
+
+
+def test_reused_refresh_token_revokes_family(client):
+    first = login(client)["refresh_token"]
+    second = refresh(client, first).json()["refresh_token"]
+    rotated_ago(auth.REFRESH_TOKEN_REUSE_GRACE_SECONDS + 1)
+
+    # The old token turning up again means it leaked; its successor goes too
+    assert refresh(client, first).status_code == 401
+    assert refresh(client, second).status_code == 401
+
+
+def test_tabs_refreshing_together_both_stay_signed_in(client):
+    shared = login(client)["refresh_token"]
+
+    first_tab = refresh(client, shared)
+    second_tab = refresh(client, shared)
+
+    assert first_tab.status_code == second_tab.status_code == 200
+    assert first_tab.json()["refresh_token"] != second_tab.json()["refresh_token"]
+    assert refresh(client, first_tab.json()["refresh_token"]).status_code == 200
+    assert refresh(client, second_tab.json()["refresh_token"]).status_code == 200
+
+
+def test_grace_window_does_not_survive_logout(client):
+    first = login(client)["refresh_token"]
+    second = refresh(client, first).json()["refresh_token"]
+
+    assert client.post("/token/revoke", json={"refresh_token": second}).status_code == 200
+
+    assert refresh(client, first).status_code == 401
+
+
+def test_purge_removes_expired_and_dead_families(client):
+    live = login(client)["refresh_token"]
+    refresh(client, live)
+    logged_out = login(client)["refresh_token"]
+    client.post("/token/revoke", json={"refresh_token": logged_out})
+    expired = login(client)["refresh_token"]
+    db = TestingSessionLocal()
+    db.query(RefreshToken).filter(RefreshToken.token_hash == auth.hash_refresh_token(expired)).update(
+        {"expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+    assert auth.purge_refresh_tokens(db) == 2
+    # The live family keeps its rotated token for reuse detection
+    assert db.query(RefreshToken).count() == 2
+    db.close()
+
+
+def test_other_sessions_survive_a_revoke(client):
+    phone = login(client)["refresh_token"]
+    laptop = login(client)["refresh_token"]
+
+    assert client.post("/token/revoke", json={"refresh_token": phone}).status_code == 200
+
+    assert refresh(client, phone).status_code == 401
+    assert refresh(client, laptop).status_code == 200
+
+
+def test_expired_and_unknown_tokens_are_rejected(client):
+    refresh_token = login(client)["refresh_token"]
+    db = TestingSessionLocal()
+    db.query(RefreshToken).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+
+    assert refresh(client, refresh_token).status_code == 401
+    assert refresh(client, "not-a-token").status_code == 401
+
+
+# An active user renews their access token this often per hour
+RENEWALS_PER_HOUR = 60 / auth.ACCESS_TOKEN_EXPIRE_MINUTES
+
+
+def cpu_seconds(renew, rounds=5):
+    """Mean process CPU time of one renewal"""
+    start = time.process_time()
+    for _ in range(rounds):
+        renew()
+    return (time.process_time() - start) / rounds
+
+
+@pytest.mark.benchmark(group="session-renewal")
+def test_benchmark_renew_with_password(client, benchmark):
+    benchmark.pedantic(lambda: login(client), rounds=5)
+
+
+@pytest.mark.benchmark(group="session-renewal")
+def test_benchmark_renew_with_refresh_token(client, benchmark):
+    tokens = [login(client)["refresh_token"]]
+
+    def renew():
+        response = refresh(client, tokens[-1])
+        assert response.status_code == 200
+        tokens.append(response.json()["refresh_token"])
+
+    benchmark.pedantic(renew, rounds=20)
+
+    password_cpu = cpu_seconds(lambda: login(client))
+    refresh_cpu = cpu_seconds(renew)
+    saved_ms = (password_cpu - refresh_cpu) * RENEWALS_PER_HOUR * 1000
+    benchmark.extra_info.update({
+        "password_renewal_cpu_ms": password_cpu * 1000,
+        "refresh_renewal_cpu_ms": refresh_cpu * 1000,
+        "cpu_ms_saved_per_active_user_hour": saved_ms,
+    })
+    assert refresh_cpu * 5 < password_cpu
@@ -0,0 +1,157 @@
+"""
+Tests for read/write session routing with read replicas.
+
+The primary and the replica are separate in-memory databases holding
+different rows, so each response reveals which one served the read.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import datetime, timedelta
+
+import database
+from main import app
+from database import Base, User, Task, UserRole, ReplicaRouter
+from auth import get_password_hash, create_access_token
+from conftest import get_db_overridden
+
+
+def make_engine():
+    return create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+
+
+primary_engine = make_engine()
+replica_engine = make_engine()
+PrimarySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=primary_engine)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+PASSWORD_HASH = get_password_hash("password123")
+
+
+def override_get_db():
+    """Override database dependency for testing."""
+    db = PrimarySessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def seed(session_factory, title):
+    """Create the same customers in a database plus one task with the given title."""
+    db = session_factory()
+    users = [
+        User(
+            id=1,
+            email="customer@test.com",
+            hashed_password=PASSWORD_HASH,
+            full_name="Test Customer",
+            role=UserRole.CUSTOMER
+        ),
+        User(
+            id=2,
+            email="other@test.com",
+            hashed_password=PASSWORD_HASH,
+            full_name="Other Customer",
+            role=UserRole.CUSTOMER
+        )
+    ]
+    db.add_all(users)
+    db.add(Task(
+        id=1,
+        customer_id=1,
+        title=title,
+        description="Description",
+        location="Test City",
+        date=datetime.utcnow() + timedelta(days=1),
+        budget=100.0
+    ))
+    db.commit()
+    db.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Test client with one replica configured and a long stickiness window."""
+    Base.metadata.create_all(bind=primary_engine)
+    Base.metadata.create_all(bind=replica_engine)
+    seed(PrimarySessionLocal, "Primary task")
+    seed(ReplicaSessionLocal, "Replica task")
+    monkeypatch.setattr(database, "read_router", ReplicaRouter([replica_engine], sticky_seconds=60))
+    with get_db_overridden(override_get_db):
+        yield TestClient(app)
+    Base.metadata.drop_all(bind=primary_engine)
+    Base.metadata.drop_all(bind=replica_engine)
+
+
+def headers_for(email):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+def test_reads_are_served_by_replica(client):
+    response = client.get("/tasks/1")
+
+    assert response.status_code == 200
+    assert response.json()["title"] == "Replica task"
+
+
+def test_read_your_writes_after_commit(client):
+    """The writer reads from the primary; other users still hit the replica."""
+    writer = headers_for("customer@test.com")
+    other = headers_for("other@test.com")
+
+    response = client.post("/tasks", headers=writer, json={
+        "title": "New task",
+        "description": "Description",
+        "location": "Test City",
+        "date": (datetime.utcnow() + timedelta(days=2)).isoformat(),
+        "budget": 50.0
+    })
+    assert response.status_code == 200
+    task_id = response.json()["id"]
+
+    assert client.get(f"/tasks/{task_id}", headers=writer).status_code == 200
+    assert client.get(f"/tasks/{task_id}", headers=other).status_code == 404
+    # A renewed access token for the same user keeps the pin
+    renewed = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'}, expires_delta=timedelta(minutes=5))}"}
+    assert renewed != writer
+    assert client.get(f"/tasks/{task_id}", headers=renewed).status_code == 200
+
+
+def test_write_routes_use_primary(client):
+    response = client.put(
+        "/tasks/1",
+        headers=headers_for("customer@test.com"),
+        json={"title": "Updated"}
+    )
+
+    assert response.status_code == 200
+    db = PrimarySessionLocal()
+    assert db.query(Task).filter(Task.id == 1).first().title == "Updated"
+    db.close()
+
+
+def test_router_without_replicas_uses_primary():
+    router = ReplicaRouter([])
+    router.mark_write("token")
+
+    assert router.read_sessionmaker("token") is None
+    assert router.read_sessionmaker(None) is None
+
+
+def test_router_round_robin_and_sticky_expiry():
+    router = ReplicaRouter([make_engine(), make_engine()], sticky_seconds=0)
+
+    first = router.read_sessionmaker(None)
+    second = router.read_sessionmaker(None)
+    assert first is not second
+    assert router.read_sessionmaker(None) is first
+
+    router.mark_write("token")
+    assert router.read_sessionmaker("token") is not None
@@ -0,0 +1,229 @@
+"""
+Tests for message retention and compaction into compressed blocks.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+
+from database import (
+    User, Task, Agreement, Message, MessageBlock,
+    UserRole, TaskStatus, AgreementStatus
+)
+from auth import get_password_hash, create_access_token
+import retention
+from retention import (
+    compact_closed_conversations, load_compacted_messages, encode_block, decode_block
+)
+from conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def threads(client):
+    """
+    A completed task thread with 450 old read messages, one old unread
+    message and 5 recent messages, plus an open task with old messages.
+    """
+    db = TestingSessionLocal()
+    customer = User(
+        email="customer@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Customer",
+        role=UserRole.CUSTOMER
+    )
+    tasker = User(
+        email="tasker@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Tasker",
+        role=UserRole.TASKER
+    )
+    db.add_all([customer, tasker])
+    db.commit()
+
+    def make_task(status):
+        return Task(
+            customer_id=customer.id,
+            title="Task",
+            description="Description",
+            location="Test City",
+            date=datetime.utcnow(),
+            budget=100.0,
+            status=status
+        )
+
+    closed, still_open = make_task(TaskStatus.COMPLETED), make_task(TaskStatus.IN_PROGRESS)
+    db.add_all([closed, still_open])
+    db.commit()
+    db.add(Agreement(task_id=closed.id, tasker_id=tasker.id, amount=90.0, status=AgreementStatus.COMPLETED))
+
+    old = datetime.utcnow() - timedelta(days=60)
+    messages = []
+    for i in range(450):
+        messages.append(Message(
+            sender_id=customer.id, receiver_id=tasker.id, task_id=closed.id,
+            content=f"Old message {i} about the leaky sink", read=True,
+            created_at=old + timedelta(minutes=i)
+        ))
+    messages.append(Message(
+        sender_id=customer.id, receiver_id=tasker.id, task_id=closed.id,
+        content="Old unread", read=False, created_at=old + timedelta(minutes=500)
+    ))
+    for i in range(5):
+        messages.append(Message(
+            sender_id=tasker.id, receiver_id=customer.id, task_id=closed.id,
+            content=f"Recent {i}", read=True
+        ))
+    for i in range(10):
+        messages.append(Message(
+            sender_id=customer.id, receiver_id=tasker.id, task_id=still_open.id,
+            content=f"Open thread {i}", read=True, created_at=old
+        ))
+    db.add_all(messages)
+    db.commit()
+
+    data = {
+        "closed": closed.id,
+        "open": still_open.id,
+        "headers": {"Authorization": f"Bearer {create_access_token(data={'sub': customer.email})}"}
+    }
+    db.close()
+    return data
+
+
+def test_compaction_moves_old_read_messages_into_blocks(threads):
+    db = TestingSessionLocal()
+    moved = compact_closed_conversations(db, older_than_days=30, block_size=200)
+
+    assert moved == 450
+    blocks = db.query(MessageBlock).order_by(MessageBlock.first_message_id).all()
+    assert [b.message_count for b in blocks] == [200, 200, 50]
+    assert all(b.task_id == threads["closed"] for b in blocks)
+    assert blocks[0].last_message_id < blocks[1].first_message_id
+    # Unread and recent messages stay hot; open threads are untouched
+    assert db.query(Message).filter(Message.task_id == threads["closed"]).count() == 6
+    assert db.query(Message).filter(Message.task_id == threads["open"]).count() == 10
+    db.close()
+
+
+def test_compaction_is_idempotent(threads):
+    db = TestingSessionLocal()
+    compact_closed_conversations(db, older_than_days=30)
+
+    assert compact_closed_conversations(db, older_than_days=30) == 0
+    db.close()
+
+
+def test_block_round_trip_and_compression(threads):
+    db = TestingSessionLocal()
+    messages = db.query(Message).filter(Message.task_id == threads["closed"]).order_by(Message.id).all()
+    payload = encode_block(messages)
+    decoded = decode_block(payload)
+
+    assert [m.id for m in decoded] == [m.id for m in messages]
+    assert decoded[0].created_at == messages[0].created_at
+    assert len(payload) < sum(len(m.content) for m in messages)
+    db.close()
+
+
+def test_load_compacted_messages_before_id(threads):
+    db = TestingSessionLocal()
+    compact_closed_conversations(db, older_than_days=30, block_size=200)
+    first_block = db.query(MessageBlock).order_by(MessageBlock.first_message_id).first()
+
+    history = load_compacted_messages(db, threads["closed"], before_id=first_block.last_message_id)
+    assert len(history) == 199
+    assert len(load_compacted_messages(db, threads["closed"])) == 450
+    db.close()
+
+
+def test_task_thread_reads_through_compacted_history(client, threads):
+    before = client.get(f"/tasks/{threads['closed']}/messages", headers=threads["headers"]).json()
+
+    db = TestingSessionLocal()
+    compact_closed_conversations(db, older_than_days=30, block_size=200)
+    db.close()
+
+    after = client.get(f"/tasks/{threads['closed']}/messages", headers=threads["headers"])
+    assert after.status_code == 200
+    assert after.json() == before
+    assert len(before) == 456
+
+
+def test_pages_of_compacted_threads_inflate_only_the_blocks_they_reach(client, threads, monkeypatch):
+    url, headers = f"/tasks/{threads['closed']}/messages", threads["headers"]
+    cases = [dict(before=n) for n in (1, 2, 150, 200, 201, 400, 451, 453)]
+    cases += [dict(after=n) for n in (1, 199, 200, 449, 450, 451, 456)]
+    cases += [dict(around="first_unread"), {}]
+    before = {
+        (tuple(params.items()), limit): client.get(url, headers=headers, params={**params, "limit": limit}).json()
+        for params in cases for limit in (1, 20, 199)
+    }
+
+    db = TestingSessionLocal()
+    compact_closed_conversations(db, older_than_days=30, block_size=200)
+    db.close()
+    inflated = []
+    decode = retention.decode_block
+    monkeypatch.setattr(retention, "decode_block", lambda payload: inflated.append(payload) or decode(payload))
+
+    for (params, limit), expected in before.items():
+        assert client.get(url, headers=headers, params={**dict(params), "limit": limit}).json() == expected
+    inflated.clear()
+    latest = client.get(url, headers=headers, params={"limit": 20}).json()
+    assert [m["content"] for m in latest][-5:] == [f"Recent {i}" for i in range(5)]
+    assert len(inflated) == 1
+
+
+def test_inbox_lists_hot_messages_only(client, threads):
+    tasker = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+    assert client.get("/messages/unread-count", headers=tasker).json() == {"unread_count": 1}
+
+    db = TestingSessionLocal()
+    compact_closed_conversations(db, older_than_days=30, block_size=200)
+    db.close()
+
+    inbox = client.get("/messages", headers=threads["headers"]).json()
+    # Unread, recent and open-task messages; compacted history is read through the thread
+    assert len(inbox) == 16
+    assert not any(m["content"].startswith("Old message") for m in inbox)
+    assert client.get("/messages/unread-count", headers=tasker).json() == {"unread_count": 1}
+
+
+def test_pages_read_through_nested_blocks(client):
+    """Messages unread at the first compaction end up in a block inside an older one."""
+    db = TestingSessionLocal()
+    db.add_all([
+        User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER),
+        User(email="tasker@test.com", hashed_password="x", full_name="Tasker", role=UserRole.TASKER),
+    ])
+    db.flush()
+    db.add(Task(customer_id=1, title="Task", description="x", location="Austin", date=datetime.utcnow(),
+                budget=100.0, status=TaskStatus.COMPLETED))
+    db.flush()
+    db.add(Agreement(task_id=1, tasker_id=2, amount=90.0, status=AgreementStatus.COMPLETED))
+    old = datetime.utcnow() - timedelta(days=60)
+    db.add_all([
+        Message(sender_id=1, receiver_id=2, task_id=1, content=f"m{n}", read=not 41 <= n <= 59,
+                created_at=old + timedelta(minutes=n))
+        for n in range(1, 101)
+    ])
+    db.commit()
+    compact_closed_conversations(db, older_than_days=30)
+    db.query(Message).update({"read": True})
+    db.commit()
+    compact_closed_conversations(db, older_than_days=30)
+    blocks = db.query(MessageBlock).order_by(MessageBlock.id).all()
+    assert [(b.first_message_id, b.last_message_id, b.message_count) for b in blocks] == [(1, 100, 81), (41, 59, 19)]
+    db.close()
+
+    url = "/tasks/1/messages"
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+
+    def ids(**params):
+        return [m["id"] for m in client.get(url, headers=headers, params=params).json()]
+
+    assert ids() == list(range(1, 101))
+    assert ids(limit=10) == list(range(91, 101))
+    assert ids(before=61, limit=5) == [56, 57, 58, 59, 60]
+    assert ids(before=45, limit=5) == [40, 41, 42, 43, 44]
+    assert ids(after=35, limit=10) == list(range(36, 46))
+    assert ids(after=58, limit=3) == [59, 60, 61]
@@ -0,0 +1,268 @@
+"""
+Tests and benchmarks for conditional state transitions on accept_bid,
+accept_offer and complete_agreement.
+
+Concurrency tests call the handlers directly from many threads, each with
+its own session on a shared file-backed SQLite database, so the races are
+real ones between separate connections.
+"""
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
+
+import main
+from main import app
+from database import (
+    Base, User, Task, Bid, Offer, Agreement,
+    UserRole, TaskStatus, AgreementStatus
+)
+from auth import get_password_hash, create_access_token
+from conftest import get_db_overridden
+
+BIDDERS = 8
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'transitions.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def market(session_factory):
+    """A customer and BIDDERS taskers; tasks are added per test."""
+    db = session_factory()
+    password = get_password_hash("password123")
+    customer = User(email="customer@test.com", hashed_password=password,
+                    full_name="Customer", role=UserRole.CUSTOMER)
+    taskers = [
+        User(email=f"tasker{i}@test.com", hashed_password=password,
+             full_name=f"Tasker {i}", role=UserRole.TASKER)
+        for i in range(BIDDERS)
+    ]
+    db.add(customer)
+    db.add_all(taskers)
+    db.commit()
+    ids = {"customer": customer.id, "taskers": [t.id for t in taskers]}
+    db.close()
+    return ids
+
+
+def add_tasks_with_bids(session_factory, market, count):
+    """Create open tasks, each with one bid from every tasker; returns bid ids per task."""
+    db = session_factory()
+    bids_by_task = {}
+    for n in range(count):
+        task = Task(
+            customer_id=market["customer"], title=f"Task {n}", description="Description",
+            location="Test City", date=datetime.utcnow() + timedelta(days=1), budget=100.0
+        )
+        db.add(task)
+        db.flush()
+        bids = [Bid(task_id=task.id, tasker_id=t, amount=50.0 + i) for i, t in enumerate(market["taskers"])]
+        db.add_all(bids)
+        db.flush()
+        bids_by_task[task.id] = [b.id for b in bids]
+    db.commit()
+    db.close()
+    return bids_by_task
+
+
+def call(session_factory, handler, *args, user_id):
+    """Run a handler with its own session; returns the status code it produced."""
+    db = session_factory()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        handler(*args, current_user=user, db=db)
+        return 200
+    except HTTPException as exc:
+        return exc.status_code
+    finally:
+        db.close()
+
+
+def agreements_per_task(session_factory):
+    db = session_factory()
+    counts = {}
+    for agreement in db.query(Agreement).all():
+        counts[agreement.task_id] = counts.get(agreement.task_id, 0) + 1
+    db.close()
+    return counts
+
+
+def test_concurrent_bid_accepts_have_one_winner(session_factory, market):
+    bids_by_task = add_tasks_with_bids(session_factory, market, 1)
+    (task_id, bid_ids), = bids_by_task.items()
+
+    with ThreadPoolExecutor(max_workers=BIDDERS) as pool:
+        statuses = list(pool.map(
+            lambda bid_id: call(session_factory, main.accept_bid, bid_id, user_id=market["customer"]),
+            bid_ids
+        ))
+
+    assert sorted(statuses) == [200] + [409] * (BIDDERS - 1)
+    assert agreements_per_task(session_factory) == {task_id: 1}
+    db = session_factory()
+    assert db.query(Task).filter(Task.id == task_id).first().status == TaskStatus.IN_PROGRESS
+    db.close()
+
+
+def test_concurrent_offer_accepts_on_same_task(session_factory, market):
+    db = session_factory()
+    task = Task(customer_id=market["customer"], title="Task", description="Description",
+                location="Test City", date=datetime.utcnow(), budget=100.0)
+    db.add(task)
+    db.flush()
+    offers = [Offer(task_id=task.id, customer_id=market["customer"], tasker_id=t, amount=80.0)
+              for t in market["taskers"]]
+    db.add_all(offers)
+    db.commit()
+    pairs = [(o.id, o.tasker_id) for o in offers]
+    task_id = task.id
+    db.close()
+
+    with ThreadPoolExecutor(max_workers=BIDDERS) as pool:
+        statuses = list(pool.map(
+            lambda pair: call(session_factory, main.accept_offer, pair[0], user_id=pair[1]),
+            pairs
+        ))
+
+    assert sorted(statuses) == [200] + [409] * (BIDDERS - 1)
+    assert agreements_per_task(session_factory) == {task_id: 1}
+    db = session_factory()
+    assert db.query(Offer).filter(Offer.accepted == True).count() == 1
+    db.close()
+
+
+def test_complete_agreement_only_once(session_factory, market):
+    bids_by_task = add_tasks_with_bids(session_factory, market, 1)
+    (task_id, bid_ids), = bids_by_task.items()
+    assert call(session_factory, main.accept_bid, bid_ids[0], user_id=market["customer"]) == 200
+    db = session_factory()
+    agreement_id = db.query(Agreement.id).filter(Agreement.task_id == task_id).scalar()
+    db.close()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        statuses = list(pool.map(
+            lambda _: call(session_factory, main.complete_agreement, agreement_id, user_id=market["customer"]),
+            range(4)
+        ))
+
+    assert sorted(statuses) == [200, 409, 409, 409]
+    db = session_factory()
+    agreement = db.query(Agreement).filter(Agreement.id == agreement_id).first()
+    task = db.query(Task).filter(Task.id == task_id).first()
+    assert agreement.status == AgreementStatus.COMPLETED
+    assert agreement.completed_at is not None
+    assert task.status == TaskStatus.COMPLETED
+    db.close()
+
+
+def test_agreement_task_id_is_unique(session_factory, market):
+    bids_by_task = add_tasks_with_bids(session_factory, market, 1)
+    task_id = next(iter(bids_by_task))
+    db = session_factory()
+    db.add_all([
+        Agreement(task_id=task_id, tasker_id=market["taskers"][0], amount=1.0),
+        Agreement(task_id=task_id, tasker_id=market["taskers"][1], amount=1.0)
+    ])
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.close()
+
+
+def test_accept_bid_endpoint_responses(session_factory, market):
+    bids_by_task = add_tasks_with_bids(session_factory, market, 1)
+    bid_ids = next(iter(bids_by_task.values()))
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    with get_db_overridden(override_get_db):
+        client = TestClient(app)
+        customer = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+        tasker = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker0@test.com'})}"}
+
+        assert client.post("/bids/9999/accept", headers=customer).status_code == 404
+        assert client.post(f"/bids/{bid_ids[0]}/accept", headers=tasker).status_code == 403
+        first = client.post(f"/bids/{bid_ids[0]}/accept", headers=customer)
+        second = client.post(f"/bids/{bid_ids[1]}/accept", headers=customer)
+
+    assert first.status_code == 200
+    assert first.json()["tasker_id"] == market["taskers"][0]
+    assert first.json()["status"] == "accepted"
+    assert second.status_code == 409
+    assert second.json()["detail"] == "Task is no longer open"
+
+
+def legacy_accept_bid(session_factory, bid_id, customer_id):
+    """The previous read-modify-write flow, kept here as a benchmark baseline."""
+    db = session_factory()
+    try:
+        bid = db.query(Bid).filter(Bid.id == bid_id).first()
+        task = db.query(Task).filter(Task.id == bid.task_id).first()
+        if task.customer_id != customer_id:
+            return 403
+        db.add(Agreement(task_id=bid.task_id, tasker_id=bid.tasker_id, amount=bid.amount))
+        task.status = TaskStatus.IN_PROGRESS
+        db.commit()
+        return 200
+    except IntegrityError:
+        db.rollback()
+        return 409
+    finally:
+        db.close()
+
+
+def benchmark_contention(benchmark, session_factory, market, accept):
+    """
+    Accept every tasker's bid on each of 10 fresh tasks concurrently.
+    Task setup runs outside the timed section.
+    """
+    rounds = []
+
+    def setup():
+        bids_by_task = add_tasks_with_bids(session_factory, market, 10)
+        rounds.append(bids_by_task)
+        return ([bid_id for ids in bids_by_task.values() for bid_id in ids],), {}
+
+    def run(bid_ids):
+        with ThreadPoolExecutor(max_workers=BIDDERS) as pool:
+            return list(pool.map(accept, bid_ids))
+
+    statuses = benchmark.pedantic(run, setup=setup, rounds=3)
+    counts = agreements_per_task(session_factory)
+    assert all(counts.get(task_id) == 1 for bids_by_task in rounds for task_id in bids_by_task)
+    return statuses
+
+
+@pytest.mark.benchmark(group="accept-contention")
+def test_benchmark_legacy_accept(session_factory, market, benchmark):
+    benchmark_contention(
+        benchmark, session_factory, market,
+        lambda bid_id: legacy_accept_bid(session_factory, bid_id, market["customer"])
+    )
+
+
+@pytest.mark.benchmark(group="accept-contention")
+def test_benchmark_conditional_accept(session_factory, market, benchmark):
+    statuses = benchmark_contention(
+        benchmark, session_factory, market,
+        lambda bid_id: call(session_factory, main.accept_bid, bid_id, user_id=market["customer"])
+    )
+    assert statuses.count(200) == 10
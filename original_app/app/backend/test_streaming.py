@@ -0,0 +1,115 @@
+"""
+Tests for NDJSON streaming on the bulk list endpoints.
+
+Verifies content negotiation on /tasks and /tasks/{id}/bids, that streamed
+rows match the regular JSON responses, and that rows are emitted in chunks.
+"""
+
+import json
+import pytest
+from datetime import datetime, timedelta
+
+from database import User, Task, Bid, UserRole, TaskStatus
+from auth import get_password_hash, create_access_token
+from streaming import NDJSON_MEDIA_TYPE, iter_ndjson
+import schemas
+from conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def seeded(client):
+    """Create a customer, a tasker, 25 tasks and bids on the first task."""
+    db = TestingSessionLocal()
+    customer = User(
+        email="customer@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Customer",
+        role=UserRole.CUSTOMER
+    )
+    tasker = User(
+        email="tasker@test.com",
+        hashed_password=get_password_hash("password123"),
+        full_name="Test Tasker",
+        role=UserRole.TASKER
+    )
+    db.add_all([customer, tasker])
+    db.commit()
+
+    tasks = [
+        Task(
+            customer_id=customer.id,
+            title=f"Task {i}",
+            description="Description",
+            location="Test City",
+            date=datetime.utcnow() + timedelta(days=1),
+            budget=100.0 + i,
+            status=TaskStatus.OPEN if i % 2 == 0 else TaskStatus.COMPLETED
+        )
+        for i in range(25)
+    ]
+    db.add_all(tasks)
+    db.commit()
+
+    db.add(Bid(task_id=tasks[0].id, tasker_id=tasker.id, amount=90.0))
+    db.commit()
+
+    data = {
+        "task_id": tasks[0].id,
+        "headers": {"Authorization": f"Bearer {create_access_token(data={'sub': customer.email})}"}
+    }
+    db.close()
+    return data
+
+
+def parse_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_list_tasks_ndjson_matches_json(client, seeded):
+    """Streamed tasks contain the same rows as the JSON response."""
+    headers = dict(seeded["headers"], Accept=NDJSON_MEDIA_TYPE)
+    streamed = client.get("/tasks", headers=headers)
+    regular = client.get("/tasks", headers=seeded["headers"])
+
+    assert streamed.status_code == 200
+    assert streamed.headers["content-type"].startswith(NDJSON_MEDIA_TYPE)
+    rows = parse_ndjson(streamed)
+    assert len(rows) == 25
+    assert [r["id"] for r in rows] == sorted(r["id"] for r in rows)
+    assert sorted(rows, key=lambda r: r["id"]) == sorted(regular.json(), key=lambda r: r["id"])
+
+
+def test_list_tasks_ndjson_respects_status_filter(client, seeded):
+    headers = dict(seeded["headers"], Accept=NDJSON_MEDIA_TYPE)
+    response = client.get("/tasks", params={"status": "open"}, headers=headers)
+
+    rows = parse_ndjson(response)
+    assert len(rows) == 13
+    assert all(r["status"] == "open" for r in rows)
+
+
+def test_list_tasks_default_is_json_array(client, seeded):
+    response = client.get("/tasks", headers=seeded["headers"])
+
+    assert response.headers["content-type"].startswith("application/json")
+    assert isinstance(response.json(), list)
+
+
+def test_task_bids_ndjson(client, seeded):
+    response = client.get(
+        f"/tasks/{seeded['task_id']}/bids",
+        headers={"Accept": NDJSON_MEDIA_TYPE}
+    )
+
+    rows = parse_ndjson(response)
+    assert len(rows) == 1
+    assert rows[0]["amount"] == 90.0
+
+
+def test_iter_ndjson_emits_bounded_chunks(client, seeded):
+    """Each chunk holds at most batch_size rows."""
+    db = TestingSessionLocal()
+    chunks = list(iter_ndjson(db.query(Task).order_by(Task.id), schemas.TaskResponse, batch_size=10))
+    db.close()
+
+    assert [chunk.count(b"\n") for chunk in chunks] == [10, 10, 5]
@@ -0,0 +1,120 @@
+"""
+Tests for GET /tasks filters and sort orders, including a query plan check
+that every supported combination is served by an index.
+"""
+
+import itertools
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from database import User, Task, TaskStatus, UserRole
+from auth import create_access_token
+from conftest import engine, TestingSessionLocal
+
+
+HEADERS = {"Authorization": f"Bearer {create_access_token(data={'sub': 'alice@test.com'})}"}
+NOW = datetime(2030, 6, 1, 12, 0)
+
+# title, customer, location, days from NOW, budget, status
+TASKS = [
+    ("Fix sink", 1, "Austin, TX", 3, 80.0, TaskStatus.OPEN),
+    ("Paint fence", 1, "austin", 1, 250.0, TaskStatus.OPEN),
+    ("Move couch", 2, "Boston, MA", 2, 120.0, TaskStatus.OPEN),
+    ("Mow lawn", 2, "Aus_tin", 5, 40.0, TaskStatus.COMPLETED),
+]
+
+
+@pytest.fixture
+def client(client):
+    db = TestingSessionLocal()
+    for name in ("alice", "bob"):
+        db.add(User(email=f"{name}@test.com", hashed_password="x", full_name=name, role=UserRole.CUSTOMER))
+    db.flush()
+    for n, (title, customer_id, location, days, budget, status) in enumerate(TASKS):
+        db.add(Task(customer_id=customer_id, title=title, description="Details", location=location,
+                    date=NOW + timedelta(days=days), budget=budget, status=status,
+                    created_at=NOW + timedelta(minutes=n)))
+    db.commit()
+    db.close()
+    return client
+
+
+def titles(client, **params):
+    response = client.get("/tasks", headers=HEADERS, params=params)
+    assert response.status_code == 200
+    return [task["title"] for task in response.json()]
+
+
+def test_budget_and_date_ranges(client):
+    assert titles(client, min_budget=80, max_budget=200) == ["Fix sink", "Move couch"]
+    assert titles(client, date_from=(NOW + timedelta(days=2)).isoformat(),
+                  date_to=(NOW + timedelta(days=3)).isoformat()) == ["Fix sink", "Move couch"]
+
+
+def test_location_is_a_case_insensitive_prefix(client):
+    assert titles(client, location="AUSTIN") == ["Fix sink", "Paint fence"]
+    # LIKE wildcards in the input match literally
+    assert titles(client, location="Aus_") == ["Mow lawn"]
+    assert client.get("/tasks", headers=HEADERS, params={"location": ""}).status_code == 422
+
+
+def test_customer_and_status(client):
+    assert titles(client, customer_id=2) == ["Move couch", "Mow lawn"]
+    assert titles(client, customer_id=2, status="open") == ["Move couch"]
+
+
+def test_sort_orders(client):
+    assert titles(client, sort="-created_at") == ["Mow lawn", "Move couch", "Paint fence", "Fix sink"]
+    assert titles(client, sort="date", status="open") == ["Paint fence", "Move couch", "Fix sink"]
+    assert titles(client, sort="-budget", location="aus") == ["Paint fence", "Fix sink", "Mow lawn"]
+
+
+FILTERS = {
+    "status": {"status": "open"},
+    "budget": {"min_budget": 50, "max_budget": 150},
+    "date": {"date_from": NOW.isoformat(), "date_to": (NOW + timedelta(days=7)).isoformat()},
+    "location": {"location": "Aus"},
+    "customer": {"customer_id": 1},
+}
+SORTS = [None, "-created_at", "created_at", "date", "-date", "budget", "-budget"]
+
+
+def combinations():
+    for size in range(len(FILTERS) + 1):
+        for names in itertools.combinations(FILTERS, size):
+            for sort in SORTS:
+                if names or sort:
+                    yield names, sort
+
+
+def test_no_filter_or_sort_scans_the_tasks_table(client):
+    """
+    Filtered lists must SEARCH tasks through an index; sorted-only lists read
+    every row anyway, but must do so in index order instead of sorting.
+    An unfiltered, unsorted list is a plain scan by definition and is not checked.
+    """
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM tasks" in statement:
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        failures = []
+        for names, sort in combinations():
+            params = {key: value for name in names for key, value in FILTERS[name].items()}
+            if sort:
+                params["sort"] = sort
+            captured.clear()
+            assert client.get("/tasks", headers=HEADERS, params=params).status_code == 200
+            [(statement, parameters)] = captured
+            with engine.connect() as connection:
+                plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            if "SCAN tasks" in plan or (not names and any("TEMP B-TREE" in step for step in plan)):
+                failures.append((params, plan))
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert failures == []
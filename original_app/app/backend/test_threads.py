@@ -0,0 +1,143 @@
+"""
+Tests for paged task message threads (threads.py) on GET /tasks/{task_id}/messages.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import threads
+from database import User, Task, Agreement, Message, TaskStatus, UserRole
+from auth import create_access_token
+from conftest import engine, TestingSessionLocal
+
+
+CUSTOMER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'customer@test.com'})}"}
+TASKER = {"Authorization": f"Bearer {create_access_token(data={'sub': 'tasker@test.com'})}"}
+START = datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def client(client):
+    """A task with an accepted agreement and a ten message thread; the customer has read the first six."""
+    db = TestingSessionLocal()
+    db.add(User(email="customer@test.com", hashed_password="x", full_name="Customer", role=UserRole.CUSTOMER))
+    db.add(User(email="tasker@test.com", hashed_password="x", full_name="Tasker", role=UserRole.TASKER))
+    db.flush()
+    db.add(Task(customer_id=1, title="Fix sink", description="x", location="Austin", date=START, budget=100.0,
+                status=TaskStatus.IN_PROGRESS))
+    db.flush()
+    db.add(Agreement(task_id=1, tasker_id=2, amount=90.0))
+    for n in range(10):
+        sender, receiver = (2, 1) if n % 2 else (1, 2)
+        # Messages 4 and 5 share a timestamp; ties go by id
+        db.add(Message(sender_id=sender, receiver_id=receiver, task_id=1, content=f"m{n}",
+                       read=n < 6, created_at=START + timedelta(minutes=4 if n == 5 else n)))
+    db.commit()
+    db.close()
+    return client
+
+
+def contents(client, headers=CUSTOMER, **params):
+    response = client.get("/tasks/1/messages", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return [message["content"] for message in response.json()]
+
+
+def test_unpaged_thread_is_whole(client):
+    assert contents(client) == [f"m{n}" for n in range(10)]
+
+
+def test_before_after_and_limit(client):
+    assert contents(client, limit=3) == ["m7", "m8", "m9"]
+    assert contents(client, before=8, limit=3) == ["m4", "m5", "m6"]
+    assert contents(client, before=2, limit=3) == ["m0"]
+    assert contents(client, after=5, limit=3) == ["m5", "m6", "m7"]
+    assert contents(client, after=10) == []
+    # Ids from another thread, or no message at all, are not anchors
+    assert contents(client, after=999) == []
+
+
+def test_sending_then_fetching_the_delta(client):
+    newest = client.get("/tasks/1/messages", headers=TASKER, params={"limit": 1}).json()[-1]["id"]
+
+    sent = client.post("/tasks/1/messages", headers=TASKER, json={"content": "On my way"})
+
+    assert sent.status_code == 200
+    assert contents(client, headers=TASKER, after=newest) == ["On my way"]
+
+
+def test_around_first_unread(client):
+    # The customer's first unread message is m7 (m6 was sent by the customer)
+    assert contents(client, around="first_unread", limit=4) == ["m5", "m6", "m7", "m8"]
+    assert contents(client, around="first_unread", limit=20) == [f"m{n}" for n in range(10)]
+    # The tasker has read everything sent to them, so gets the latest page
+    db = TestingSessionLocal()
+    db.query(Message).filter(Message.receiver_id == 2).update({"read": True})
+    db.commit()
+    db.close()
+    assert contents(client, headers=TASKER, around="first_unread", limit=2) == ["m8", "m9"]
+
+
+def test_invalid_paging(client):
+    assert client.get("/tasks/1/messages", headers=CUSTOMER, params={"before": 5, "after": 2}).status_code == 400
+    assert client.get("/tasks/1/messages", headers=CUSTOMER, params={"around": "latest"}).status_code == 422
+    assert client.get("/tasks/1/messages", headers=CUSTOMER, params={"limit": 0}).status_code == 422
+
+
+def test_closed_threads_page_the_same_way(client):
+    db = TestingSessionLocal()
+    live = {}
+    cases = [dict(before=n) for n in range(1, 12)] + [dict(after=n) for n in range(1, 12)] + [dict(around="first_unread")]
+    for params in cases:
+        for limit in (1, 3, 4):
+            live[(tuple(params.items()), limit)] = [
+                message.id for message in threads.page_thread(db, 1, 1, limit=limit, **params)
+            ]
+    loaded = db.query(Message).filter(Message.task_id == 1).order_by(Message.created_at, Message.id).all()
+    db.close()
+
+    for (params, limit), expected in live.items():
+        assert [message.id for message in threads.page_loaded(loaded, 1, limit=limit, **dict(params))] == expected
+
+    db = TestingSessionLocal()
+    db.query(Task).update({"status": TaskStatus.COMPLETED})
+    db.commit()
+    db.close()
+    assert contents(client, before=8, limit=3) == ["m4", "m5", "m6"]
+    assert contents(client, around="first_unread", limit=4) == ["m5", "m6", "m7", "m8"]
+
+
+def test_one_query_for_access_and_one_per_page(client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        client.get("/tasks/1/messages", headers=CUSTOMER, params={"after": 3, "limit": 5})
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    reads = [(statement, parameters) for statement, parameters in statements
+             if "FROM tasks" in statement or "FROM messages" in statement]
+    # The task with its agreement, then the page
+    assert len(reads) == 2
+    page, parameters = reads[-1]
+    with engine.connect() as connection:
+        plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {page}", parameters)]
+    assert any("ix_messages_task_created" in step for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_access_checks(client):
+    db = TestingSessionLocal()
+    db.add(User(email="other@test.com", hashed_password="x", full_name="Other", role=UserRole.TASKER))
+    db.commit()
+    db.close()
+    other = {"Authorization": f"Bearer {create_access_token(data={'sub': 'other@test.com'})}"}
+
+    assert client.get("/tasks/1/messages", headers=other, params={"limit": 2}).status_code == 403
+    assert client.post("/tasks/1/messages", headers=other, json={"content": "Hi"}).status_code == 403
+    assert client.get("/tasks/2/messages", headers=CUSTOMER, params={"limit": 2}).status_code == 404
@@ -0,0 +1,99 @@
+"""
+Tests and benchmarks for worker cold start: import cost, deferred schema
+creation, warm-up and the readiness probe.
+
+Cold-start measurements need a fresh interpreter, so they run a probe script
+in a subprocess whose working directory (and so its SQLite file) is a
+temporary directory.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+from main import app
+from auth import create_access_token
+
+BACKEND = Path(__file__).resolve().parent
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+lazy_modules = [name for name in ("jose", "passlib", "cryptography") if name in sys.modules]
+schema_at_import = os.path.exists("tasker.db")
+
+import sqlite3
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    probe = client.get("/health/ready").status_code
+    # Plain sqlite3 and a token minted by the parent, so nothing here warms
+    # the ORM or the crypto modules on the worker's behalf
+    with sqlite3.connect("tasker.db") as connection:
+        connection.execute(
+            "INSERT INTO users (email, hashed_password, full_name, role, created_at) VALUES (?, ?, ?, ?, ?)",
+            ("probe@test.com", "x", "Probe", "CUSTOMER", "2024-01-01 00:00:00.000000")
+        )
+    before_request = time.perf_counter()
+    status = client.get("/users/me", headers={"Authorization": "Bearer " + os.environ["PROBE_TOKEN"]}).status_code
+    done = time.perf_counter()
+
+print(json.dumps({
+    "import_s": imported - start,
+    "startup_s": ready - imported,
+    "first_request_s": done - before_request,
+    "to_first_request_s": (imported - start) + (ready - imported) + (done - before_request),
+    "lazy_modules": lazy_modules,
+    "schema_at_import": schema_at_import,
+    "ready_status": probe,
+    "first_status": status,
+}))
+"""
+
+
+def run_probe(workdir):
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(BACKEND),
+        TASKER_FEED_INTERVAL_SECONDS="0",
+        PROBE_TOKEN=create_access_token(data={"sub": "probe@test.com"})
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=workdir, env=env,
+        capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_defers_crypto_and_schema(tmp_path):
+    timings = run_probe(tmp_path)
+
+    assert timings["lazy_modules"] == []
+    assert timings["schema_at_import"] is False
+    assert (tmp_path / "tasker.db").exists()
+
+
+def test_ready_only_after_startup(tmp_path):
+    # Startup has not run in this process
+    assert TestClient(app).get("/health/ready").status_code == 503
+
+    timings = run_probe(tmp_path)
+
+    assert timings["ready_status"] == 200
+    assert timings["first_status"] == 200
+
+
+@pytest.mark.benchmark(group="cold-start")
+def test_benchmark_cold_start(tmp_path_factory, benchmark):
+    """Import time and time to the first successful authenticated request."""
+    timings = benchmark.pedantic(lambda: run_probe(tmp_path_factory.mktemp("cold")), rounds=3)
+
+    benchmark.extra_info.update({key: value for key, value in timings.items() if key.endswith("_s")})
+    assert timings["first_status"] == 200
@@ -0,0 +1,162 @@
+"""
+Paged reads of task message threads.
+
+GET /tasks/{task_id}/messages used to return a whole thread, and clients
+re-fetched it after every message they sent. Threads are now read a page
+at a time, in (created_at, id) order, oldest first within each page:
+
+    before=<message id>     the ``limit`` messages just before that message
+    after=<message id>      the ``limit`` messages just after it, e.g. the
+                            delta since the newest message a client has
+    around=first_unread     a page around the caller's first unread message
+                            in the thread, half of it (at most) older
+                            messages for context; the latest page if
+                            everything has been read
+    limit only              the latest ``limit`` messages
+
+Live threads are paged in SQL on ix_messages_task_created, with the anchor
+message's sort key looked up in the same statement. Threads of completed or
+archived tasks may be spread over the archive tables and compressed blocks
+(see archive.py and retention.py); they no longer change, so their
+uncompacted messages are loaded whole and paged in memory with the same
+rules, together with only the compressed blocks the page reaches
+(compacted_ranges).
+
+thread_parties fetches everything the access checks need, the task's
+customer and status and its agreement, in one query.
+
+Configuration:
+    TASKER_THREAD_PAGE_SIZE=50    messages per page when no limit is given
+"""
+
+import os
+from typing import List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, aliased
+
+from database import Agreement, Message, Task
+
+THREAD_PAGE_SIZE = int(os.getenv("TASKER_THREAD_PAGE_SIZE", "50"))
+THREAD_MAX_PAGE_SIZE = 200
+
+FIRST_UNREAD = "first_unread"
+
+
+def thread_parties(db: Session, task_id: int):
+    """
+    The task's customer_id and status with its agreement's tasker_id and
+    agreement_status (None without an agreement), or None if there is no
+    such task in the hot tables.
+    """
+    return db.query(
+        Task.customer_id,
+        Task.status,
+        Agreement.tasker_id,
+        Agreement.status.label("agreement_status")
+    ).outerjoin(Agreement, Agreement.task_id == Task.id).filter(Task.id == task_id).first()
+
+
+def check_paging(before: Optional[int], after: Optional[int], around: Optional[str]):
+    """
+    Raises:
+        HTTPException(400) if more than one of before, after and around is given
+    """
+    if sum(value is not None for value in (before, after, around)) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of before, after and around")
+
+
+def page_thread(
+    db: Session,
+    task_id: int,
+    user_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    around: Optional[str] = None,
+    limit: int = THREAD_PAGE_SIZE
+) -> List[Message]:
+    """One page of a live thread from the messages table; an unknown anchor id gives an empty page."""
+    thread = db.query(Message).filter(Message.task_id == task_id)
+    key = tuple_(Message.created_at, Message.id)
+    anchor = aliased(Message)
+
+    def anchor_key(*criteria):
+        return db.query(anchor.created_at, anchor.id).filter(anchor.task_id == task_id, *criteria)
+
+    def older(than, count):
+        rows = thread.filter(key < than).order_by(Message.created_at.desc(), Message.id.desc()).limit(count).all()
+        return rows[::-1]
+
+    def newer(than, count, inclusive=False):
+        condition = key >= than if inclusive else key > than
+        return thread.filter(condition).order_by(Message.created_at, Message.id).limit(count).all()
+
+    if before is not None:
+        return older(anchor_key(anchor.id == before).scalar_subquery(), limit)
+    if after is not None:
+        return newer(anchor_key(anchor.id == after).scalar_subquery(), limit)
+    if around == FIRST_UNREAD:
+        first_unread = anchor_key(anchor.receiver_id == user_id, anchor.read == False).order_by(
+            anchor.created_at, anchor.id
+        ).limit(1).scalar_subquery()
+        context = older(first_unread, limit // 2)
+        unread = newer(first_unread, limit - len(context), inclusive=True)
+        if unread:
+            return context + unread
+    return thread.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()[::-1]
+
+
+def page_loaded(
+    messages: Sequence,
+    user_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    around: Optional[str] = None,
+    limit: int = THREAD_PAGE_SIZE
+) -> list:
+    """page_thread's rules applied to a whole thread already loaded in (created_at, id) order."""
+    def position(message_id):
+        return next((index for index, message in enumerate(messages) if message.id == message_id), None)
+
+    if before is not None:
+        index = position(before)
+        return [] if index is None else list(messages[max(0, index - limit):index])
+    if after is not None:
+        index = position(after)
+        return [] if index is None else list(messages[index + 1:index + 1 + limit])
+    if around == FIRST_UNREAD:
+        index = next((index for index, message in enumerate(messages)
+                      if message.receiver_id == user_id and not message.read), None)
+        if index is not None:
+            start = max(0, index - limit // 2)
+            return list(messages[start:start + limit])
+    return list(messages[-limit:])
+
+
+def compacted_ranges(
+    loaded: Sequence,
+    user_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    around: Optional[str] = None,
+    limit: int = THREAD_PAGE_SIZE
+) -> List[dict]:
+    """
+    retention.load_compacted_messages arguments covering every compacted
+    message a page_loaded page can include, given the thread's uncompacted
+    messages in (created_at, id) order. Message ids follow creation order,
+    so a page only reaches into the blocks nearest its anchor, which is
+    itself included.
+    """
+    if before is not None:
+        return [dict(before_id=before + 1, limit=limit + 1)]
+    if after is not None:
+        return [dict(after_id=after - 1, limit=limit + 1)]
+    if around == FIRST_UNREAD:
+        # Unread messages are never compacted
+        first_unread = next((message for message in loaded
+                             if message.receiver_id == user_id and not message.read), None)
+        if first_unread is not None:
+            return [dict(before_id=first_unread.id, limit=limit // 2), dict(after_id=first_unread.id, limit=limit)]
+    return [dict(limit=limit)]
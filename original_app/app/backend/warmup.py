@@ -0,0 +1,57 @@
+"""
+Worker warm-up and readiness.
+
+An autoscaled worker should only take traffic once its first request will
+be as fast as any other. warm_up() front-loads the one-off costs that would
+otherwise land on that request:
+
+- SQLAlchemy mapper configuration, which otherwise runs on first ORM use
+- compilation of the hottest statements into the SQL compilation cache
+- the crypto imports auth.py defers (python-jose, cryptography, passlib)
+  and passlib's bcrypt backend selection
+
+GET /health/ready answers 503 until startup, including warm_up, is done,
+so load balancers and orchestrators can hold traffic until then.
+"""
+
+import logging
+import time
+from typing import Callable
+
+from sqlalchemy.orm import Session, configure_mappers
+
+import auth
+from database import Bid, Message, Task, TaskStatus, User
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_statements(db: Session):
+    # Parameter values don't matter: the cache is keyed on statement shape
+    db.query(User).filter(User.email == "").first()
+    db.query(User).filter(User.id == 0).first()
+    db.query(Task).filter(Task.id == 0).first()
+    db.query(Task).filter(Task.status == TaskStatus.OPEN).limit(1).all()
+    db.query(Bid).filter(Bid.task_id == 0).all()
+    db.query(Message).filter(Message.task_id == 0).limit(1).all()
+
+
+def _warm_crypto():
+    from jose import jwt
+    jwt.decode(auth.create_access_token(data={"sub": "warm-up"}), auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    auth.get_pwd_context().handler("bcrypt").get_backend()
+
+
+def warm_up(session_factory: Callable[[], Session]) -> float:
+    """Run the warm-up steps; returns the seconds taken."""
+    start = time.perf_counter()
+    configure_mappers()
+    db = session_factory()
+    try:
+        _warm_statements(db)
+    finally:
+        db.close()
+    _warm_crypto()
+    elapsed = time.perf_counter() - start
+    logger.info("Worker warm-up took %.3fs", elapsed)
+    return elapsed
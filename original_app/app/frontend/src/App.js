@@ -9,7 +9,7 @@ import TaskDetail from './components/TaskDetail';
 import Messages from './components/Messages';
 import Navbar from './components/Navbar';
 import Profile from './components/Profile';
-import { getCurrentUser } from './api';
+import { getCurrentUser, revokeRefreshToken } from './api';
 
 function App() {
   const [user, setUser] = useState(null);
@@ -27,6 +27,7 @@ function App() {
         setUser(response.data);
       } catch (error) {
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
       }
     }
     setLoading(false);
@@ -37,7 +38,9 @@ function App() {
   };
 
   const handleLogout = () => {
+    revokeRefreshToken().catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     setUser(null);
   };
 
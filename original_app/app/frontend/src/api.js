@@ -15,6 +15,66 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// On a 401, trade the refresh token for a new access token once and retry.
+// Concurrent failures share one refresh, since each refresh token works once.
+let refreshing = null;
+
+const refreshSession = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshing = axios.post(`${API_URL}/token/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refreshToken', response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .catch((error) => {
+        localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
+        throw error;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const { config, response } = error;
+    if (
+      response?.status !== 401 ||
+      config._retried ||
+      config.url.startsWith('/token') ||
+      !localStorage.getItem('refreshToken')
+    ) {
+      throw error;
+    }
+    config._retried = true;
+    const token = await refreshSession();
+    config.headers.Authorization = `Bearer ${token}`;
+    return api(config);
+  }
+);
+
+// Runs several requests in one round trip. Takes [{ method, path, body }]
+// and resolves to axios-style { status, data, headers } results in the same
+// order, rejecting like axios if any of them failed.
+export const batch = async (requests) => {
+  const response = await api.post('/batch', { requests });
+  return response.data.map((result) => {
+    const settled = { status: result.status, data: result.body, headers: result.headers };
+    if (result.status >= 400) {
+      const error = new Error(`Request failed with status code ${result.status}`);
+      error.response = settled;
+      throw error;
+    }
+    return settled;
+  });
+};
+
 // Auth
 export const register = (userData) => api.post('/register', userData);
 
@@ -25,26 +85,50 @@ export const login = async (email, password) => {
   return api.post('/token', formData);
 };
 
+// Log out everywhere this session's refresh token has been rotated to
+export const revokeRefreshToken = () => {
+  const refreshToken = localStorage.getItem('refreshToken');
+  return refreshToken ? api.post('/token/revoke', { refresh_token: refreshToken }) : Promise.resolve();
+};
+
 export const getCurrentUser = () => api.get('/users/me');
 
 export const getUser = (userId) => api.get(`/users/${userId}`);
 
+// Several users in one request, in the order given; ids with no user are
+// listed in the X-Missing-Ids header
+export const getUsers = (userIds) => api.get('/users', { params: { ids: userIds.join(',') } });
+
 // Tasks
 export const createTask = (taskData) => api.post('/tasks', taskData);
 
-export const getTasks = (status) => {
+// filters: min_budget, max_budget, date_from, date_to, location, customer_id,
+// sort (e.g. '-created_at', 'date', '-budget'); empty values are left out
+export const getTasks = (status, filters = {}) => {
   const params = status ? { status } : {};
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value !== '' && value !== null && value !== undefined) params[key] = value;
+  });
   return api.get('/tasks', { params });
 };
 
 export const getTask = (taskId) => api.get(`/tasks/${taskId}`);
 
+export const getTasksByIds = (taskIds) => api.get('/tasks', { params: { ids: taskIds.join(',') } });
+
 export const updateTask = (taskId, taskData) => api.put(`/tasks/${taskId}`, taskData);
 
 export const getMyTasks = () => api.get('/tasks/user/my-tasks');
 
 export const getUserTasks = () => api.get('/tasks/my-tasks');
 
+// Open tasks ranked for the current tasker; the next page cursor comes back
+// in the X-Next-Cursor header
+export const getFeed = (cursor) => {
+  const params = cursor ? { cursor } : {};
+  return api.get('/feed', { params });
+};
+
 // Bids
 export const createBid = (bidData) => api.post('/bids', bidData);
 
@@ -72,7 +156,9 @@ export const getMessages = () => api.get('/messages');
 export const markMessageRead = (messageId) => api.put(`/messages/${messageId}/read`);
 
 // Task Messages
-export const getTaskMessages = (taskId) => api.get(`/tasks/${taskId}/messages`);
+// Whole thread, or one page with { before } or { after } (message ids),
+// { around: 'first_unread' } and { limit }
+export const getTaskMessages = (taskId, params = {}) => api.get(`/tasks/${taskId}/messages`, { params });
 
 export const sendTaskMessage = (taskId, content) => api.post(`/tasks/${taskId}/messages`, { content });
 
@@ -81,4 +167,45 @@ export const createReview = (reviewData) => api.post('/reviews', reviewData);
 
 export const getUserReviews = (userId) => api.get(`/users/${userId}/reviews`);
 
+// Notifications
+export const getNotifications = (cursor) => {
+  const params = cursor ? { cursor } : {};
+  return api.get('/notifications', { params });
+};
+
+export const markNotificationRead = (notificationId) => api.put(`/notifications/${notificationId}/read`);
+
+export const markNotificationsReadUpTo = (notificationId) =>
+  api.put('/notifications/read', null, { params: { up_to: notificationId } });
+
+// Calls onNotification for each pushed notification until the returned
+// function is called. Uses fetch rather than EventSource so the bearer
+// token can be sent in a header.
+export const subscribeNotifications = (onNotification) => {
+  const controller = new AbortController();
+  const token = localStorage.getItem('token');
+
+  fetch(`${API_URL}/notifications/stream`, {
+    headers: { Authorization: `Bearer ${token}` },
+    signal: controller.signal,
+  }).then(async (response) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      events.forEach((event) => {
+        const data = event.split('\n').find((line) => line.startsWith('data: '));
+        if (data) onNotification(JSON.parse(data.slice(6)));
+      });
+    }
+  }).catch(() => {});
+
+  return () => controller.abort();
+};
+
 export default api;
\ No newline at end of file
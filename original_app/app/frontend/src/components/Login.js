@@ -14,6 +14,7 @@ function Login({ onLogin }) {
     try {
       const response = await login(email, password);
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refreshToken', response.data.refresh_token);
       onLogin(response.data.user);
       navigate('/');
     } catch (err) {
@@ -32,6 +32,7 @@ function Register({ onLogin }) {
       // Auto-login after registration
       const response = await login(formData.email, formData.password);
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refreshToken', response.data.refresh_token);
       onLogin(response.data.user);
       navigate('/');
     } catch (err) {
@@ -1,22 +1,21 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import {
-  getTask,
-  getTaskBids,
+  batch,
   createBid,
   acceptBid,
   createOffer,
   acceptOffer,
-  getMyOffers,
-  getAgreements,
   completeAgreement,
   createReview,
   getUserReviews,
-  getUser,
+  getUsers,
   getTaskMessages,
   sendTaskMessage
 } from '../api';
 
+const MESSAGE_PAGE_SIZE = 50;
+
 function TaskDetail({ user }) {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -26,6 +25,8 @@ function TaskDetail({ user }) {
   const [agreement, setAgreement] = useState(null);
   const [reviews, setReviews] = useState([]);
   const [messages, setMessages] = useState([]);
+  const [hasEarlierMessages, setHasEarlierMessages] = useState(false);
+  const [hasNewerMessages, setHasNewerMessages] = useState(false);
   const [newMessage, setNewMessage] = useState('');
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
@@ -37,6 +38,7 @@ function TaskDetail({ user }) {
   const [reviewRating, setReviewRating] = useState(5);
   const [reviewComment, setReviewComment] = useState('');
   const [customer, setCustomer] = useState(null);
+  const [bidders, setBidders] = useState({});
 
   useEffect(() => {
     loadTaskDetails();
@@ -44,11 +46,11 @@ function TaskDetail({ user }) {
 
   const loadTaskDetails = async () => {
     try {
-      const [taskRes, bidsRes, offersRes, agreementsRes] = await Promise.all([
-        getTask(id),
-        getTaskBids(id),
-        getMyOffers(),
-        getAgreements()
+      const [taskRes, bidsRes, offersRes, agreementsRes] = await batch([
+        { method: 'GET', path: `/tasks/${id}` },
+        { method: 'GET', path: `/tasks/${id}/bids` },
+        { method: 'GET', path: '/offers/my-offers' },
+        { method: 'GET', path: '/agreements' }
       ]);
       
       setTask(taskRes.data);
@@ -62,9 +64,14 @@ function TaskDetail({ user }) {
       const taskAgreement = agreementsRes.data.find(a => a.task_id === parseInt(id));
       setAgreement(taskAgreement);
 
-      // Load customer info
-      const customerRes = await getUser(taskRes.data.customer_id);
-      setCustomer(customerRes.data);
+      // Load the customer and every bidder in one request
+      const usersRes = await getUsers([
+        taskRes.data.customer_id,
+        ...bidsRes.data.map(b => b.tasker_id)
+      ]);
+      const usersById = Object.fromEntries(usersRes.data.map(u => [u.id, u]));
+      setCustomer(usersById[taskRes.data.customer_id]);
+      setBidders(usersById);
 
       // Load reviews if task is completed
       if (taskRes.data.status === 'completed') {
@@ -75,8 +82,20 @@ function TaskDetail({ user }) {
       // Load messages if agreement exists
       if (taskAgreement) {
         try {
-          const messagesRes = await getTaskMessages(id);
-          setMessages(messagesRes.data);
+          // Open the thread at the first message this user hasn't read
+          const messagesRes = await getTaskMessages(id, { around: 'first_unread', limit: MESSAGE_PAGE_SIZE });
+          const page = messagesRes.data;
+          const firstUnread = page.findIndex(msg => msg.receiver_id === user.id && !msg.read);
+          setMessages(page);
+          if (firstUnread === -1) {
+            // Everything read: the latest page
+            setHasEarlierMessages(page.length === MESSAGE_PAGE_SIZE);
+            setHasNewerMessages(false);
+          } else {
+            // Up to half the page is context before the first unread message
+            setHasEarlierMessages(firstUnread === Math.floor(MESSAGE_PAGE_SIZE / 2));
+            setHasNewerMessages(page.length === MESSAGE_PAGE_SIZE);
+          }
         } catch (err) {
           console.error('Failed to load messages:', err);
         }
@@ -193,15 +212,57 @@ function TaskDetail({ user }) {
       await sendTaskMessage(id, newMessage);
       setNewMessage('');
       setSuccess('Message sent!');
-      // Reload messages
-      const messagesRes = await getTaskMessages(id);
-      setMessages(messagesRes.data);
+      // Fetch only what is newer than the last message shown, up to and
+      // including ours at the end of the thread
+      const last = messages[messages.length - 1];
+      if (last) {
+        setMessages([...messages, ...(await fetchNewerMessages(last.id))]);
+      } else {
+        const messagesRes = await getTaskMessages(id, { limit: MESSAGE_PAGE_SIZE });
+        setMessages(messagesRes.data);
+        setHasEarlierMessages(messagesRes.data.length === MESSAGE_PAGE_SIZE);
+      }
+      setHasNewerMessages(false);
       setTimeout(() => setSuccess(''), 3000);
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to send message');
     }
   };
 
+  // Every message after afterId, a page at a time
+  const fetchNewerMessages = async (afterId) => {
+    const newer = [];
+    let page;
+    do {
+      const cursor = newer.length ? newer[newer.length - 1].id : afterId;
+      page = (await getTaskMessages(id, { after: cursor, limit: MESSAGE_PAGE_SIZE })).data;
+      newer.push(...page);
+    } while (page.length === MESSAGE_PAGE_SIZE);
+    return newer;
+  };
+
+  const loadNewerMessages = async () => {
+    try {
+      const messagesRes = await getTaskMessages(
+        id, { after: messages[messages.length - 1].id, limit: MESSAGE_PAGE_SIZE }
+      );
+      setMessages([...messages, ...messagesRes.data]);
+      setHasNewerMessages(messagesRes.data.length === MESSAGE_PAGE_SIZE);
+    } catch (err) {
+      setError('Failed to load messages');
+    }
+  };
+
+  const loadEarlierMessages = async () => {
+    try {
+      const messagesRes = await getTaskMessages(id, { before: messages[0].id, limit: MESSAGE_PAGE_SIZE });
+      setMessages([...messagesRes.data, ...messages]);
+      setHasEarlierMessages(messagesRes.data.length === MESSAGE_PAGE_SIZE);
+    } catch (err) {
+      setError('Failed to load messages');
+    }
+  };
+
   const handleMessageTasker = (taskerId, taskerName, taskId) => {
     // Navigate to messaging with pre-selected conversation
     navigate('/messages', {
@@ -219,6 +280,7 @@ function TaskDetail({ user }) {
 
   const isCustomer = user.role === 'customer';
   const isTaskOwner = task.customer_id === user.id;
+  const bidderName = (taskerId) => bidders[taskerId]?.full_name || `Tasker ${taskerId}`;
   const canBid = !isCustomer && task.status === 'open';
   const myOffer = offers.find(o => o.tasker_id === user.id);
 
@@ -283,7 +345,7 @@ function TaskDetail({ user }) {
               <div key={bid.id} className="bid-item">
                 <p><strong>Amount:</strong> ${bid.amount}</p>
                 <p><strong>Message:</strong> {bid.message}</p>
-                <p><strong>Tasker ID:</strong> {bid.tasker_id}</p>
+                <p><strong>Tasker:</strong> {bidderName(bid.tasker_id)}</p>
                 <div style={{ display: 'flex', gap: '10px', marginTop: '10px' }}>
                   {!agreement && task.status === 'open' && (
                     <button
@@ -297,10 +359,10 @@ function TaskDetail({ user }) {
                     className="btn-primary message-tasker-btn"
                     onClick={() => handleMessageTasker(
                       bid.tasker_id,
-                      `Tasker ${bid.tasker_id}`,
+                      bidderName(bid.tasker_id),
                       task.id
                     )}
-                    aria-label={`Message Tasker ${bid.tasker_id}`}
+                    aria-label={`Message ${bidderName(bid.tasker_id)}`}
                   >
                     Message Tasker
                   </button>
@@ -326,7 +388,7 @@ function TaskDetail({ user }) {
                 <option value="">Choose a tasker...</option>
                 {bids.map((bid) => (
                   <option key={bid.tasker_id} value={bid.tasker_id}>
-                    Tasker {bid.tasker_id} (Bid: ${bid.amount})
+                    {bidderName(bid.tasker_id)} (Bid: ${bid.amount})
                   </option>
                 ))}
               </select>
@@ -467,6 +529,11 @@ function TaskDetail({ user }) {
               backgroundColor: '#f9f9f9',
               borderRadius: '4px'
             }}>
+              {hasEarlierMessages && (
+                <button onClick={loadEarlierMessages} className="btn-secondary">
+                  Load earlier messages
+                </button>
+              )}
               {messages.map((msg) => (
                 <div
                   key={msg.id}
@@ -488,6 +555,11 @@ function TaskDetail({ user }) {
                   <div>{msg.content}</div>
                 </div>
               ))}
+              {hasNewerMessages && (
+                <button onClick={loadNewerMessages} className="btn-secondary">
+                  Load newer messages
+                </button>
+              )}
             </div>
           )}
 
@@ -5,6 +5,8 @@ import { getTasks } from '../api';
 function TaskList({ user }) {
   const [tasks, setTasks] = useState([]);
   const [filter, setFilter] = useState('open');
+  const [location, setLocation] = useState('');
+  const [sort, setSort] = useState('-created_at');
   const [error, setError] = useState('');
   const navigate = useNavigate();
 
@@ -23,11 +25,11 @@ function TaskList({ user }) {
 
   useEffect(() => {
     loadTasks();
-  }, [filter]);
+  }, [filter, location, sort]);
 
   const loadTasks = async () => {
     try {
-      const response = await getTasks(filter);
+      const response = await getTasks(filter, { location: location.trim(), sort });
       setTasks(response.data);
     } catch (err) {
       setError('Failed to load tasks');
@@ -47,6 +49,19 @@ function TaskList({ user }) {
           <option value="in_progress">In Progress</option>
           <option value="completed">Completed</option>
         </select>
+        <label style={{ marginLeft: '20px' }}>Location: </label>
+        <input
+          type="text"
+          value={location}
+          onChange={(e) => setLocation(e.target.value)}
+          placeholder="e.g. Austin"
+        />
+        <label style={{ marginLeft: '20px' }}>Sort by: </label>
+        <select value={sort} onChange={(e) => setSort(e.target.value)}>
+          <option value="-created_at">Newest</option>
+          <option value="date">Soonest</option>
+          <option value="-budget">Highest budget</option>
+        </select>
       </div>
 
       <div className="grid">
@@ -1,10 +1,11 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getTasks, getMyTasks, createBid } from '../api';
+import { batch, getFeed, createBid, subscribeNotifications } from '../api';
 
 function TaskerDashboard({ user }) {
   const [availableTasks, setAvailableTasks] = useState([]);
   const [myTasks, setMyTasks] = useState([]);
+  const [feedCursor, setFeedCursor] = useState(null);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
   const navigate = useNavigate();
@@ -26,19 +27,41 @@ function TaskerDashboard({ user }) {
     loadTasks();
   }, []);
 
+  // New tasks matching this tasker's skills are pushed as they are posted
+  useEffect(() => {
+    const unsubscribe = subscribeNotifications((notification) => {
+      if (notification.kind === 'task_match') {
+        setSuccess('A new task matching your skills was just posted');
+        loadTasks();
+      }
+    });
+    return unsubscribe;
+  }, []);
+
   const loadTasks = async () => {
     try {
-      const [available, mine] = await Promise.all([
-        getTasks('open'),
-        getMyTasks()
+      const [available, mine] = await batch([
+        { method: 'GET', path: '/feed' },
+        { method: 'GET', path: '/tasks/user/my-tasks' }
       ]);
       setAvailableTasks(available.data);
+      setFeedCursor(available.headers['x-next-cursor'] || null);
       setMyTasks(mine.data);
     } catch (err) {
       setError('Failed to load tasks');
     }
   };
 
+  const loadMoreTasks = async () => {
+    try {
+      const more = await getFeed(feedCursor);
+      setAvailableTasks([...availableTasks, ...more.data]);
+      setFeedCursor(more.headers['x-next-cursor'] || null);
+    } catch (err) {
+      setError('Failed to load tasks');
+    }
+  };
+
   return (
     <div className="container">
       <h2>Tasker Dashboard</h2>
@@ -69,6 +92,7 @@ function TaskerDashboard({ user }) {
             <p className="location">📍 {task.location}</p>
             <p className="date">📅 {new Date(task.date).toLocaleString()}</p>
             <p><strong>Status:</strong> {task.status}</p>
+            <p><strong>Your involvement:</strong> {task.involvement.join(', ')}</p>
             <p>{task.description.substring(0, 100)}...</p>
             <button
               onClick={() => navigate(`/tasks/${task.id}`)}
@@ -105,6 +129,11 @@ function TaskerDashboard({ user }) {
           </div>
         ))}
       </div>
+      {feedCursor && (
+        <button onClick={loadMoreTasks} className="btn-primary" style={{ marginTop: '20px' }}>
+          Load More
+        </button>
+      )}
       {availableTasks.length === 0 && <p>No available tasks at the moment.</p>}
     </div>
   );